@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+servers_config inventory plugin - 直接从 servers-config.yml 构建 Ansible Inventory
+
+复用 tools/generate_inventory.py 的生成逻辑，省去
+"生成 hosts.yml -> ansible 再次解析 YAML" 的往返；
+解析结果按 servers-config.yml 的 mtime + sha256 缓存。
+
+Reuses the generators in tools/generate_inventory.py so ansible reads
+servers-config.yml directly instead of a generated hosts.yml; the parsed
+config is cached on the file's mtime + sha256.
+"""
+
+import os
+import sys
+
+import yaml
+from ansible.errors import AnsibleParserError
+from ansible.plugins.inventory import BaseInventoryPlugin
+
+try:
+    from ansible.template import trust_as_template
+except ImportError:  # ansible-core < 2.19 没有数据标记，字符串默认可模板化
+    def trust_as_template(value):
+        return value
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'tools'))
+
+from generate_inventory import (  # noqa: E402
+    load_config_cached,
+    load_inventory,
+    generate_local_inventory,
+    generate_github_actions_inventory,
+)
+
+
+DOCUMENTATION = r'''
+    name: servers_config
+    short_description: AnixOps inventory built directly from servers-config.yml
+    description:
+        - Builds the same groups, hosts and vars as C(tools/generate_inventory.py)
+          without writing and re-parsing an intermediate hosts.yml.
+        - The parsed servers-config.yml is cached under C(.cache/inventory),
+          keyed on the file mtime and sha256.
+        - Inventory source files must end in C(servers_config.yml) or C(servers_config.yaml).
+    options:
+        plugin:
+            description: Token that ensures this is a source file for the plugin.
+            required: true
+            choices: ['servers_config']
+        config_file:
+            description: Path to servers-config.yml, relative to the inventory source file.
+            type: str
+            default: servers-config.yml
+        flavour:
+            description: Which generator to use, same as the generate_inventory.py mode.
+            type: str
+            default: local
+            choices: ['local', 'github-actions']
+        cache_dir:
+            description: Directory for the parsed-config cache. Defaults to C(.cache/inventory) in the project root.
+            type: str
+        snapshot:
+            description:
+                - Path to a pickle or JSON snapshot written by C(generate_inventory.py --format pickle|json),
+                  relative to the inventory source file.
+                - When set, the snapshot is loaded as-is and I(config_file)/I(flavour) are ignored.
+            type: str
+'''
+
+EXAMPLES = r'''
+# inventories/production/anixops.servers_config.yml
+plugin: servers_config
+config_file: servers-config.yml
+flavour: local
+
+# Consume a prebuilt snapshot (python3 tools/generate_inventory.py local --format pickle > hosts.pickle)
+plugin: servers_config
+snapshot: hosts.pickle
+'''
+
+
+class InventoryModule(BaseInventoryPlugin):
+    """servers-config.yml 动态 inventory"""
+
+    NAME = 'servers_config'
+
+    def verify_file(self, path):
+        if super(InventoryModule, self).verify_file(path):
+            return path.endswith(('servers_config.yml', 'servers_config.yaml'))
+        return False
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+        self._populate(self._load_data(path))
+
+    def _load_data(self, path):
+        """读取快照，或从 servers-config.yml 生成 inventory 字典"""
+        base_dir = os.path.dirname(os.path.abspath(path))
+
+        snapshot = self.get_option('snapshot')
+        if snapshot:
+            snapshot = os.path.join(base_dir, snapshot)
+            try:
+                return load_inventory(snapshot)
+            except (OSError, ValueError, yaml.YAMLError) as e:
+                raise AnsibleParserError(f"Unable to load snapshot {snapshot}: {e}")
+
+        config_file = os.path.join(base_dir, self.get_option('config_file'))
+        try:
+            config = load_config_cached(config_file, cache_dir=self.get_option('cache_dir'))
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            raise AnsibleParserError(f"Unable to load {config_file}: {e}")
+
+        if self.get_option('flavour') == 'github-actions':
+            return generate_github_actions_inventory(config, use_secrets=True)
+        return generate_local_inventory(config)
+
+    def _populate(self, data):
+        """将生成的 inventory 字典写入 Ansible inventory"""
+        root = data['all']
+
+        for key, value in (root.get('vars') or {}).items():
+            self.inventory.set_variable('all', key, self._trust(value))
+
+        for host_name, host_vars in (root.get('hosts') or {}).items():
+            self._add_host(host_name, host_vars, 'all')
+
+        for group_name, group in (root.get('children') or {}).items():
+            self.inventory.add_group(group_name)
+            for host_name, host_vars in (group.get('hosts') or {}).items():
+                self._add_host(host_name, host_vars, group_name)
+            for key, value in (group.get('vars') or {}).items():
+                self.inventory.set_variable(group_name, key, self._trust(value))
+
+    def _add_host(self, host_name, host_vars, group_name):
+        self.inventory.add_host(host_name, group=group_name)
+        for key, value in (host_vars or {}).items():
+            self.inventory.set_variable(host_name, key, self._trust(value))
+
+    def _trust(self, value):
+        """生成的 lookup('env', ...) 模板来自仓库自身配置，标记为可信模板"""
+        if isinstance(value, str):
+            return trust_as_template(value)
+        if isinstance(value, dict):
+            return {k: self._trust(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._trust(v) for v in value]
+        return value
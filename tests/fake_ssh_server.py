@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Fake SSH server for tests | 测试用的本地 SSH 服务端
+
+A paramiko server on 127.0.0.1 that accepts password auth (and public-key auth
+against ``<home>/.ssh/authorized_keys``) and runs exec requests with ``sh -c``
+under a temporary HOME, so ssh_key_deployer's remote commands are exercised
+for real without touching the machine's own ~/.ssh.
+"""
+
+import os
+import socket
+import subprocess
+import threading
+
+import paramiko
+
+
+class _Server(paramiko.ServerInterface):
+    def __init__(self, fake):
+        self.fake = fake
+
+    def get_allowed_auths(self, username):
+        return 'password,publickey'
+
+    def check_auth_password(self, username, password):
+        if password == self.fake.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_auth_publickey(self, username, key):
+        if self.fake.accepts_key(key):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED_OPEN_REQUEST
+
+    def check_channel_exec_request(self, channel, command):
+        command = command.decode() if isinstance(command, bytes) else command
+        with self.fake.lock:
+            self.fake.commands.append(command)
+        threading.Thread(target=self.fake._run, args=(channel, command), daemon=True).start()
+        return True
+
+
+class FakeSSHServer:
+    """Context manager; ``.port`` is the listening port, ``.connections`` counts handshakes."""
+
+    def __init__(self, home, password='secret'):
+        self.home = os.path.abspath(home)
+        self.password = password
+        self.host_key = paramiko.RSAKey.generate(1024)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.commands = []
+        self.transports = []
+        self._sock = None
+
+    @property
+    def port(self):
+        return self._sock.getsockname()[1]
+
+    def accepts_key(self, key):
+        try:
+            with open(os.path.join(self.home, '.ssh', 'authorized_keys')) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return False
+        wanted = f"{key.get_name()} {key.get_base64()}"
+        return any(line.startswith(wanted) for line in lines)
+
+    def __enter__(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(100)
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._sock.close()
+        for transport in list(self.transports):
+            transport.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            with self.lock:
+                self.connections += 1
+                self.transports.append(transport)
+            try:
+                transport.start_server(server=_Server(self))
+            except (paramiko.SSHException, EOFError, OSError):
+                continue
+
+    def _run(self, channel, command):
+        env = {'HOME': self.home, 'PATH': os.environ.get('PATH', '/usr/bin:/bin')}
+        proc = subprocess.Popen(['sh', '-c', command], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, env=env, cwd=self.home)
+
+        def pump_stdin():
+            channel.settimeout(0.1)
+            while proc.poll() is None:
+                try:
+                    data = channel.recv(4096)
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break
+                if not data:
+                    break
+                try:
+                    proc.stdin.write(data)
+                    proc.stdin.flush()
+                except OSError:
+                    break
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+        pump = threading.Thread(target=pump_stdin, daemon=True)
+        pump.start()
+        stdout, stderr = proc.stdout.read(), proc.stderr.read()
+        proc.wait()
+        pump.join(1)
+        try:
+            channel.sendall(stdout)
+            channel.sendall_stderr(stderr)
+            channel.send_exit_status(proc.returncode)
+            channel.close()
+        except OSError:
+            pass
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Tests for benchmark_cloudflare.py | benchmark_cloudflare.py 单元测试
+
+Run:
+    python -m pytest tests/test_benchmark_cloudflare.py -v
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('requests')
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'tools'))
+
+from benchmark_cloudflare import make_desired, run_scenario
+
+
+def test_make_desired_changes_and_adds_records():
+    desired = make_desired('example.com', 10, changes=0.3, new_records=2)
+
+    assert len(desired) == 12
+    assert sum(1 for r in desired if r['content'].startswith('172.16.')) == 3
+    assert desired[-1]['name'] == 'new-00001.example.com'
+
+
+@pytest.mark.parametrize('scenario, expected_requests', [('upsert', 24), ('reconcile', 6)])
+def test_run_scenario_counts_requests(scenario, expected_requests):
+    row = run_scenario(scenario, 10, changes=0.3, new_records=2, workers=4,
+                       latency=0.0, server_rate=None, burst=10, client_rate=None)
+
+    assert row['records'] == 12
+    assert row['failed'] == 0
+    assert row['requests'] == expected_requests
+    assert row['rate_limited'] == 0
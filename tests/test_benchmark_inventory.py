@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Tests for benchmark_inventory.py | benchmark_inventory.py 单元测试
+
+Run:
+    python -m pytest tests/test_benchmark_inventory.py -v
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'tools'))
+
+from benchmark_inventory import (
+    PHASES,
+    bench_phases,
+    compare_to_baseline,
+    make_synthetic_config,
+)
+from generate_inventory import generate_local_inventory
+
+
+def test_synthetic_config_spreads_hosts_over_groups():
+    config = make_synthetic_config(40, num_groups=8, groups_per_host=2, github_actions_hosts=3)
+    inventory = generate_local_inventory(config)
+
+    assert len(config['production_servers']) == 40
+    assert len(config['github_actions_servers']) == 3
+    sizes = {len(group['hosts']) for group in inventory['all']['children'].values()}
+    assert sizes == {10}
+
+
+def test_bench_phases_reports_every_phase():
+    rows = bench_phases([5], num_groups=4, groups_per_host=2)
+
+    assert [row['phase'] for row in rows] == list(PHASES)
+    assert all(row['seconds'] >= 0 for row in rows)
+    assert all(row['peak_bytes'] > 0 for row in rows)
+
+
+def test_compare_to_baseline_flags_slow_phase():
+    baseline = [{'hosts': 1000, 'phase': 'load_config', 'seconds': 1.0, 'peak_bytes': 100}]
+    rows = [{'hosts': 1000, 'phase': 'load_config', 'seconds': 2.0, 'peak_bytes': 100}]
+
+    assert len(compare_to_baseline(rows, baseline, tolerance=1.5)) == 1
+    assert compare_to_baseline(rows, baseline, tolerance=2.5) == []
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main([__file__, '-v'])
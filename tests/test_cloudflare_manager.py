@@ -0,0 +1,641 @@
+#!/usr/bin/env python3
+"""
+Tests for cloudflare_manager.py | cloudflare_manager.py 单元测试
+
+Coverage:
+  - Requests go through one pooled session
+  - 429 responses are retried honouring Retry-After
+  - 5xx responses are only retried for idempotent methods
+  - Request counters and latency stats are recorded
+  - Bulk reconcile plans changes locally and writes only the diff
+  - Bulk writes run concurrently under a token-bucket limiter, results stay in plan order
+  - Zone lookups use a paginated, cached suffix index
+  - Record/zone iterators page lazily and prefetch the next page
+  - Declarative DNS state plans offline against a cached zone snapshot
+  - Failover controller switches records with hysteresis and minimal writes
+
+Run:
+    python -m pytest tests/test_cloudflare_manager.py -v
+"""
+
+import argparse
+import json
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+requests = pytest.importorskip('requests')
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'tools'))
+
+import cloudflare_manager
+from cloudflare_manager import (
+    CloudflareManager,
+    FailoverController,
+    TokenBucket,
+    ZoneIndex,
+    build_dns_state,
+    delete_steps,
+    health_by_ip,
+    load_zone_snapshot,
+    plan_dns_changes,
+    run_state_plan,
+    save_zone_snapshot,
+    service_candidates,
+)
+
+
+def make_response(status=200, body=None, headers=None):
+    """Build a real requests.Response with the given status/body/headers."""
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body if body is not None else {'success': True, 'result': []}).encode()
+    response.headers.update(headers or {})
+    response.url = 'https://api.cloudflare.com/client/v4/test'
+    response.reason = 'TEST'
+    return response
+
+
+class ScriptedSession:
+    """Replays a fixed list of responses and records the calls."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, method, url, json=None, timeout=None):
+        self.calls.append((method, url, json))
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(cloudflare_manager.time, 'sleep', recorded.append)
+    return recorded
+
+
+def make_manager(responses, **kwargs):
+    kwargs.setdefault('rate_limit', None)
+    manager = CloudflareManager(api_token='test-token', **kwargs)
+    manager.session = ScriptedSession(responses)
+    return manager
+
+
+def test_manager_uses_persistent_session():
+    manager = CloudflareManager(api_token='test-token')
+
+    assert isinstance(manager.session, requests.Session)
+    assert manager.session.headers['Authorization'] == 'Bearer test-token'
+    assert 'gzip' in manager.session.headers['Accept-Encoding']
+
+
+def test_rate_limited_request_retries_after_header(sleeps):
+    manager = make_manager([
+        make_response(429, {'success': False, 'errors': []}, {'Retry-After': '3'}),
+        make_response(200, {'success': True, 'result': {'id': 'rec'}}),
+    ])
+
+    result = manager._request('POST', '/zones/z/dns_records', {'name': 'a'})
+
+    assert result['result'] == {'id': 'rec'}
+    assert sleeps == [3.0]
+    assert len(manager.session.calls) == 2
+    stats = manager.get_request_stats()
+    assert stats['requests'] == 2
+    assert stats['rate_limited'] == 1
+    assert stats['by_method'] == {'POST': 2}
+
+
+def test_server_error_not_retried_for_post(sleeps):
+    manager = make_manager([make_response(502, {'success': False, 'errors': []})])
+
+    with pytest.raises(Exception, match='请求失败'):
+        manager._request('POST', '/zones/z/dns_records', {'name': 'a'})
+
+    assert sleeps == []
+
+
+def test_server_error_retried_with_backoff_for_get(sleeps):
+    manager = make_manager([
+        make_response(503, {'success': False, 'errors': []}),
+        make_response(503, {'success': False, 'errors': []}),
+        make_response(200),
+    ], backoff_factor=0.5)
+
+    manager._request('GET', '/zones')
+
+    assert sleeps == [0.5, 1.0]
+    assert manager.get_request_stats()['retries'] == 2
+
+
+def test_api_error_envelope_raises(sleeps):
+    manager = make_manager([make_response(200, {'success': False, 'errors': [{'message': 'bad record'}]})])
+
+    with pytest.raises(Exception, match='bad record'):
+        manager._request('GET', '/zones')
+
+
+def record(record_id, name, content, record_type='A', proxied=True, ttl=1):
+    return {'id': record_id, 'type': record_type, 'name': name,
+            'content': content, 'proxied': proxied, 'ttl': ttl}
+
+
+def test_plan_dns_changes_classifies_records():
+    existing = [
+        record('r1', 'same.example.com', '1.1.1.1'),
+        record('r2', 'moved.example.com', '1.1.1.1'),
+        record('r3', 'proxy.example.com', '1.1.1.1', proxied=False, ttl=300),
+        record('r4', 'extra.example.com', '1.1.1.1'),
+        record('r5', 'example.com', 'mail.example.com', record_type='MX'),
+    ]
+    desired = [
+        {'type': 'A', 'name': 'Same.Example.com', 'content': '1.1.1.1', 'proxied': True},
+        {'type': 'A', 'name': 'moved.example.com', 'content': '2.2.2.2', 'proxied': True},
+        {'type': 'A', 'name': 'proxy.example.com', 'content': '1.1.1.1', 'proxied': True},
+        {'type': 'A', 'name': 'new.example.com', 'content': '3.3.3.3', 'proxied': False, 'ttl': 300},
+    ]
+
+    plan = plan_dns_changes(desired, existing)
+    actions = {step['name']: (step['action'], step['record_id']) for step in plan}
+
+    assert actions == {
+        'same.example.com': ('noop', 'r1'),
+        'moved.example.com': ('update', 'r2'),
+        'proxy.example.com': ('update', 'r3'),
+        'new.example.com': ('create', None),
+    }
+
+    pruned = {step['name']: step['action'] for step in plan_dns_changes(desired, existing, prune=True)}
+    assert pruned['extra.example.com'] == 'delete'
+    assert 'example.com' not in pruned  # MX is not a managed type
+
+
+def test_plan_dns_changes_keeps_round_robin_records():
+    existing = [record('r1', 'rr.example.com', '1.1.1.1'), record('r2', 'rr.example.com', '2.2.2.2')]
+    desired = [
+        {'type': 'A', 'name': 'rr.example.com', 'content': '2.2.2.2', 'proxied': True},
+        {'type': 'A', 'name': 'rr.example.com', 'content': '1.1.1.1', 'proxied': True},
+    ]
+
+    assert [step['action'] for step in plan_dns_changes(desired, existing, prune=True)] == ['noop', 'noop']
+
+
+def test_reconcile_lists_once_and_writes_only_changes(sleeps):
+    manager = make_manager([
+        make_response(200, {'success': True, 'result': [record('r1', 'a.example.com', '1.1.1.1')],
+                            'result_info': {'page': 1, 'total_pages': 2}}),
+        make_response(200, {'success': True, 'result': [record('r2', 'b.example.com', '1.1.1.1')],
+                            'result_info': {'page': 2, 'total_pages': 2}}),
+        make_response(200, {'success': True, 'result': {'id': 'r2'}}),
+    ])
+    desired = [
+        {'type': 'A', 'name': 'a.example.com', 'content': '1.1.1.1', 'proxied': True},
+        {'type': 'A', 'name': 'b.example.com', 'content': '9.9.9.9', 'proxied': True},
+    ]
+
+    outcome = manager.reconcile_dns_records('z', desired)
+
+    methods = [call[0] for call in manager.session.calls]
+    assert methods == ['GET', 'GET', 'PUT']
+    assert manager.session.calls[2][1].endswith('/zones/z/dns_records/r2')
+    assert [r['ok'] for r in outcome['results']] == [True]
+
+
+def test_reconcile_dry_run_does_not_write(sleeps):
+    manager = make_manager([make_response(200, {'success': True, 'result': [],
+                                                'result_info': {'page': 1, 'total_pages': 1}})])
+
+    outcome = manager.reconcile_dns_records(
+        'z', [{'type': 'A', 'name': 'a.example.com', 'content': '1.1.1.1'}], dry_run=True)
+
+    assert [step['action'] for step in outcome['plan']] == ['create']
+    assert outcome['results'] == []
+    assert len(manager.session.calls) == 1
+
+
+class EchoSession:
+    """Thread-safe session that answers every write and tracks concurrency."""
+
+    def __init__(self, fail_names=()):
+        self.fail_names = set(fail_names)
+        self.lock = threading.Lock()
+        self.barrier = threading.Barrier(3, timeout=5)
+        self.calls = []
+
+    def request(self, method, url, json=None, timeout=None):
+        with self.lock:
+            self.calls.append((method, url, json))
+        if method != 'DELETE':
+            self.barrier.wait()  # the three creates/updates must be in flight together
+        if json and json['name'] in self.fail_names:
+            return make_response(200, {'success': False, 'errors': [{'message': 'rejected'}]})
+        return make_response(200, {'success': True, 'result': {'id': 'x'}})
+
+
+def test_token_bucket_paces_after_burst(monkeypatch, sleeps):
+    monkeypatch.setattr(cloudflare_manager.time, 'monotonic', lambda: 100.0)
+    bucket = TokenBucket(rate=2, burst=2)
+
+    waits = [bucket.acquire() for _ in range(4)]
+
+    assert waits == [0.0, 0.0, 0.5, 1.0]
+    assert sleeps == [0.5, 1.0]
+
+
+def test_apply_dns_plan_runs_writes_concurrently_in_plan_order():
+    manager = make_manager([], max_workers=4)
+    manager.session = EchoSession(fail_names={'b.example.com'})
+    plan = [
+        {'action': 'create', 'type': 'A', 'name': 'a.example.com', 'content': '1.1.1.1',
+         'proxied': True, 'ttl': 1, 'record_id': None, 'current': None},
+        {'action': 'noop', 'type': 'A', 'name': 'n.example.com', 'content': '1.1.1.1',
+         'proxied': True, 'ttl': 1, 'record_id': 'n', 'current': None},
+        {'action': 'update', 'type': 'A', 'name': 'b.example.com', 'content': '2.2.2.2',
+         'proxied': True, 'ttl': 1, 'record_id': 'rb', 'current': None},
+        {'action': 'create', 'type': 'A', 'name': 'c.example.com', 'content': '3.3.3.3',
+         'proxied': False, 'ttl': 300, 'record_id': None, 'current': None},
+    ] + delete_steps([record('rd', 'c.example.com', 'old.example.com', record_type='CNAME')])
+
+    results = manager.apply_dns_plan('z', plan)
+
+    assert [r['step']['name'] for r in results] == [
+        'a.example.com', 'b.example.com', 'c.example.com', 'c.example.com']
+    assert [r['ok'] for r in results] == [True, False, True, True]
+    assert 'rejected' in results[1]['error']
+    # the conflicting CNAME is removed before any create/update is sent
+    assert manager.session.calls[0][0] == 'DELETE'
+
+
+def zones_page(zones, page, total_pages):
+    return make_response(200, {'success': True, 'result': zones,
+                               'result_info': {'page': page, 'total_pages': total_pages}})
+
+
+def test_zone_index_longest_suffix_match():
+    index = ZoneIndex([
+        {'id': 'z1', 'name': 'example.com'},
+        {'id': 'z2', 'name': 'eu.example.com'},
+    ])
+
+    assert index.lookup('example.com')['id'] == 'z1'
+    assert index.lookup('Grafana.Example.com.')['id'] == 'z1'
+    assert index.lookup('a.eu.example.com')['id'] == 'z2'
+    assert index.lookup('badexample.com') is None
+    assert index.lookup('example.org') is None
+
+
+def test_get_zone_id_paginates_and_caches():
+    manager = make_manager([
+        zones_page([{'id': 'z1', 'name': 'one.com', 'status': 'active'}], 1, 2),
+        zones_page([{'id': 'z2', 'name': 'two.com', 'status': 'active'}], 2, 2),
+    ])
+
+    assert manager.get_zone_id('www.two.com') == 'z2'
+    assert manager.get_zone_id('one.com') == 'z1'
+    assert len(manager.session.calls) == 2
+    assert 'page=2' in manager.session.calls[1][1]
+
+
+def test_get_zone_id_refreshes_once_on_miss():
+    manager = make_manager([
+        zones_page([{'id': 'z1', 'name': 'one.com'}], 1, 1),
+        zones_page([{'id': 'z1', 'name': 'one.com'}, {'id': 'z3', 'name': 'new.com'}], 1, 1),
+        zones_page([{'id': 'z1', 'name': 'one.com'}], 1, 1),
+    ])
+
+    assert manager.get_zone_id('one.com') == 'z1'
+    assert manager.get_zone_id('new.com') == 'z3'
+    assert len(manager.session.calls) == 2
+
+
+def test_zone_cache_persists_to_disk_per_account(tmp_path):
+    cache_file = tmp_path / 'zones.json'
+    first = make_manager([zones_page([{'id': 'z1', 'name': 'one.com', 'status': 'active'}], 1, 1)],
+                         zone_cache_path=str(cache_file))
+    assert first.get_zone_id('one.com') == 'z1'
+
+    warm = make_manager([], zone_cache_path=str(cache_file))
+    assert warm.get_zone_id('www.one.com') == 'z1'
+    assert warm.session.calls == []
+
+    other = CloudflareManager(api_token='other-token', rate_limit=None, zone_cache_path=str(cache_file))
+    other.session = ScriptedSession([zones_page([], 1, 1)])
+    assert other.get_zone_id('one.com') is None
+    assert len(other.session.calls) == 1
+
+    expired = make_manager([zones_page([], 1, 1)], zone_cache_path=str(cache_file), zone_cache_ttl=0)
+    assert expired.get_zone_id('one.com') is None
+
+
+def test_resolve_zone_accepts_id_or_domain():
+    manager = make_manager([zones_page([{'id': 'z1', 'name': 'one.com'}], 1, 1)] * 2)
+    zone_id = '0123456789abcdef0123456789abcdef'
+
+    assert manager.resolve_zone(zone_id) == zone_id
+    assert manager.resolve_zone('api.one.com') == 'z1'
+    with pytest.raises(Exception, match='未找到'):
+        manager.resolve_zone('missing.org')
+
+
+class PagedSession:
+    """Serves numbered record pages and signals when a page is requested."""
+
+    def __init__(self, total_pages, per_page=2):
+        self.total_pages = total_pages
+        self.per_page = per_page
+        self.requested = {page: threading.Event() for page in range(1, total_pages + 1)}
+        self.calls = []
+
+    def request(self, method, url, json=None, timeout=None):
+        self.calls.append(url)
+        page = int(url.rsplit('page=', 1)[1].split('&')[0])
+        self.requested[page].set()
+        records = [record(f'r{page}-{i}', f'h{page}-{i}.example.com', '1.1.1.1')
+                   for i in range(self.per_page)]
+        return zones_page(records, page, self.total_pages)
+
+
+def test_iter_dns_records_is_lazy_without_prefetch():
+    manager = make_manager([])
+    manager.session = PagedSession(total_pages=3)
+
+    records = manager.iter_dns_records('z', name='a b.example.com', record_type='A', per_page=2,
+                                       prefetch=False)
+    first = next(records)
+
+    assert first['id'] == 'r1-0'
+    assert len(manager.session.calls) == 1
+    assert 'name=a+b.example.com' in manager.session.calls[0]
+    assert 'type=A' in manager.session.calls[0]
+    assert [r['id'] for r in records] == ['r1-1', 'r2-0', 'r2-1', 'r3-0', 'r3-1']
+    assert len(manager.session.calls) == 3
+
+
+def test_iter_dns_records_prefetches_next_page():
+    manager = make_manager([])
+    manager.session = PagedSession(total_pages=2)
+
+    records = manager.iter_dns_records('z', per_page=2)
+    next(records)
+
+    # page 2 is fetched in the background while page 1 is still being consumed
+    assert manager.session.requested[2].wait(timeout=5)
+    assert [r['id'] for r in records] == ['r1-1', 'r2-0', 'r2-1']
+
+
+def test_list_dns_records_returns_every_page():
+    manager = make_manager([])
+    manager.session = PagedSession(total_pages=3)
+
+    assert len(manager.list_dns_records('z')) == 6
+
+
+STATE_CONFIG = {
+    'production_servers': {
+        'web-1': {'env_var': 'WEB_1_V4_SSH', 'alias': 'Web-1', 'roles': ['web'],
+                  'server_environment': 'production'},
+        'obs-1': {'env_var': 'OBS_1_V4_SSH', 'alias': 'Obs-1', 'roles': ['prometheus', 'grafana'],
+                  'server_environment': 'production'},
+        'obs-2': {'env_var': 'OBS_2_V4_SSH', 'alias': 'Obs-2', 'roles': ['grafana'],
+                  'server_environment': 'production'},
+        'dev-1': {'env_var': 'DEV_1_V4_SSH', 'roles': ['development'],
+                  'server_environment': 'development'},
+    },
+}
+STATE_ENV = {
+    'WEB_1_V4_SSH': '10.0.0.1',
+    'OBS_1_V4_SSH': '10.0.0.2/24',
+    'OBS_2_V4_SSH': '10.0.0.3',
+    'GRAFANA_DOMAIN': 'Grafana.Example.com',
+    'PROMETHEUS_DOMAIN': 'prometheus.example.com',
+}
+
+
+def test_build_dns_state_uses_roles_and_is_sorted():
+    state = build_dns_state(STATE_CONFIG, 'example.com', environ=STATE_ENV)
+    records = {r['name']: (r['content'], r['proxied']) for r in state['records']}
+
+    assert records == {
+        'grafana.example.com': ('10.0.0.2', True),
+        'prometheus.example.com': ('10.0.0.2', True),
+        'web-1.example.com': ('10.0.0.1', False),
+        'obs-1.example.com': ('10.0.0.2', False),
+        'obs-2.example.com': ('10.0.0.3', False),
+    }
+    assert [r['name'] for r in state['records']] == sorted(records)
+    assert state['missing'] == ['dev-1']
+    assert build_dns_state(STATE_CONFIG, 'example.com', environ=STATE_ENV) == state
+
+    production = build_dns_state(STATE_CONFIG, 'example.com', environ=STATE_ENV,
+                                 server_environments=['production'])
+    assert production['missing'] == []
+
+
+def state_args(tmp_path, command, **overrides):
+    state = build_dns_state(STATE_CONFIG, 'example.com', environ=STATE_ENV)
+    state_file = tmp_path / 'dns-state.json'
+    state_file.write_text(json.dumps(state))
+    values = dict(command=command, file=str(state_file), zone_id=None,
+                  snapshot=str(tmp_path / 'zone.json'), refresh=False, prune=False,
+                  detailed_exitcode=True, stats=False)
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
+
+def test_plan_runs_offline_against_snapshot(tmp_path, monkeypatch):
+    def no_api(args):
+        raise AssertionError('plan must not call the API when a snapshot exists')
+
+    monkeypatch.setattr(cloudflare_manager, 'manager_from_args', no_api)
+    state = build_dns_state(STATE_CONFIG, 'example.com', environ=STATE_ENV)
+    current = [dict(r, id=f'id-{i}') for i, r in enumerate(state['records'])]
+    save_zone_snapshot(str(tmp_path / 'zone.json'), 'z', current)
+
+    assert run_state_plan(state_args(tmp_path, 'plan')) == 0
+
+    current[0]['content'] = '10.9.9.9'
+    save_zone_snapshot(str(tmp_path / 'zone.json'), 'z', current)
+    assert run_state_plan(state_args(tmp_path, 'plan')) == 2
+    assert run_state_plan(state_args(tmp_path, 'plan', detailed_exitcode=False)) == 0
+
+
+def test_apply_fetches_once_and_updates_snapshot(tmp_path, monkeypatch, sleeps):
+    manager = make_manager([
+        make_response(200, {'success': True, 'result': [
+            record('r1', 'web-1.example.com', '10.0.0.9', proxied=False)],
+            'result_info': {'page': 1, 'total_pages': 1}}),
+    ] + [make_response(200, {'success': True, 'result': {'id': 'new'}})] * 5)
+    monkeypatch.setattr(cloudflare_manager, 'manager_from_args', lambda args: manager)
+
+    assert run_state_plan(state_args(tmp_path, 'apply', zone_id='0123456789abcdef0123456789abcdef')) == 0
+
+    methods = sorted(call[0] for call in manager.session.calls)
+    assert methods == ['GET', 'POST', 'POST', 'POST', 'POST', 'PUT']
+    snapshot = load_zone_snapshot(str(tmp_path / 'zone.json'))
+    assert snapshot['zone_id'] == '0123456789abcdef0123456789abcdef'
+    assert len(snapshot['records']) == 5
+    assert {r['name'] for r in snapshot['records']} == {
+        r['name'] for r in build_dns_state(STATE_CONFIG, 'example.com', environ=STATE_ENV)['records']}
+
+
+
+def test_apply_refetches_instead_of_trusting_a_stale_snapshot(tmp_path, monkeypatch, sleeps):
+    state = build_dns_state(STATE_CONFIG, 'example.com', environ=STATE_ENV)
+    # The snapshot still holds web-1 under an id that was deleted in the dashboard since
+    stale = [dict(r, id=f'old-{i}') for i, r in enumerate(state['records'])]
+    stale[0]['content'] = '10.9.9.9'
+    save_zone_snapshot(str(tmp_path / 'zone.json'), '0123456789abcdef0123456789abcdef', stale)
+    live = [dict(r, id=f'live-{i}') for i, r in enumerate(state['records'])]
+    live[0]['content'] = '10.9.9.9'
+    manager = make_manager([
+        make_response(200, {'success': True, 'result': live, 'result_info': {'page': 1, 'total_pages': 1}}),
+        make_response(200, {'success': True, 'result': {'id': 'live-0'}}),
+    ])
+    monkeypatch.setattr(cloudflare_manager, 'manager_from_args', lambda args: manager)
+
+    assert run_state_plan(state_args(tmp_path, 'apply')) == 0
+
+    calls = [(call[0], call[1]) for call in manager.session.calls]
+    assert calls[0][0] == 'GET' and '/zones/0123456789abcdef0123456789abcdef/dns_records' in calls[0][1]
+    assert calls[1][0] == 'PUT' and calls[1][1].endswith('/dns_records/live-0')
+    assert len(calls) == 2
+
+def test_health_by_ip_strips_ports_and_combines_samples():
+    samples = [
+        {'metric': {'instance': '10.0.0.1:9100'}, 'value': [0, '1']},
+        {'metric': {'instance': '10.0.0.2:9100'}, 'value': [0, '0']},
+        {'metric': {'instance': '[2001:db8::1]:9100'}, 'value': [0, '1']},
+        {'metric': {'instance': '10.0.0.1:9115'}, 'value': [0, '0']},
+    ]
+
+    assert health_by_ip(samples) == {'10.0.0.1': False, '10.0.0.2': False, '2001:db8::1': True}
+
+
+def test_service_candidates_orders_by_role_then_config():
+    hosts = [
+        ('web-1', STATE_CONFIG['production_servers']['web-1'], '10.0.0.1'),
+        ('obs-1', STATE_CONFIG['production_servers']['obs-1'], '10.0.0.2'),
+        ('obs-2', STATE_CONFIG['production_servers']['obs-2'], '10.0.0.3'),
+    ]
+
+    services = service_candidates(hosts, STATE_ENV)
+
+    assert services['GRAFANA_DOMAIN'] == {
+        'domain': 'grafana.example.com',
+        'candidates': [('obs-1', '10.0.0.2', 'grafana'), ('obs-2', '10.0.0.3', 'grafana')],
+    }
+    assert [c[0] for c in services['PROMETHEUS_DOMAIN']['candidates']] == ['obs-1']
+    assert 'LOKI_DOMAIN' not in services
+
+
+def make_controller(responses, **kwargs):
+    manager = make_manager([
+        make_response(200, {'success': True, 'result': [record('g1', 'grafana.example.com', '10.0.0.2')],
+                            'result_info': {'page': 1, 'total_pages': 1}}),
+    ] + responses)
+    services = {'GRAFANA_DOMAIN': {'domain': 'grafana.example.com', 'candidates': [
+        ('obs-1', '10.0.0.2', 'grafana'), ('obs-2', '10.0.0.3', 'grafana')]}}
+    return FailoverController(manager, 'z', services, **kwargs)
+
+
+def test_failover_waits_for_hysteresis_then_writes_once():
+    controller = make_controller([make_response(200, {'success': True, 'result': {'id': 'g1'}})],
+                                 fail_after=2, recover_after=2)
+    up = {'10.0.0.2': True, '10.0.0.3': True}
+    down = {'10.0.0.2': False, '10.0.0.3': True}
+
+    assert controller.step(up)['changes'] == []
+    assert controller.step(down)['changes'] == []          # one failure is not enough
+    outcome = controller.step(down)
+    assert outcome['transitions'] == [('10.0.0.2', False)]
+    assert [(s['action'], s['content']) for s in outcome['changes']] == [('update', '10.0.0.3')]
+    assert controller.step(down)['changes'] == []          # already switched
+
+    # the primary recovering does not move the record back
+    for _ in range(3):
+        assert controller.step(up)['changes'] == []
+    assert [call[0] for call in controller.manager.session.calls] == ['GET', 'PUT']
+
+
+def test_failover_flapping_host_does_not_switch():
+    controller = make_controller([], fail_after=2)
+
+    for health in ({'10.0.0.2': False, '10.0.0.3': True}, {'10.0.0.2': True, '10.0.0.3': True}) * 3:
+        assert controller.step(health)['changes'] == []
+
+
+def test_failover_keeps_record_when_no_candidate_is_healthy():
+    controller = make_controller([], fail_after=1)
+
+    outcome = controller.step({})
+
+    assert {ip for ip, _ in outcome['transitions']} == {'10.0.0.2', '10.0.0.3'}
+    assert outcome['changes'] == []
+
+
+def test_failover_dry_run_does_not_write():
+    controller = make_controller([], fail_after=1, dry_run=True)
+
+    outcome = controller.step({'10.0.0.3': True})
+
+    assert [s['content'] for s in outcome['changes']] == ['10.0.0.3']
+    assert outcome['results'] == []
+    assert len(controller.manager.session.calls) == 1
+
+
+def test_failover_run_ignores_prometheus_outage(monkeypatch, sleeps):
+    controller = make_controller([], fail_after=1)
+
+    def broken():
+        raise Exception('Prometheus 查询失败: connection refused')
+
+    monkeypatch.setattr(controller, 'poll', broken)
+    controller.run(iterations=3)
+
+    assert controller.records is None
+    assert controller.manager.session.calls == []
+    assert sleeps == [15.0, 15.0]
+
+
+
+def test_failover_run_survives_cloudflare_errors_without_losing_transitions(monkeypatch, sleeps, capsys):
+    controller = make_controller([
+        make_response(200, {'success': True, 'result': [record('g1', 'grafana.example.com', '10.0.0.2')],
+                            'result_info': {'page': 1, 'total_pages': 1}}),
+        make_response(200, {'success': True, 'result': {'id': 'g1'}}),
+    ], fail_after=1)
+    monkeypatch.setattr(controller, 'poll', lambda: {'10.0.0.2': False, '10.0.0.3': True})
+    sync_records = controller.sync_records
+    apply_dns_plan = controller.manager.apply_dns_plan
+    failures = {'sync': 1, 'apply': 1}
+
+    def flaky_sync():
+        if failures['sync']:
+            failures['sync'] -= 1
+            raise Exception('API Error: upstream 502')
+        sync_records()
+
+    def flaky_apply(zone_id, plan):
+        if failures['apply']:
+            failures['apply'] -= 1
+            raise Exception('API Error: upstream 503')
+        return apply_dns_plan(zone_id, plan)
+
+    monkeypatch.setattr(controller, 'sync_records', flaky_sync)
+    monkeypatch.setattr(controller.manager, 'apply_dns_plan', flaky_apply)
+
+    controller.run(iterations=3)
+
+    out = capsys.readouterr().out
+    assert out.count('保持当前记录') == 2
+    # The failed passes rolled back their observation, so the transition is reported when it is acted on
+    assert out.count('故障: 10.0.0.2') == 1
+    assert '切换 grafana.example.com: 10.0.0.2 -> 10.0.0.3' in out
+    assert [call[0] for call in controller.manager.session.calls] == ['GET', 'GET', 'PUT']
+    assert not controller.is_healthy('10.0.0.2')
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for fake_cloudflare_api.py | fake_cloudflare_api.py 单元测试
+
+Coverage:
+  - Zones and DNS records are paginated with result_info
+  - CloudflareManager round-trips create/update/delete through the fake
+  - Error envelopes, missing auth and 429 + Retry-After
+
+Run:
+    python -m pytest tests/test_fake_cloudflare_api.py -v
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+requests = pytest.importorskip('requests')
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'tools'))
+
+import cloudflare_manager
+from cloudflare_manager import CloudflareManager
+from fake_cloudflare_api import FakeCloudflareAPI, make_zone_id
+
+
+@pytest.fixture
+def api():
+    with FakeCloudflareAPI() as server:
+        yield server
+
+
+def make_manager(api, **kwargs):
+    kwargs.setdefault('rate_limit', None)
+    return CloudflareManager(api_token='test-token', base_url=api.url, **kwargs)
+
+
+def test_zones_paginate_past_first_page(api):
+    for i in range(60):
+        api.state.add_zone(f"zone{i:02d}.test")
+
+    manager = make_manager(api)
+
+    assert len(manager.get_zones()) == 60
+    assert manager.get_zone_id('www.zone59.test') == make_zone_id('zone59.test')
+    assert api.state.snapshot_stats()['by_method'] == {'GET': 2}
+
+
+def test_records_paginate_with_filters(api):
+    zone_id = api.state.seed('example.com', 25)
+    api.state.add_record(zone_id, 'AAAA', 'host-00001.example.com', '2001:db8::1')
+    manager = make_manager(api)
+
+    records = list(manager.iter_dns_records(zone_id, per_page=10))
+    assert len(records) == 26
+    assert len({r['id'] for r in records}) == 26
+    assert api.state.snapshot_stats()['requests'] == 3
+
+    only_a = manager.list_dns_records(zone_id, name='host-00001.example.com', record_type='A')
+    assert [r['content'] for r in only_a] == ['10.0.0.1']
+
+
+def test_reconcile_round_trip(api):
+    zone_id = api.state.seed('example.com', 3)
+    manager = make_manager(api)
+    desired = [
+        {'type': 'A', 'name': 'host-00000.example.com', 'content': '10.0.0.0'},
+        {'type': 'A', 'name': 'host-00001.example.com', 'content': '10.9.9.9', 'proxied': True},
+        {'type': 'A', 'name': 'new.example.com', 'content': '10.8.8.8'},
+    ]
+
+    outcome = manager.reconcile_dns_records(zone_id, desired, prune=True)
+
+    assert sorted(r['step']['action'] for r in outcome['results']) == ['create', 'delete', 'update']
+    assert all(r['ok'] for r in outcome['results'])
+    again = manager.reconcile_dns_records(zone_id, desired, prune=True)
+    assert {step['action'] for step in again['plan']} == {'noop'}
+
+
+def test_errors_use_cloudflare_envelope(api):
+    manager = make_manager(api)
+
+    with pytest.raises(Exception, match='404'):
+        manager.list_dns_records('missing-zone')
+
+    response = requests.get(f"{api.url}/zones")
+    assert response.status_code == 403
+    assert response.json()['errors'][0]['code'] == 10000
+
+    zone_id = api.state.add_zone('example.com')
+    manager.create_dns_record(zone_id, 'A', 'a.example.com', '10.0.0.1')
+    with pytest.raises(Exception, match='identical record'):
+        manager.create_dns_record(zone_id, 'A', 'a.example.com', '10.0.0.1')
+
+
+def test_rate_limit_returns_429_with_retry_after(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(cloudflare_manager.time, 'sleep', sleeps.append)
+
+    with FakeCloudflareAPI(rate_limit=0.5, burst=1) as server:
+        server.state.add_zone('example.com')
+        manager = make_manager(server, max_retries=1)
+
+        manager.list_zones()
+        with pytest.raises(Exception, match='429'):
+            manager.list_zones()
+
+    assert sleeps == [2.0]
+    assert server.state.snapshot_stats()['rate_limited'] == 2
+    assert manager.get_request_stats()['rate_limited'] == 1
@@ -8,13 +8,23 @@ Coverage:
   - Empty server list is handled gracefully
   - Group definitions are properly structured
   - Server metadata is correctly propagated
+  - Parsed-config cache is reused and invalidated on content change
+  - JSON and pickle snapshot outputs round-trip through load_inventory
+  - Inventory diffs report only affected hosts and groups
+  - Shared layout emits host vars once under all.hosts
+  - Streaming YAML writer matches generate_inventory_yaml byte for byte
+  - All environments are generated together and written atomically
 
 Run:
     python -m pytest tests/test_generate_inventory.py -v
     python tests/test_generate_inventory.py
 """
 
+import io
+import os
+import pickle
 import sys
+import pytest
 import yaml
 from pathlib import Path
 
@@ -25,7 +35,19 @@ from generate_inventory import (
     generate_local_inventory,
     generate_github_actions_inventory,
     generate_inventory_yaml,
+    generate_inventory_json,
+    generate_inventory_snapshot,
+    diff_inventories,
+    build_delta_inventory,
+    share_host_vars,
+    write_inventory_yaml,
+    atomic_output,
+    select_environment,
+    generate_all_environments,
+    load_config_cached,
+    load_inventory,
 )
+import generate_inventory
 
 
 def make_minimal_config(**overrides):
@@ -184,6 +206,257 @@ def test_github_actions_servers_override():
     assert test_host['server_alias'] == 'test-1'
 
 
+# ---------------------------------------------------------------------------
+# Test: Parsed-config cache
+# ---------------------------------------------------------------------------
+def test_load_config_cached_reuses_cache(tmp_path, monkeypatch):
+    config_file = tmp_path / 'servers-config.yml'
+    config_file.write_text(yaml.safe_dump(make_minimal_config()), encoding='utf-8')
+    cache_dir = tmp_path / 'cache'
+
+    first = load_config_cached(str(config_file), cache_dir=str(cache_dir))
+    assert first == make_minimal_config()
+    assert len(list(cache_dir.iterdir())) == 1
+
+    def fail_parse(*args, **kwargs):
+        raise AssertionError('cached config should not be re-parsed')
+
+    monkeypatch.setattr(generate_inventory, '_parse_yaml', fail_parse)
+    assert load_config_cached(str(config_file), cache_dir=str(cache_dir)) == first
+
+
+def test_load_config_cached_detects_content_change(tmp_path):
+    config_file = tmp_path / 'servers-config.yml'
+    config_file.write_text(yaml.safe_dump(make_minimal_config()), encoding='utf-8')
+    cache_dir = tmp_path / 'cache'
+    load_config_cached(str(config_file), cache_dir=str(cache_dir))
+
+    config_file.write_text(
+        yaml.safe_dump(make_minimal_config(global_vars={'ssh_port': 2222})),
+        encoding='utf-8',
+    )
+    reloaded = load_config_cached(str(config_file), cache_dir=str(cache_dir))
+
+    assert reloaded['global_vars'] == {'ssh_port': 2222}
+
+
+# ---------------------------------------------------------------------------
+# Test: JSON / pickle snapshot formats
+# ---------------------------------------------------------------------------
+@pytest.mark.parametrize('writer, suffix', [
+    (lambda inv: generate_inventory_yaml(inv).encode('utf-8'), 'yml'),
+    (lambda inv: generate_inventory_json(inv).encode('utf-8'), 'json'),
+    (generate_inventory_snapshot, 'pickle'),
+])
+def test_load_inventory_round_trips_all_formats(tmp_path, writer, suffix):
+    inventory = generate_local_inventory(make_minimal_config())
+    output = tmp_path / f'hosts.{suffix}'
+    output.write_bytes(writer(inventory))
+
+    assert load_inventory(str(output)) == inventory
+
+
+def test_load_inventory_rejects_unknown_snapshot_schema(tmp_path):
+    output = tmp_path / 'hosts.pickle'
+    output.write_bytes(pickle.dumps({'schema': 999, 'inventory': {}}))
+
+    with pytest.raises(ValueError, match='schema'):
+        load_inventory(str(output))
+
+
+# ---------------------------------------------------------------------------
+# Test: Incremental diff / delta
+# ---------------------------------------------------------------------------
+def test_diff_inventories_no_change():
+    inventory = generate_local_inventory(make_minimal_config())
+    changes = diff_inventories(inventory, generate_local_inventory(make_minimal_config()))
+
+    assert changes['changed'] is False
+    assert changes['affected_hosts'] == []
+
+
+def test_diff_inventories_reports_added_and_modified_hosts():
+    previous = generate_local_inventory(make_minimal_config())
+    config = make_minimal_config()
+    config['production_servers']['jp-server']['location'] = 'Osaka'
+    config['production_servers']['uk-server'] = {
+        'env_var': 'UK_V4_IP',
+        'groups': ['all_servers'],
+    }
+    changes = diff_inventories(previous, generate_local_inventory(config))
+
+    assert changes['hosts']['added'] == ['uk-server']
+    assert changes['hosts']['modified'] == ['jp-server']
+    assert changes['groups']['modified'] == ['all_servers']
+    assert changes['limit'] == 'jp-server,uk-server'
+
+
+def test_diff_inventories_group_vars_change_affects_members():
+    previous = generate_local_inventory(make_minimal_config())
+    config = make_minimal_config(group_definitions={
+        'all_servers': {'vars': {}},
+        'web_servers': {'vars': {'nginx_port': 8080}},
+    })
+    changes = diff_inventories(previous, generate_local_inventory(config))
+
+    assert changes['hosts']['modified'] == []
+    assert changes['groups']['modified'] == ['web_servers']
+    assert changes['affected_hosts'] == ['jp-server']
+
+
+def test_build_delta_inventory_keeps_only_changed_groups():
+    config = make_minimal_config()
+    config['group_definitions']['db_servers'] = {'vars': {}}
+    previous = generate_local_inventory(config)
+    config['production_servers']['db-server'] = {
+        'env_var': 'DB_V4_IP',
+        'groups': ['db_servers'],
+    }
+    current = generate_local_inventory(config)
+    delta = build_delta_inventory(current, diff_inventories(previous, current))
+
+    assert list(delta['all']['children']) == ['db_servers']
+    assert list(delta['all']['children']['db_servers']['hosts']) == ['db-server']
+    assert 'vars' not in delta['all']
+
+
+# ---------------------------------------------------------------------------
+# Test: Shared host vars layout
+# ---------------------------------------------------------------------------
+def test_share_host_vars_hoists_vars_to_all_hosts():
+    inventory = share_host_vars(generate_local_inventory(make_minimal_config()))
+    groups = inventory['all']['children']
+
+    assert inventory['all']['hosts']['jp-server']['server_alias'] == 'jp-1'
+    assert groups['all_servers']['hosts'] == {'jp-server': None}
+    assert groups['web_servers']['hosts'] == {'jp-server': None}
+    assert groups['web_servers']['vars'] == {}
+
+
+def test_share_host_vars_output_is_smaller_and_valid_yaml():
+    config = make_minimal_config()
+    grouped = generate_inventory_yaml(generate_local_inventory(config))
+    shared = generate_inventory_yaml(share_host_vars(generate_local_inventory(config)))
+
+    assert len(shared) < len(grouped)
+    assert yaml.safe_load(shared)['all']['hosts']['jp-server']['location'] == 'Tokyo'
+
+
+def test_share_host_vars_does_not_change_diff():
+    inventory = generate_local_inventory(make_minimal_config())
+    changes = diff_inventories(inventory, share_host_vars(inventory))
+
+    assert changes['hosts']['modified'] == []
+    assert changes['affected_hosts'] == []
+
+
+# ---------------------------------------------------------------------------
+# Test: Streaming YAML writer / atomic output
+# ---------------------------------------------------------------------------
+@pytest.mark.parametrize('build', [
+    lambda config: generate_local_inventory(config),
+    lambda config: generate_github_actions_inventory(config),
+    lambda config: share_host_vars(generate_local_inventory(config)),
+    lambda config: generate_local_inventory(make_minimal_config(group_definitions={})),
+])
+def test_write_inventory_yaml_matches_generate_inventory_yaml(build):
+    inventory = build(make_minimal_config())
+    stream = io.StringIO()
+    write_inventory_yaml(inventory, stream)
+
+    assert stream.getvalue() == generate_inventory_yaml(inventory)
+
+
+def test_atomic_output_keeps_original_on_failure(tmp_path):
+    target = tmp_path / 'hosts.yml'
+    target.write_text('original\n', encoding='utf-8')
+
+    with pytest.raises(RuntimeError):
+        with atomic_output(str(target)) as f:
+            f.write('partial')
+            raise RuntimeError('boom')
+
+    assert target.read_text(encoding='utf-8') == 'original\n'
+    assert list(tmp_path.iterdir()) == [target]
+
+
+def test_atomic_output_applies_mode_before_writing(tmp_path, monkeypatch):
+    target = tmp_path / 'secret.json'
+    target.write_text('{}', encoding='utf-8')
+    target.chmod(0o644)
+
+    with atomic_output(str(target), mode=0o600) as f:
+        assert os.fstat(f.fileno()).st_mode & 0o777 == 0o600
+        f.write('{"a": 1}')
+    assert target.stat().st_mode & 0o777 == 0o600
+
+    def fail(fd, mode):
+        raise PermissionError('fchmod')
+    monkeypatch.setattr(os, 'fchmod', fail)
+    with pytest.raises(PermissionError):
+        with atomic_output(str(target), mode=0o600):
+            pass
+    assert list(tmp_path.iterdir()) == [target]
+
+
+# ---------------------------------------------------------------------------
+# Test: Multi-environment generation
+# ---------------------------------------------------------------------------
+def make_multi_env_config():
+    config = make_minimal_config()
+    config['production_servers']['jp-server']['server_environment'] = 'production'
+    config['production_servers']['fr-server'] = {
+        'env_var': 'FR_V4_IP',
+        'groups': ['all_servers'],
+        'server_environment': 'development',
+    }
+    return config
+
+
+def test_select_environment_filters_by_server_environment():
+    config = make_multi_env_config()
+
+    assert list(select_environment(config, ['development'])['production_servers']) == ['fr-server']
+    assert select_environment(config, None) is config
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_generate_all_environments_writes_every_flavour(tmp_path, max_workers):
+    environments = {
+        'production': {'server_environments': None},
+        'development': {'server_environments': ['development']},
+    }
+    written = generate_all_environments(make_multi_env_config(), root=str(tmp_path),
+                                        environments=environments, max_workers=max_workers)
+
+    assert sorted(Path(p).relative_to(tmp_path).as_posix() for p in written) == [
+        'inventories/development/hosts.github-actions.yml',
+        'inventories/development/hosts.yml',
+        'inventories/production/hosts.github-actions.yml',
+        'inventories/production/hosts.yml',
+    ]
+    dev = load_inventory(str(tmp_path / 'inventories/development/hosts.yml'))
+    assert list(dev['all']['children']['all_servers']['hosts']) == ['fr-server']
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_generate_all_environments_leaves_outputs_untouched_on_failure(tmp_path, max_workers):
+    env_dir = tmp_path / 'inventories' / 'production'
+    env_dir.mkdir(parents=True)
+    (env_dir / 'hosts.yml').write_text('original\n', encoding='utf-8')
+    config = make_multi_env_config()
+    config['github_actions_servers'] = {'broken': {'groups': ['all_servers']}}
+
+    with pytest.raises(KeyError) as exc_info:
+        generate_all_environments(config, root=str(tmp_path),
+                                  environments={'production': {}}, max_workers=max_workers)
+
+    assert any('production/github-actions' in note for note in exc_info.value.__notes__)
+
+    assert (env_dir / 'hosts.yml').read_text(encoding='utf-8') == 'original\n'
+    assert sorted(p.name for p in env_dir.iterdir()) == ['hosts.yml']
+
+
 # ---------------------------------------------------------------------------
 # CLI argument validation
 # ---------------------------------------------------------------------------
@@ -198,6 +471,18 @@ def test_cli_requires_mode(monkeypatch, capsys):
         assert e.code == 1
 
 
+@pytest.mark.parametrize('jobs', ['0', '-2', 'many'])
+def test_cli_rejects_non_positive_jobs(monkeypatch, capsys, jobs):
+    from generate_inventory import main
+
+    monkeypatch.setattr(sys, 'argv', ['generate_inventory.py', 'all', '--jobs', jobs])
+    with pytest.raises(SystemExit) as exc_info:
+        main()
+
+    assert exc_info.value.code == 2
+    assert '--jobs' in capsys.readouterr().err
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main([__file__, '-v'])
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Tests for known_hosts.py | known_hosts.py 单元测试
+
+Coverage:
+  - Managed file round-trip: [host]:port entries, sorted output, foreign lines ignored
+  - Parallel scan records new hosts, reports unchanged and changed keys, never overwrites without update
+  - Unsupported key types are skipped; unreachable hosts are reported per host
+  - pin_host_key makes SSHClient reject unknown hosts (before connecting) and mismatched keys
+  - Every generated environment inventory points at its own known_hosts holding that environment's hosts
+
+Run:
+    python -m pytest tests/test_known_hosts.py -v
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+import yaml
+
+paramiko = pytest.importorskip('paramiko')
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'tools'))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_ssh_server import FakeSSHServer
+from generate_inventory import generate_all_environments, load_inventory
+from known_hosts import (
+    KnownHosts,
+    environment_known_hosts,
+    fingerprint,
+    host_entry,
+    hosts_from_config,
+    load_known_hosts,
+    pin_host_key,
+    record_environments,
+    record_scan,
+    scan_host_keys,
+    scan_hosts,
+)
+
+REPO_CONFIG = Path(__file__).parent.parent / 'inventories' / 'production' / 'servers-config.yml'
+
+
+def server_keys(server):
+    return {server.host_key.get_name(): server.host_key.get_base64()}
+
+
+def test_known_hosts_round_trip(tmp_path):
+    path = tmp_path / 'known_hosts'
+    path.write_text(
+        "# comment\n"
+        "203.0.113.10,web-1 ssh-ed25519 AAAAed\n"
+        "|1|c2FsdA==|aGFzaA== ssh-rsa AAAAhashed\n"
+        "@cert-authority *.example.com ssh-rsa AAAAca\n"
+    )
+
+    known = KnownHosts(path)
+    known.set('2001:db8::1', 2222, {'ssh-rsa': 'AAAArsa'})
+    known.set('[203.0.113.11]', 22, {'ssh-rsa': 'AAAAb', 'ssh-ed25519': 'AAAAa'})
+    known.save()
+
+    assert known.lookup('web-1') == {'ssh-ed25519': 'AAAAed'}
+    assert host_entry('2001:db8::1', 2222) == '[2001:db8::1]:2222'
+    assert path.read_text().splitlines()[2:] == [
+        '203.0.113.10 ssh-ed25519 AAAAed',
+        '203.0.113.11 ssh-ed25519 AAAAa',
+        '203.0.113.11 ssh-rsa AAAAb',
+        '[2001:db8::1]:2222 ssh-rsa AAAArsa',
+        'web-1 ssh-ed25519 AAAAed',
+    ]
+    assert KnownHosts(path).entries == known.entries
+
+
+def test_scan_pins_new_hosts_and_refuses_changed_keys(tmp_path):
+    known = KnownHosts(tmp_path / 'known_hosts')
+
+    with FakeSSHServer(tmp_path) as first, FakeSSHServer(tmp_path) as second:
+        targets = [{'name': 'web-1', 'host': '127.0.0.1', 'port': first.port},
+                   {'name': 'web-2', 'host': '127.0.0.1', 'port': second.port}]
+        # web-2 was pinned to another server's key: a changed key must not be overwritten silently
+        known.set('127.0.0.1', second.port, server_keys(first))
+
+        results = scan_hosts(targets, known, timeout=5)
+        assert [r['status'] for r in results] == ['new', 'changed']
+        # The fake server only has an RSA host key; ed25519/ecdsa attempts are skipped
+        assert results[0]['keys'] == server_keys(first)
+        assert record_scan(known, results) == 1
+        assert known.lookup('127.0.0.1', second.port) == server_keys(first)
+
+        assert record_scan(known, results, update=True) == 2
+        known.save()
+        rescanned = scan_hosts(targets, load_known_hosts(known.path), timeout=5)
+
+    assert [r['status'] for r in rescanned] == ['unchanged', 'unchanged']
+    assert fingerprint(results[1]['keys']['ssh-rsa']) == second.host_key.fingerprint
+
+
+def test_scan_reports_unreachable_hosts(tmp_path):
+    with FakeSSHServer(tmp_path) as server:
+        port = server.port
+    with pytest.raises(OSError):
+        scan_host_keys('127.0.0.1', port, timeout=2)
+
+    results = scan_hosts([{'name': 'gone', 'host': '127.0.0.1', 'port': port}], KnownHosts(tmp_path / 'kh'),
+                         timeout=2)
+    assert not results[0]['ok'] and results[0]['status'] is None
+    assert 'ConnectionRefusedError' in results[0]['error']
+
+
+def test_pin_host_key_rejects_unknown_and_mismatched_hosts(tmp_path):
+    path = tmp_path / 'known_hosts'
+
+    with FakeSSHServer(tmp_path) as server, FakeSSHServer(tmp_path) as other:
+        def connect():
+            ssh = paramiko.SSHClient()
+            try:
+                pin_host_key(ssh, '127.0.0.1', server.port, path)
+                ssh.connect('127.0.0.1', server.port, 'root', 'secret', look_for_keys=False,
+                            allow_agent=False, timeout=5)
+            finally:
+                ssh.close()
+
+        with pytest.raises(paramiko.SSHException, match='不在'):
+            connect()
+        assert server.connections == 0
+
+        known = KnownHosts(path)
+        known.set('127.0.0.1', server.port, server_keys(other))
+        known.save()
+        with pytest.raises(paramiko.BadHostKeyException):
+            connect()
+
+        known.set('127.0.0.1', server.port, server_keys(server))
+        known.save()
+        connect()
+
+
+def test_each_environment_inventory_gets_its_own_known_hosts(tmp_path):
+    # Use the shipped ansible_ssh_common_args so the test follows the real UserKnownHostsFile setting
+    common_args = yaml.safe_load(REPO_CONFIG.read_text(encoding='utf-8'))['global_vars']['ansible_ssh_common_args']
+    servers = {'jp-1': 'production', 'sg-1': 'staging', 'fr-1': 'development'}
+    config = {
+        'global_vars': {'ansible_ssh_common_args': common_args},
+        'group_definitions': {'all_servers': {'vars': {}}},
+        'production_servers': {name: {'env_var': f"{name.upper().replace('-', '_')}_IP", 'groups': ['all_servers'],
+                                      'server_environment': env} for name, env in servers.items()},
+        'github_actions_servers': {},
+    }
+    config_file = tmp_path / 'inventories' / 'production' / 'servers-config.yml'
+    config_file.parent.mkdir(parents=True)
+    config_file.write_text(yaml.safe_dump(config), encoding='utf-8')
+    generate_all_environments(config, root=str(tmp_path), flavours=('local',), max_workers=1)
+
+    environ = {'JP_1_IP': '203.0.113.1', 'SG_1_IP': '203.0.113.2/32', 'FR_1_IP': '203.0.113.3'}
+    targets, missing = hosts_from_config(str(config_file), environ=environ)
+    assert missing == []
+    results = [dict(target, ok=True, status='new', keys={'ssh-ed25519': f"AAAA{target['name']}"})
+               for target in targets]
+    summary = record_environments(results, environment_known_hosts(str(config_file), root=str(tmp_path)))
+    assert sorted(counts['recorded'] for counts in summary.values()) == [1, 1, 3]
+
+    addresses = {target['name']: target['host'] for target in targets}
+    for env in ('production', 'staging', 'development'):
+        env_dir = tmp_path / 'inventories' / env
+        inventory = load_inventory(str(env_dir / 'hosts.yml'))
+        common = inventory['all']['vars']['ansible_ssh_common_args'].replace('{{ inventory_dir }}', str(env_dir))
+        path = Path(common.split('UserKnownHostsFile=', 1)[1].split()[0])
+        hosts = {host for group in inventory['all']['children'].values() for host in group.get('hosts') or {}}
+
+        assert path.exists(), env
+        assert sorted(KnownHosts(path).entries) == sorted(addresses[host] for host in hosts)
+    assert sorted(KnownHosts(tmp_path / 'inventories' / 'development' / 'known_hosts').entries) == ['203.0.113.3']
+
+    # A second run records nothing new and leaves every file in place
+    summary = record_environments(results, environment_known_hosts(str(config_file), root=str(tmp_path)))
+    assert all(counts == {'new': 0, 'changed': 0, 'recorded': 0} for counts in summary.values())
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Tests for secrets_uploader.py | secrets_uploader.py 单元测试
+
+Coverage:
+  - Batch upload fetches the public key once and encrypts with one SealedBox
+  - Uploads run concurrently over one session with rate-limit backoff
+  - The local manifest skips secrets whose value and remote updated_at are unchanged
+  - Fan-out to repo, environment and org targets shares one env set and one pool
+  - Equivalent targets are uploaded once; a failed post-upload listing only skips the manifest refresh
+  - Substring, glob and regex filters compile into one matcher when safe, with per-target rules
+  - .env values are uploaded verbatim: no $VAR interpolation, no inline-comment stripping
+
+Run:
+    python -m pytest tests/test_secrets_uploader.py -v
+"""
+
+import base64
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+requests = pytest.importorskip('requests')
+nacl_public = pytest.importorskip('nacl.public')
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'tools'))
+
+import secrets_uploader
+from secrets_uploader import (
+    GitHubSecretsUploader,
+    SecretsManifest,
+    filter_secrets,
+    parse_env_file,
+    parse_target,
+    parse_target_rules,
+    plan_secret_uploads,
+)
+
+API = 'https://api.github.com/repos/owner/repo/actions/secrets'
+
+
+def make_response(status=200, body=None, headers=None):
+    """Build a real requests.Response with the given status/body/headers."""
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body).encode() if body is not None else b''
+    response.headers.update(headers or {})
+    return response
+
+
+class FakeGitHub:
+    """Thread-safe session stand-in serving public keys, secret listings and PUTs for any scope."""
+
+    def __init__(self, private_key, put_responses=None):
+        self.private_key = private_key
+        self.put_responses = list(put_responses or [])
+        self.lock = threading.Lock()
+        self.headers = {}
+        self.calls = []
+        self.bodies = {}
+        self.stored = {}
+        self.remote = {}
+        self.clock = 0
+
+    @property
+    def updated_at(self):
+        return self.remote.setdefault(API, {})
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def request(self, method, url, timeout=None, json=None, params=None):
+        with self.lock:
+            self.calls.append((method, url))
+            if method == 'GET' and url.endswith('/public-key'):
+                key = self.private_key.public_key.encode(encoder=secrets_uploader.encoding.Base64Encoder)
+                return make_response(200, {'key_id': 'kid', 'key': key.decode()})
+            if method == 'GET':
+                updated_at = self.remote.get(url, {})
+                names = sorted(updated_at)
+                start = (params['page'] - 1) * params['per_page']
+                page = [{'name': n, 'updated_at': updated_at[n]}
+                        for n in names[start:start + params['per_page']]]
+                return make_response(200, {'total_count': len(names), 'secrets': page})
+            if self.put_responses:
+                return self.put_responses.pop(0)
+        box = nacl_public.SealedBox(self.private_key)
+        base, name = url.rsplit('/', 1)
+        with self.lock:
+            if base == API:
+                self.stored[name] = (json['key_id'], box.decrypt(base64.b64decode(json['encrypted_value'])).decode())
+            self.bodies[url] = json
+            self.clock += 1
+            self.remote.setdefault(base, {})[name] = f"2026-01-01T00:00:{self.clock:02d}Z"
+        return make_response(201)
+
+    def puts(self):
+        return [url.rsplit('/', 1)[1] for method, url in self.calls if method == 'PUT']
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(secrets_uploader.time, 'sleep', recorded.append)
+    return recorded
+
+
+def make_uploader(fake, **kwargs):
+    uploader = GitHubSecretsUploader('owner/repo', 'token', **kwargs)
+    uploader.session = fake
+    return uploader
+
+
+def test_batch_upload_fetches_key_once_and_encrypts_every_value():
+    fake = FakeGitHub(nacl_public.PrivateKey.generate())
+    uploader = make_uploader(fake, max_workers=4)
+    secrets = {f"SECRET_{i}": f"value-{i}" for i in range(20)}
+    reported = []
+
+    results = uploader.upload_secrets_batch(secrets, on_result=reported.append)
+
+    assert [r['name'] for r in results] == list(secrets)
+    assert all(r['ok'] for r in results)
+    assert len(reported) == 20
+    assert fake.stored == {name: ('kid', value) for name, value in secrets.items()}
+    assert [c for c in fake.calls if c[0] == 'GET'] == [('GET', f"{API}/public-key")]
+    assert len(uploader._sealed_boxes) == 1
+
+
+def test_test_connection_caches_public_key():
+    fake = FakeGitHub(nacl_public.PrivateKey.generate())
+    uploader = make_uploader(fake)
+
+    assert uploader.test_connection()
+    assert uploader.upload_secret('ONE', '1')
+    assert uploader.upload_secret('TWO', '2')
+
+    assert sum(1 for c in fake.calls if c[0] == 'GET') == 1
+
+
+def test_rate_limited_put_is_retried(sleeps):
+    fake = FakeGitHub(nacl_public.PrivateKey.generate(), put_responses=[
+        make_response(403, {'message': 'secondary rate limit'}, {'Retry-After': '7'}),
+        make_response(502, {'message': 'bad gateway'}),
+    ])
+    uploader = make_uploader(fake, backoff_factor=0.5)
+
+    results = uploader.upload_secrets_batch({'ONLY': 'value'})
+
+    assert results == [{'name': 'ONLY', 'ok': True, 'error': None}]
+    assert sleeps == [7.0, 1.0]
+
+
+def test_non_retryable_failure_is_reported(sleeps):
+    fake = FakeGitHub(nacl_public.PrivateKey.generate(), put_responses=[
+        make_response(422, {'message': 'Bad key'}),
+    ])
+    uploader = make_uploader(fake)
+
+    results = uploader.upload_secrets_batch({'A': '1', 'B': '2'}, max_workers=1)
+
+    assert [r['ok'] for r in results] == [False, True]
+    assert results[0]['error'].startswith('422')
+    assert sleeps == []
+
+
+def test_list_secrets_follows_pages():
+    fake = FakeGitHub(nacl_public.PrivateKey.generate())
+    fake.remote[API] = {f"S{i:03d}": f"t{i}" for i in range(250)}
+    uploader = make_uploader(fake)
+
+    remote = uploader.list_secrets()
+
+    assert remote == fake.updated_at
+    assert len(fake.calls) == 3
+
+
+def test_manifest_round_trip_stores_no_plaintext(tmp_path):
+    path = tmp_path / 'secrets' / 'manifest.json'
+    manifest = SecretsManifest(path)
+    manifest.record('repo:owner/repo', 'TOKEN', 'hunter2', 't1')
+    manifest.save()
+
+    assert 'hunter2' not in path.read_text()
+    assert path.stat().st_mode & 0o777 == 0o600
+    reloaded = SecretsManifest(path)
+    assert reloaded.is_current('repo:owner/repo', 'TOKEN', 'hunter2', 't1')
+    assert not reloaded.is_current('repo:owner/repo', 'TOKEN', 'changed', 't1')
+    assert not reloaded.is_current('repo:owner/repo', 'TOKEN', 'hunter2', 't2')
+    assert not reloaded.is_current('repo:owner/repo', 'TOKEN', 'hunter2', None)
+    assert SecretsManifest(tmp_path / 'other.json').digest('hunter2') != manifest.digest('hunter2')
+
+
+def test_manifest_is_never_written_with_wider_permissions(tmp_path, monkeypatch):
+    path = tmp_path / 'manifest.json'
+    path.write_text('{}')
+    path.chmod(0o644)
+    modes = []
+    dump = secrets_uploader.json.dump
+    monkeypatch.setattr(secrets_uploader.json, 'dump',
+                        lambda data, f, **kw: modes.append(os.fstat(f.fileno()).st_mode & 0o777)
+                        or dump(data, f, **kw))
+
+    SecretsManifest(path).save()
+
+    assert modes == [0o600]
+    assert path.stat().st_mode & 0o777 == 0o600
+
+
+def test_plan_uploads_only_changed_or_missing(tmp_path):
+    manifest = SecretsManifest(tmp_path / 'manifest.json')
+    for name in ('SAME', 'CHANGED', 'GONE', 'EDITED'):
+        manifest.record('repo:o/r', name, 'v', 't1')
+    secrets = {'SAME': 'v', 'CHANGED': 'v2', 'GONE': 'v', 'EDITED': 'v', 'NEW': 'v'}
+    remote = {'SAME': 't1', 'CHANGED': 't1', 'EDITED': 't9'}
+
+    pending, skipped = plan_secret_uploads(secrets, remote, manifest, 'repo:o/r')
+
+    assert skipped == ['SAME']
+    assert list(pending) == ['CHANGED', 'GONE', 'EDITED', 'NEW']
+    assert plan_secret_uploads(secrets, remote, manifest, 'repo:o/r', force=True)[1] == []
+
+
+@pytest.fixture
+def fake_session(monkeypatch):
+    fake = FakeGitHub(nacl_public.PrivateKey.generate())
+    monkeypatch.setattr(secrets_uploader.requests, 'Session', lambda: fake)
+    return fake
+
+
+def test_second_upload_run_is_a_no_op(tmp_path, fake_session):
+    fake = fake_session
+    env_file = tmp_path / '.env'
+    env_file.write_text('ALPHA=1\nBETA=2\n')
+    manifest = tmp_path / 'manifest.json'
+
+    def run():
+        fake.calls.clear()
+        secrets_uploader.upload_secrets(str(env_file), 'owner/repo', 'token', manifest_path=manifest)
+        return sorted(fake.puts())
+
+    assert run() == ['ALPHA', 'BETA']
+    assert run() == []
+
+    env_file.write_text('ALPHA=1\nBETA=3\n')
+    assert run() == ['BETA']
+
+    fake.updated_at['ALPHA'] = '2026-02-01T00:00:00Z'
+    assert run() == ['ALPHA']
+
+
+def test_parse_env_file_keeps_secret_values_verbatim(tmp_path, monkeypatch):
+    monkeypatch.setenv('USER', 'root')
+    path = tmp_path / '.env'
+    path.write_text(
+        'PASSWORD=pa$USER\n'
+        'HOME_DIR=${USER}/x\n'
+        'TOKEN=abc #x\n'
+        'QUOTED="a\\nb $USER"\n'
+        'EMPTY=\n'
+    )
+
+    assert parse_env_file(path) == {
+        'PASSWORD': 'pa$USER',
+        'HOME_DIR': '${USER}/x',
+        'TOKEN': 'abc #x',
+        'QUOTED': 'a\nb $USER',
+    }
+
+
+def test_parse_target_scopes():
+    assert parse_target('owner/repo')['repo'] == 'owner/repo'
+    assert parse_target('env:owner/repo/prod')['environment'] == 'prod'
+    assert parse_target('org:acme')['visibility'] == 'private'
+    assert parse_target('org:acme:selected:1,2')['selected_repository_ids'] == [1, 2]
+    for bad in ('owner', 'env:owner/repo', 'org:acme:public', 'org:acme:all:1', 'x:y'):
+        with pytest.raises(Exception):
+            parse_target(bad)
+
+
+def test_fan_out_uploads_every_target_with_combined_summary(tmp_path, fake_session, capsys):
+    env_file = tmp_path / '.env'
+    env_file.write_text('ALPHA=1\nBETA=2\n')
+    targets = ['env:owner/repo/prod', 'org:acme:selected:7']
+
+    secrets_uploader.upload_secrets(str(env_file), 'owner/repo', 'token', workers=3,
+                                    manifest_path=tmp_path / 'manifest.json', targets=targets)
+
+    base = 'https://api.github.com'
+    env_api = f"{base}/repos/owner/repo/environments/prod/secrets"
+    org_api = f"{base}/orgs/acme/actions/secrets"
+    assert set(fake_session.bodies) == {f"{api}/{name}" for api in (API, env_api, org_api)
+                                        for name in ('ALPHA', 'BETA')}
+    assert fake_session.bodies[f"{org_api}/ALPHA"]['visibility'] == 'selected'
+    assert fake_session.bodies[f"{org_api}/ALPHA"]['selected_repository_ids'] == [7]
+    assert 'visibility' not in fake_session.bodies[f"{env_api}/ALPHA"]
+    key_fetches = [url for method, url in fake_session.calls if url.endswith('/public-key')]
+    assert sorted(key_fetches) == sorted(f"{api}/public-key" for api in (API, env_api, org_api))
+
+    out = capsys.readouterr().out
+    assert '总计: 6' in out
+    assert 'org:acme:selected:7: ✓ 2' in out
+
+    fake_session.calls.clear()
+    secrets_uploader.upload_secrets(str(env_file), 'owner/repo', 'token',
+                                    manifest_path=tmp_path / 'manifest.json', targets=targets)
+    assert fake_session.puts() == []
+
+
+def test_duplicate_targets_upload_once_and_listing_failure_only_warns(tmp_path, fake_session, monkeypatch,
+                                                                     sleeps, capsys):
+    env_file = tmp_path / '.env'
+    env_file.write_text('ALPHA=1\n')
+    env_api = 'https://api.github.com/repos/owner/repo/environments/prod/secrets'
+    request = fake_session.request
+
+    def flaky_listing(method, url, **kwargs):
+        # The listing after the upload fails for the environment target only
+        if method == 'GET' and url == env_api and fake_session.puts():
+            return make_response(500, {'message': 'boom'})
+        return request(method, url, **kwargs)
+    monkeypatch.setattr(fake_session, 'request', flaky_listing)
+
+    secrets_uploader.upload_secrets(str(env_file), 'owner/repo', 'token',
+                                    manifest_path=tmp_path / 'manifest.json',
+                                    targets=['repo:owner/repo', 'env:owner/repo/prod', 'owner/repo'])
+
+    assert sorted(fake_session.bodies) == [f"{API}/ALPHA", f"{env_api}/ALPHA"]
+    assert '⚠️  env:owner/repo/prod' in capsys.readouterr().out
+    manifest = SecretsManifest(tmp_path / 'manifest.json')
+    assert list(manifest.targets) == ['repo:owner/repo']
+
+
+def test_filter_secrets_mixes_substring_glob_and_regex():
+    env = {name: 'v' for name in ('LOCAL_DB', 'TEST_TOKEN', 'MY_TEST', 'API_DEV', 'PROD_KEY', 'CF_TOKEN')}
+
+    assert list(filter_secrets(env, ['LOCAL'])) == ['TEST_TOKEN', 'MY_TEST', 'API_DEV', 'PROD_KEY', 'CF_TOKEN']
+    assert list(filter_secrets(env, ['TEST_*', 're:_DEV$'])) == ['LOCAL_DB', 'MY_TEST', 'PROD_KEY', 'CF_TOKEN']
+    assert list(filter_secrets(env, ['LOCAL'], include_patterns=['*_TOKEN', 'PROD'])) == [
+        'TEST_TOKEN', 'PROD_KEY', 'CF_TOKEN']
+    assert filter_secrets(env, ['a.b']) == env
+    with pytest.raises(Exception):
+        filter_secrets(env, ['re:('])
+
+
+def test_regex_flags_and_backreferences_survive_merging():
+    env = {name: 'v' for name in ('api_key', 'AA_X', 'AB_X', 'DB_HOST', 'MY_DB_X', 'OTHER')}
+
+    # (?i) and \1 are only valid per pattern; combined with other patterns they must keep their meaning
+    assert list(filter_secrets(env, ['re:(?i)^API_', 're:^(.)\\1_', 'OTHER'])) == [
+        'AB_X', 'DB_HOST', 'MY_DB_X']
+    # A glob matches the whole name; a substring match needs explicit wildcards
+    assert list(filter_secrets(env, include_patterns=['DB_*'])) == ['DB_HOST']
+    assert list(filter_secrets(env, include_patterns=['*DB_*'])) == ['DB_HOST', 'MY_DB_X']
+    assert list(filter_secrets(env, include_patterns=['DB_'])) == ['DB_HOST', 'MY_DB_X']
+
+
+def test_target_rules_are_keyed_by_canonical_target():
+    rules = parse_target_rules(['owner/repo=PROD_*'], ['owner/repo=re:KEY$', 'org:acme=CF'])
+
+    assert rules == {
+        'repo:owner/repo': {'include': ['PROD_*'], 'exclude': ['re:KEY$']},
+        'org:acme:private': {'include': [], 'exclude': ['CF']},
+    }
+    with pytest.raises(Exception):
+        parse_target_rules(['owner/repo'])
+
+
+def test_per_target_rules_narrow_uploads(tmp_path, fake_session):
+    env_file = tmp_path / '.env'
+    env_file.write_text('PROD_DB=1\nSTAGING_DB=2\nSHARED=3\n')
+
+    secrets_uploader.upload_secrets(
+        str(env_file), 'owner/repo', 'token', manifest_path=tmp_path / 'manifest.json',
+        targets=['env:owner/repo/prod'],
+        target_rules=parse_target_rules(exclude_rules=['env:owner/repo/prod=STAGING_*']))
+
+    env_api = 'https://api.github.com/repos/owner/repo/environments/prod/secrets'
+    assert sorted(fake_session.remote[API]) == ['PROD_DB', 'SHARED', 'STAGING_DB']
+    assert sorted(fake_session.remote[env_api]) == ['PROD_DB', 'SHARED']
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Tests for plugins/inventory/servers_config.py | servers_config inventory 插件单元测试
+
+Coverage:
+  - A *.servers_config.yml source yields the same groups and host vars as generate_local_inventory
+  - The second parse is served from the parsed-config cache instead of re-reading the YAML
+  - The snapshot option loads a JSON snapshot as-is
+  - A malformed servers-config.yml is reported as AnsibleParserError naming the file
+
+Run:
+    python -m pytest tests/test_servers_config_plugin.py -v
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+import yaml
+
+pytest.importorskip('ansible')
+
+from ansible.errors import AnsibleParserError
+from ansible.inventory.manager import InventoryManager
+from ansible.parsing.dataloader import DataLoader
+from ansible.plugins.loader import inventory_loader
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / 'tools'))
+
+import generate_inventory
+from generate_inventory import generate_inventory_json, generate_local_inventory
+
+inventory_loader.add_directory(str(ROOT / 'plugins' / 'inventory'))
+
+
+CONFIG = {
+    'global_vars': {'ssh_port': 22},
+    'group_definitions': {
+        'all_servers': {'vars': {'tier': 'all'}},
+        'web_servers': {'vars': {'http_port': 80}},
+    },
+    'production_servers': {
+        'jp-server': {
+            'env_var': 'JP_V4_IP',
+            'alias': 'jp-1',
+            'location': 'Tokyo',
+            'groups': ['all_servers', 'web_servers'],
+        },
+        'fr-server': {
+            'env_var': 'FR_V4_IP',
+            'groups': ['all_servers'],
+        },
+    },
+    'github_actions_servers': {},
+}
+
+
+def write_source(directory, **options):
+    source = directory / 'anixops.servers_config.yml'
+    source.write_text(yaml.safe_dump({'plugin': 'servers_config', **options}), encoding='utf-8')
+    return source
+
+
+def load(source):
+    return InventoryManager(loader=DataLoader(), sources=[str(source)], parse=False)
+
+
+def parse(source):
+    inventory = load(source)
+    inventory.parse_sources(cache=False)
+    return inventory
+
+
+def expected_layout(generated):
+    """Group -> sorted host names and host -> vars from a generated inventory dict."""
+    groups, hostvars = {}, {}
+    for group_name, group in generated['all']['children'].items():
+        groups[group_name] = sorted(group.get('hosts') or {})
+        for host_name, host_vars in (group.get('hosts') or {}).items():
+            hostvars.setdefault(host_name, {}).update(host_vars)
+    return groups, hostvars
+
+
+def plain(value):
+    """Strip Ansible's tagged str/dict subclasses for comparison."""
+    return json.loads(json.dumps(value))
+
+
+@pytest.fixture
+def config_dir(tmp_path):
+    (tmp_path / 'servers-config.yml').write_text(yaml.safe_dump(CONFIG), encoding='utf-8')
+    return tmp_path
+
+
+def test_groups_and_hostvars_match_generate_local_inventory(config_dir):
+    source = write_source(config_dir, config_file='servers-config.yml', cache_dir=str(config_dir / 'cache'))
+    inventory = parse(source)
+    groups, hostvars = expected_layout(generate_local_inventory(CONFIG))
+
+    for group_name, hosts in groups.items():
+        assert sorted(h.name for h in inventory.groups[group_name].get_hosts()) == hosts
+    for host_name, host_vars in hostvars.items():
+        actual = plain(inventory.get_host(host_name).get_vars())
+        assert {key: actual[key] for key in host_vars} == host_vars
+    assert plain(inventory.groups['web_servers'].get_vars()) == {'http_port': 80}
+
+
+def test_second_parse_is_served_from_cache(config_dir, monkeypatch):
+    cache_dir = config_dir / 'cache'
+    source = write_source(config_dir, config_file='servers-config.yml', cache_dir=str(cache_dir))
+    parses = []
+    parse_yaml = generate_inventory._parse_yaml
+    monkeypatch.setattr(generate_inventory, '_parse_yaml', lambda text: parses.append(text) or parse_yaml(text))
+
+    parse(source)
+    assert len(parses) == 1
+    assert [p.name for p in cache_dir.iterdir()][0].startswith('servers-config-')
+
+    second = parse(source)
+    assert len(parses) == 1
+    assert 'jp-server' in [h.name for h in second.groups['web_servers'].get_hosts()]
+
+
+def test_snapshot_option_loads_json(tmp_path):
+    generated = generate_local_inventory(CONFIG)
+    generated['all']['children']['web_servers']['hosts']['jp-server']['from_snapshot'] = True
+    (tmp_path / 'hosts.json').write_text(generate_inventory_json(generated), encoding='utf-8')
+    source = write_source(tmp_path, snapshot='hosts.json')
+
+    inventory = parse(source)
+
+    assert inventory.get_host('jp-server').get_vars()['from_snapshot'] is True
+    assert sorted(h.name for h in inventory.groups['all_servers'].get_hosts()) == ['fr-server', 'jp-server']
+
+
+def test_malformed_config_names_the_file(config_dir):
+    (config_dir / 'servers-config.yml').write_text('production_servers: [unclosed\n', encoding='utf-8')
+    source = write_source(config_dir, config_file='servers-config.yml', cache_dir=str(config_dir / 'cache'))
+
+    # Call the plugin directly: InventoryManager would downgrade the error to a warning
+    module = inventory_loader.get('servers_config')
+    with pytest.raises(AnsibleParserError, match='servers-config.yml'):
+        module.parse(load(source)._inventory, DataLoader(), str(source), cache=False)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
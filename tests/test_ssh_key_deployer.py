@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Tests for ssh_key_deployer.py | ssh_key_deployer.py 单元测试
+
+Coverage:
+  - Rollout runs hosts concurrently up to the parallelism limit, results in input order
+  - Per-host failures and timeouts are reported without stopping the rollout
+  - Targets are read from servers-config.yml with env filters
+  - The default deploy path, including the single-host --host command, uses one connection and one idempotent remote command
+  - Key rotation pushes, verifies with the new key, removes the old key and resumes from its state file
+  - Connections are checked against the managed known_hosts; unknown hosts fail until accepted
+  - Repeated operations on a host borrow one pooled connection; rotation never reuses the old-key login
+
+Run:
+    python -m pytest tests/test_ssh_key_deployer.py -v
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('paramiko')
+pytest.importorskip('scp')
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'tools'))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import ssh_key_deployer
+from fake_ssh_server import FakeSSHServer
+from known_hosts import KnownHosts
+from ssh_pool import SSHPool
+from ssh_key_deployer import (
+    RotationState,
+    ensure_host_keys,
+    hosts_from_config,
+    install_key_paramiko,
+    parse_host_port,
+    rollout_keys,
+    rotate_keys,
+)
+
+PUBLIC_KEY = 'ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIBnewkey deploy@anixops'
+
+CONFIG = """
+production_servers:
+  web-1:
+    env_var: WEB_1_V4_SSH
+    groups: [web_servers]
+    server_environment: production
+  web-2:
+    env_var: WEB_2_V4_SSH
+    groups: [web_servers]
+    server_environment: test
+  db-1:
+    env_var: DB_1_V4_SSH
+    groups: [databases]
+    server_environment: production
+"""
+
+
+@pytest.fixture
+def no_sshpass(monkeypatch):
+    monkeypatch.setattr(ssh_key_deployer.shutil, 'which', lambda name: None)
+
+
+@pytest.fixture(autouse=True)
+def pool(monkeypatch):
+    """Give every test its own connection pool so no connection outlives its fake server"""
+    pool = SSHPool(ssh_key_deployer.connect_ssh)
+    monkeypatch.setattr(ssh_key_deployer, 'POOL', pool)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def trust(tmp_path, monkeypatch):
+    """Point the deployer at a temporary known_hosts and return a function that pins a fake server"""
+    path = tmp_path / 'known_hosts'
+    monkeypatch.setattr(ssh_key_deployer, 'KNOWN_HOSTS_FILE', str(path))
+
+    def trust_server(server):
+        known = KnownHosts(path)
+        known.set('127.0.0.1', server.port, {server.host_key.get_name(): server.host_key.get_base64()})
+        known.save()
+    return trust_server
+
+
+def targets(count):
+    return [{'name': f"host-{i}", 'host': f"10.0.0.{i}", 'port': 22} for i in range(count)]
+
+
+def test_rollout_is_concurrent_and_ordered(monkeypatch, no_sshpass):
+    lock = threading.Lock()
+    active = [0, 0]
+
+    def install(host, port, username, password, public_key, timeout):
+        with lock:
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return 'present' if host.endswith('.3') else 'added'
+
+    monkeypatch.setattr(ssh_key_deployer, 'install_key_paramiko', install)
+    streamed = []
+
+    start = time.monotonic()
+    results = rollout_keys(targets(12), 'root', 'pw', 'ssh-ed25519 AAAA', parallelism=4,
+                           on_result=streamed.append)
+
+    assert time.monotonic() - start < 0.05 * 12 / 2
+    assert active[1] == 4
+    assert [r['name'] for r in results] == [f"host-{i}" for i in range(12)]
+    assert len(streamed) == 12
+    assert all(r['ok'] and r['method'] == 'paramiko' for r in results)
+    assert results[3]['status'] == 'present'
+
+
+def test_rollout_reports_failures_and_passes_remaining_timeout(monkeypatch, no_sshpass):
+    timeouts = []
+
+    def install(host, port, username, password, public_key, timeout):
+        timeouts.append(timeout)
+        if host.endswith('.1'):
+            raise ssh_key_deployer.paramiko.AuthenticationException()
+        if host.endswith('.2'):
+            raise TimeoutError('timed out')
+        return 'added'
+
+    monkeypatch.setattr(ssh_key_deployer, 'install_key_paramiko', install)
+
+    results = rollout_keys(targets(3), 'root', 'pw', 'key', timeout=7)
+
+    assert [r['ok'] for r in results] == [True, False, False]
+    assert '认证失败' in results[1]['error']
+    assert results[2]['error'] == 'TimeoutError: timed out'
+    assert all(0 < t <= 7 for t in timeouts)
+
+
+def test_parse_host_port():
+    assert parse_host_port('203.0.113.10') == ('203.0.113.10', 22)
+    assert parse_host_port('203.0.113.10:2222') == ('203.0.113.10', 2222)
+    assert parse_host_port('2001:db8::1') == ('2001:db8::1', 22)
+    assert parse_host_port('[2001:db8::1]:2222') == ('2001:db8::1', 2222)
+
+
+def test_hosts_from_config_filters_and_strips_cidr(tmp_path):
+    config = tmp_path / 'servers-config.yml'
+    config.write_text(CONFIG)
+    environ = {'WEB_1_V4_SSH': '203.0.113.10/31', 'WEB_2_V4_SSH': '203.0.113.11', 'ANSIBLE_PORT': '2222'}
+
+    hosts, missing = hosts_from_config(str(config), environ=environ)
+    assert [h['host'] for h in hosts] == ['203.0.113.10', '203.0.113.11']
+    assert hosts[0]['port'] == 2222
+    assert missing == ['db-1']
+
+    hosts, missing = hosts_from_config(str(config), environ=environ, server_environments=['production'],
+                                       groups=['web_servers'])
+    assert [h['name'] for h in hosts] == ['web-1']
+    assert missing == []
+
+
+def test_single_connection_install_is_idempotent(tmp_path, trust):
+    (tmp_path / '.ssh').mkdir()
+    (tmp_path / '.ssh' / 'authorized_keys').write_text('ssh-rsa AAAAold old@host')  # no trailing newline
+
+    with FakeSSHServer(tmp_path) as server:
+        trust(server)
+        assert install_key_paramiko('127.0.0.1', server.port, 'root', 'secret', PUBLIC_KEY) == 'added'
+        assert install_key_paramiko('127.0.0.1', server.port, 'root', 'secret', PUBLIC_KEY) == 'present'
+        # The second install borrows the pooled connection instead of logging in again
+        assert server.connections == 1
+        assert len(server.commands) == 2
+
+    authorized = tmp_path / '.ssh' / 'authorized_keys'
+    assert authorized.read_text() == f"ssh-rsa AAAAold old@host\n{PUBLIC_KEY}\n"
+    assert authorized.stat().st_mode & 0o777 == 0o600
+    assert (tmp_path / '.ssh').stat().st_mode & 0o777 == 0o700
+
+
+def test_rollout_against_ssh_server_skips_ssh_copy_id(tmp_path, monkeypatch, trust):
+    monkeypatch.setattr(ssh_key_deployer.subprocess, 'run',
+                        lambda *a, **k: pytest.fail('no local subprocess expected'))
+
+    with FakeSSHServer(tmp_path) as server:
+        trust(server)
+        hosts = [{'name': f"h{i}", 'host': '127.0.0.1', 'port': server.port} for i in range(3)]
+        # All three targets share one HOME, so run them one at a time for a deterministic result
+        results = rollout_keys(hosts, 'root', 'secret', PUBLIC_KEY, key_file='/unused.pub', parallelism=1)
+        bad = rollout_keys(hosts[:1], 'root', 'wrong', PUBLIC_KEY, timeout=5)
+
+    assert [r['status'] for r in results] == ['added', 'present', 'present']
+    # Three targets with the same host/port/user/password share one login; the bad password needs its own
+    assert server.connections == 2
+    assert (tmp_path / '.ssh' / 'authorized_keys').read_text() == PUBLIC_KEY + '\n'
+    assert not bad[0]['ok'] and '认证失败' in bad[0]['error']
+
+
+def test_single_host_command_uses_paramiko_without_ssh_copy_id(tmp_path, monkeypatch, trust):
+    monkeypatch.setattr(ssh_key_deployer.subprocess, 'run',
+                        lambda *a, **k: pytest.fail('no local subprocess expected'))
+    monkeypatch.setattr(ssh_key_deployer.getpass, 'getpass', lambda prompt='': 'secret')
+    key_file = tmp_path / 'id_rsa.pub'
+    key_file.write_text(PUBLIC_KEY + '\n')
+
+    with FakeSSHServer(tmp_path) as server:
+        trust(server)
+        monkeypatch.setattr(sys, 'argv', ['ssh_key_deployer.py', '--key-file', str(key_file),
+                                          '--host', '127.0.0.1', '--port', str(server.port),
+                                          '--known-hosts', str(tmp_path / 'known_hosts')])
+        with pytest.raises(SystemExit) as exit_info:
+            ssh_key_deployer.main()
+
+    assert exit_info.value.code == 0
+    assert server.connections == 1
+    assert (tmp_path / '.ssh' / 'authorized_keys').read_text() == PUBLIC_KEY + '\n'
+
+
+def make_keypair(directory, name):
+    key = ssh_key_deployer.paramiko.RSAKey.generate(1024)
+    private = directory / name
+    key.write_private_key_file(str(private))
+    return str(private), f"ssh-rsa {key.get_base64()} {name}@anixops"
+
+
+def test_unknown_host_is_rejected_until_accepted(tmp_path, trust):
+    hosts_file = tmp_path / 'known_hosts'
+
+    with FakeSSHServer(tmp_path) as server, FakeSSHServer(tmp_path) as impostor:
+        hosts = [{'name': 'web-1', 'host': '127.0.0.1', 'port': server.port}]
+        rejected = rollout_keys(hosts, 'root', 'secret', PUBLIC_KEY, timeout=5)
+        assert server.connections == 0
+
+        assert ensure_host_keys(hosts, assume_yes=True, timeout=5) == 1
+        assert ensure_host_keys(hosts, assume_yes=True, timeout=5) == 0
+        accepted = rollout_keys(hosts, 'root', 'secret', PUBLIC_KEY, timeout=5)
+
+        # Pin the impostor's port to the real server's key: the mismatch must be refused
+        known = KnownHosts(hosts_file)
+        known.set('127.0.0.1', impostor.port, known.lookup('127.0.0.1', server.port))
+        known.save()
+        spoofed = rollout_keys([{'name': 'web-1', 'host': '127.0.0.1', 'port': impostor.port}],
+                               'root', 'secret', PUBLIC_KEY, timeout=5)
+
+    assert not rejected[0]['ok'] and 'known_hosts' in rejected[0]['error']
+    assert accepted[0]['ok']
+    assert not spoofed[0]['ok'] and 'BadHostKeyException' in spoofed[0]['error']
+    assert not impostor.commands
+
+
+def test_rotation_replaces_old_key_and_resumes(tmp_path, trust, pool):
+    home, keys = tmp_path / 'home', tmp_path / 'keys'
+    home.mkdir()
+    keys.mkdir()
+    old_file, old_pub = make_keypair(keys, 'old')
+    new_file, new_pub = make_keypair(keys, 'new')
+    (home / '.ssh').mkdir()
+    (home / '.ssh' / 'authorized_keys').write_text(f"ssh-rsa AAAAother other@host\n{old_pub}\n")
+    state_path = tmp_path / 'rotate.json'
+
+    with FakeSSHServer(home) as server:
+        trust(server)
+        hosts = [{'name': 'web-1', 'host': '127.0.0.1', 'port': server.port}]
+        state = RotationState(state_path, old_pub, new_pub)
+        results = rotate_keys(hosts, 'root', old_pub, new_pub, new_file, state, old_key_file=old_file)
+        connections = server.connections
+
+        resumed = rotate_keys(hosts, 'root', old_pub, new_pub, new_file,
+                              RotationState(state_path, old_pub, new_pub), old_key_file=old_file)
+
+    assert results[0]['ok'] and results[0]['step'] == 'done'
+    assert connections == 2
+    # The old-key login was revoked by the rotation, so only the new-key connection stays pooled
+    assert pool.idle_count() == 1
+    assert (home / '.ssh' / 'authorized_keys').read_text() == f"ssh-rsa AAAAother other@host\n{new_pub}\n"
+    assert resumed[0]['skipped'] and server.connections == connections
+    with pytest.raises(Exception):
+        RotationState(state_path, old_pub, make_keypair(keys, 'other')[1])
+
+
+def test_rotation_keeps_old_key_when_new_key_cannot_log_in(tmp_path, trust):
+    home, keys = tmp_path / 'home', tmp_path / 'keys'
+    home.mkdir()
+    keys.mkdir()
+    old_file, old_pub = make_keypair(keys, 'old')
+    new_file, new_pub = make_keypair(keys, 'new')
+    wrong_file, _ = make_keypair(keys, 'wrong')
+    (home / '.ssh').mkdir()
+    (home / '.ssh' / 'authorized_keys').write_text(old_pub + '\n')
+    state = RotationState(tmp_path / 'rotate.json', old_pub, new_pub)
+
+    with FakeSSHServer(home) as server:
+        trust(server)
+        hosts = [{'name': 'web-1', 'host': '127.0.0.1', 'port': server.port}]
+        failed = rotate_keys(hosts, 'root', old_pub, new_pub, wrong_file, state, old_key_file=old_file, timeout=5)
+        assert not failed[0]['ok'] and failed[0]['step'] == 'pushed'
+        assert state.step('web-1') == 'pushed'
+        assert old_pub in (home / '.ssh' / 'authorized_keys').read_text()
+
+        retried = rotate_keys(hosts, 'root', old_pub, new_pub, new_file, state, old_key_file=old_file)
+
+    assert retried[0]['ok']
+    assert (home / '.ssh' / 'authorized_keys').read_text() == new_pub + '\n'
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
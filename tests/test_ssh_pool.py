@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for ssh_pool.py | ssh_pool.py 单元测试
+
+Coverage:
+  - Borrowing the same host/port/user/credential reuses one authenticated transport
+  - Different credentials and fresh=True always open their own connection
+  - Connections that raised, died or sat idle past idle_timeout are not handed out again
+  - Keepalive is enabled on new transports; idle connections per key are capped
+
+Run:
+    python -m pytest tests/test_ssh_pool.py -v
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+paramiko = pytest.importorskip('paramiko')
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'tools'))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fake_ssh_server import FakeSSHServer
+from known_hosts import KnownHosts
+from ssh_pool import SSHPool, is_alive, open_client
+
+
+@pytest.fixture
+def server(tmp_path):
+    with FakeSSHServer(tmp_path) as server:
+        known = KnownHosts(tmp_path / 'known_hosts')
+        known.set('127.0.0.1', server.port, {server.host_key.get_name(): server.host_key.get_base64()})
+        known.save()
+        server.known_hosts = str(known.path)
+        yield server
+
+
+def make_pool(server, **kwargs):
+    def connect(host, port, username, **kw):
+        return open_client(host, port, username, known_hosts_file=server.known_hosts, **kw)
+    return SSHPool(connect, **kwargs)
+
+
+def run(ssh, command):
+    _, stdout, _ = ssh.exec_command(command)
+    return stdout.read().decode().strip()
+
+
+def test_same_key_reuses_one_transport(server):
+    with make_pool(server) as pool:
+        for step in ('one', 'two', 'three'):
+            with pool.connection('127.0.0.1', server.port, 'root', password='secret') as ssh:
+                assert run(ssh, f"echo {step}") == step
+
+        assert server.connections == 1
+        assert (pool.created, pool.reused) == (1, 2)
+
+        with pool.connection('127.0.0.1', server.port, 'root', password='secret', fresh=True):
+            pass
+        with pytest.raises(paramiko.AuthenticationException):
+            with pool.connection('127.0.0.1', server.port, 'root', password='wrong', timeout=5):
+                pass
+        assert server.connections == 3
+        assert pool.idle_count() == 2
+
+
+def test_failed_dead_and_idle_connections_are_not_reused(server):
+    with make_pool(server, idle_timeout=0.2) as pool:
+        with pytest.raises(RuntimeError):
+            with pool.connection('127.0.0.1', server.port, 'root', password='secret') as failed:
+                raise RuntimeError('step failed')
+        assert not is_alive(failed) and pool.idle_count() == 0
+
+        with pool.connection('127.0.0.1', server.port, 'root', password='secret') as dead:
+            pass
+        dead.get_transport().close()
+        with pool.connection('127.0.0.1', server.port, 'root', password='secret') as idle:
+            assert idle is not dead
+
+        time.sleep(0.3)
+        with pool.connection('127.0.0.1', server.port, 'root', password='secret') as ssh:
+            assert ssh is not idle
+        assert not is_alive(idle)
+        assert server.connections == 4 and pool.reused == 0
+
+
+def test_keepalive_and_idle_cap_under_concurrency(server, monkeypatch):
+    intervals = []
+    set_keepalive = paramiko.Transport.set_keepalive
+    monkeypatch.setattr(paramiko.Transport, 'set_keepalive',
+                        lambda self, interval: intervals.append(interval) or set_keepalive(self, interval))
+    barrier = threading.Barrier(4)
+
+    with make_pool(server, keepalive=5, max_idle=2) as pool:
+        def borrow():
+            with pool.connection('127.0.0.1', server.port, 'root', password='secret') as ssh:
+                barrier.wait(timeout=5)
+                run(ssh, 'true')
+
+        threads = [threading.Thread(target=borrow) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert server.connections == 4
+        assert intervals == [5] * 4
+        assert pool.idle_count() == 2
+
+        pool.discard('127.0.0.1', server.port, 'root', password='secret')
+        assert pool.idle_count() == 0
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
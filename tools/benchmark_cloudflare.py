@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Cloudflare Benchmark - 针对本地 Fake Cloudflare API 测量 cloudflare_manager 批量写入吞吐
+Measure cloudflare_manager bulk DNS throughput against the local fake API
+
+场景 | Scenarios:
+    upsert     逐条 upsert_dns_record（每条记录一次查询 + 一次写入，串行）
+    reconcile  reconcile_dns_records（一次分页拉取，本地比较，并发写入差异）
+
+使用方法 | Usage:
+    python tools/benchmark_cloudflare.py
+    python tools/benchmark_cloudflare.py --records 1000 --changes 0.3 --workers 1,8,16 --latency 0.02
+    python tools/benchmark_cloudflare.py --server-rate 20 --burst 20 --client-rate 18
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from cloudflare_manager import CloudflareManager
+from fake_cloudflare_api import FakeCloudflareAPI
+
+
+SCENARIOS = ('upsert', 'reconcile')
+
+
+def make_desired(zone: str, num_records: int, changes: float, new_records: int) -> List[Dict[str, Any]]:
+    """生成期望记录：前 changes 比例的预置记录改 IP，另追加 new_records 条新记录"""
+    changed = int(num_records * changes)
+    desired = []
+    for i in range(num_records):
+        content = f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}"
+        if i < changed:
+            content = f"172.16.{i // 256 % 256}.{i % 256}"
+        desired.append({'type': 'A', 'name': f"host-{i:05d}.{zone}", 'content': content, 'proxied': False})
+    for i in range(new_records):
+        desired.append({'type': 'A', 'name': f"new-{i:05d}.{zone}",
+                        'content': f"192.168.{i // 256 % 256}.{i % 256}", 'proxied': False})
+    return desired
+
+
+def run_scenario(scenario: str, num_records: int, changes: float, new_records: int, workers: int,
+                 latency: float, server_rate: Optional[float], burst: int,
+                 client_rate: Optional[float], zone: str = 'example.com') -> Dict[str, Any]:
+    """在全新的 Fake API 上运行一个场景，返回耗时与请求统计"""
+    with FakeCloudflareAPI(rate_limit=server_rate, burst=burst, latency=latency) as api:
+        zone_id = api.state.seed(zone, num_records)
+        desired = make_desired(zone, num_records, changes, new_records)
+        manager = CloudflareManager(api_token='benchmark', base_url=api.url, rate_limit=client_rate,
+                                    burst=burst, max_workers=workers, pool_size=max(workers, 1))
+        try:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                if scenario == 'upsert':
+                    for record in desired:
+                        manager.upsert_dns_record(zone_id, record['type'], record['name'],
+                                                  record['content'], record['proxied'])
+                    writes = len(desired)
+                    failed = 0
+                else:
+                    results = manager.reconcile_dns_records(zone_id, desired)['results']
+                    writes = len(results)
+                    failed = sum(1 for r in results if not r['ok'])
+            seconds = time.perf_counter() - start
+        finally:
+            manager.close()
+
+        client = manager.get_request_stats()
+        server = api.state.snapshot_stats()
+    return {
+        'scenario': scenario,
+        'workers': workers if scenario == 'reconcile' else 1,
+        'records': len(desired),
+        'writes': writes,
+        'failed': failed,
+        'seconds': seconds,
+        'requests': client['requests'],
+        'retries': client['retries'],
+        'rate_limited': server['rate_limited'],
+        'records_per_second': len(desired) / seconds if seconds else 0.0,
+    }
+
+
+def print_table(rows: List[Dict[str, Any]]):
+    """打印结果表"""
+    print(f"{'scenario':<10}  {'workers':>7}  {'records':>7}  {'writes':>6}  {'requests':>8}  "
+          f"{'429s':>5}  {'time (s)':>9}  {'rec/s':>8}")
+    print('-' * 76)
+    for row in rows:
+        print(f"{row['scenario']:<10}  {row['workers']:>7}  {row['records']:>7}  {row['writes']:>6}  "
+              f"{row['requests']:>8}  {row['rate_limited']:>5}  {row['seconds']:>9.3f}  "
+              f"{row['records_per_second']:>8.1f}")
+
+
+def parse_ints(value: str) -> List[int]:
+    """解析逗号分隔的整数列表"""
+    try:
+        return [int(v) for v in value.split(',') if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid list: {value}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Cloudflare 批量 DNS 性能基准 | Bulk DNS benchmark")
+    parser.add_argument('--records', type=int, default=200, help='预置记录数（默认: 200）')
+    parser.add_argument('--changes', type=float, default=0.5, help='需要修改 IP 的记录比例（默认: 0.5）')
+    parser.add_argument('--new', type=int, default=20, help='新增记录数（默认: 20）')
+    parser.add_argument('--workers', type=parse_ints, default=[1, 8, 16],
+                        help='reconcile 并发数列表（默认: 1,8,16）')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"运行的场景（默认: {','.join(SCENARIOS)}）")
+    parser.add_argument('--latency', type=float, default=0.01, help='模拟每个请求的服务端延迟，秒（默认: 0.01）')
+    parser.add_argument('--server-rate', type=float, help='Fake API 每秒请求上限（默认: 不限速）')
+    parser.add_argument('--burst', type=int, default=10, help='服务端/客户端令牌桶容量（默认: 10）')
+    parser.add_argument('--client-rate', type=float, help='客户端令牌桶速率（默认: 不限速）')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    rows = []
+    for scenario in scenarios:
+        for workers in (args.workers if scenario == 'reconcile' else [1]):
+            rows.append(run_scenario(scenario, args.records, args.changes, args.new, workers,
+                                     args.latency, args.server_rate, args.burst, args.client_rate))
+
+    if args.json:
+        json.dump(rows, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"latency: {args.latency}s, server rate: {args.server_rate or 'unlimited'}, "
+              f"client rate: {args.client_rate or 'unlimited'}\n")
+        print_table(rows)
+
+    if any(row['failed'] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
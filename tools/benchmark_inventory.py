@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Inventory Benchmark - 使用合成服务器配置测量 inventory 生成成本
+Measure inventory generation cost against synthetic servers-config.yml fleets
+
+使用方法 | Usage:
+    python tools/benchmark_inventory.py phases
+    python tools/benchmark_inventory.py phases --sizes 10,1000,10000,50000 --groups 300
+    python tools/benchmark_inventory.py phases --save-baseline .cache/inventory-bench.json
+    python tools/benchmark_inventory.py phases --baseline .cache/inventory-bench.json --tolerance 1.5
+    python tools/benchmark_inventory.py layout
+    python tools/benchmark_inventory.py layout --sizes 10,1000,10000 --groups-per-host 4
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+from generate_inventory import (
+    _parse_yaml,
+    load_config,
+    generate_local_inventory,
+    generate_github_actions_inventory,
+    generate_inventory_yaml,
+    share_host_vars,
+)
+
+
+# 按执行顺序列出的被测阶段 | Measured phases, in pipeline order
+PHASES = (
+    'load_config',
+    'generate_local_inventory',
+    'generate_github_actions_inventory',
+    'generate_inventory_yaml',
+)
+
+# 低于该耗时的阶段不参与基线比较（计时噪声大于差异）
+# Phases faster than this are too noisy to compare against a baseline
+MIN_COMPARABLE_SECONDS = 0.05
+
+
+def make_synthetic_config(num_hosts: int, num_groups: int = 20,
+                          groups_per_host: int = 3,
+                          github_actions_hosts: int = 0) -> Dict[str, Any]:
+    """生成与 servers-config.yml 结构一致的合成配置
+
+    每台主机按轮转方式分配到 groups_per_host 个组，保证各组规模均匀。
+    Hosts are spread round-robin over ``groups_per_host`` groups each so
+    group sizes stay even.
+    """
+    groups_per_host = max(1, min(groups_per_host, num_groups))
+    group_names = [f"group_{i:03d}" for i in range(num_groups)]
+
+    production_servers = {}
+    for i in range(num_hosts):
+        name = f"host-{i:05d}"
+        production_servers[name] = {
+            'env_var': f"HOST_{i:05d}_V4_SSH",
+            'alias': f"主机-{i} | Host-{i}",
+            'description': f"合成主机 {i} | Synthetic host {i}",
+            'location': f"Region {i % 17}",
+            'groups': [group_names[(i + k) % num_groups] for k in range(groups_per_host)],
+            'roles': ['web'],
+            'server_environment': 'production',
+        }
+
+    github_actions_servers = {}
+    for i in range(github_actions_hosts):
+        name = f"ci-{i:05d}"
+        github_actions_servers[name] = {
+            'secret_name': f"CI_{i:05d}_V4_SSH",
+            'alias': f"测试-{i} | Test-{i}",
+            'location': f"Region {i % 17}",
+            'groups': [group_names[(i + k) % num_groups] for k in range(groups_per_host)],
+            'roles': ['web'],
+            'server_environment': 'production',
+        }
+
+    return {
+        'github_actions_servers': github_actions_servers,
+        'production_servers': production_servers,
+        'group_definitions': {
+            name: {'description': f"Synthetic {name}", 'vars': {'server_role': name}}
+            for name in group_names
+        },
+        'global_vars': {
+            'ansible_python_interpreter': '/usr/bin/python3',
+            'ansible_ssh_common_args': '-o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null',
+        },
+    }
+
+
+def timed(func: Callable, *args, **kwargs) -> Tuple[Any, float]:
+    """执行函数并返回 (结果, 耗时秒数)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def write_synthetic_config(path: Path, config: Dict[str, Any]):
+    """将合成配置写成 servers-config.yml 文件（优先使用 C 加速的 dumper）"""
+    dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+    with open(path, 'w', encoding='utf-8') as f:
+        yaml.dump(config, f, Dumper=dumper, allow_unicode=True, sort_keys=False)
+
+
+def traced_peak(func: Callable, *args, **kwargs) -> int:
+    """执行函数并返回 tracemalloc 统计的峰值内存（字节）"""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_phases(sizes: List[int], num_groups: int, groups_per_host: int,
+                 measure_memory: bool = True) -> List[Dict[str, Any]]:
+    """分别测量 inventory 流水线各阶段的耗时与峰值内存
+
+    计时与内存统计分两轮执行，避免 tracemalloc 的开销污染计时结果。
+    Timing and memory are measured in separate passes so tracemalloc
+    overhead does not skew the timings.
+    """
+    rows = []
+    with tempfile.TemporaryDirectory(prefix='anixops-inventory-bench-') as workdir:
+        for size in sizes:
+            config_path = Path(workdir) / f"servers-config-{size}.yml"
+            write_synthetic_config(config_path, make_synthetic_config(
+                size, num_groups, groups_per_host, github_actions_hosts=max(1, size // 50)))
+
+            config, load_seconds = timed(load_config, str(config_path))
+            local, local_seconds = timed(generate_local_inventory, config)
+            _, github_seconds = timed(generate_github_actions_inventory, config, use_secrets=True)
+            _, yaml_seconds = timed(generate_inventory_yaml, local)
+            seconds = dict(zip(PHASES, (load_seconds, local_seconds, github_seconds, yaml_seconds)))
+
+            peaks: Dict[str, Optional[int]] = dict.fromkeys(PHASES)
+            if measure_memory:
+                peaks['load_config'] = traced_peak(load_config, str(config_path))
+                peaks['generate_local_inventory'] = traced_peak(generate_local_inventory, config)
+                peaks['generate_github_actions_inventory'] = traced_peak(
+                    generate_github_actions_inventory, config, use_secrets=True)
+                peaks['generate_inventory_yaml'] = traced_peak(generate_inventory_yaml, local)
+
+            for phase in PHASES:
+                rows.append({
+                    'hosts': size,
+                    'groups': num_groups,
+                    'phase': phase,
+                    'seconds': seconds[phase],
+                    'peak_bytes': peaks[phase],
+                })
+    return rows
+
+
+def compare_to_baseline(rows: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+                        tolerance: float) -> List[str]:
+    """与基线比较，返回超出容差的回归项描述"""
+    reference = {(row['hosts'], row['phase']): row for row in baseline}
+    regressions = []
+    for row in rows:
+        base = reference.get((row['hosts'], row['phase']))
+        if not base:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if row[metric] is None or not base.get(metric):
+                continue
+            if metric == 'seconds' and base[metric] < MIN_COMPARABLE_SECONDS:
+                continue
+            if row[metric] > base[metric] * tolerance:
+                regressions.append(
+                    f"{row['phase']} @ {row['hosts']} hosts: {metric} "
+                    f"{row[metric]:.4g} > {base[metric]:.4g} x {tolerance}"
+                )
+    return regressions
+
+
+def print_phase_table(rows: List[Dict[str, Any]]):
+    """打印各阶段耗时与内存表"""
+    print(f"{'hosts':>8}  {'phase':<34}  {'time (s)':>9}  {'peak (MiB)':>10}")
+    print('-' * 68)
+    for row in rows:
+        peak = f"{row['peak_bytes'] / 1024 / 1024:>10.1f}" if row['peak_bytes'] is not None else f"{'-':>10}"
+        print(f"{row['hosts']:>8}  {row['phase']:<34}  {row['seconds']:>9.3f}  {peak}")
+
+
+def bench_layouts(sizes: List[int], num_groups: int, groups_per_host: int) -> List[Dict[str, Any]]:
+    """对比 grouped 与 shared 布局的输出体积、生成与解析耗时"""
+    rows = []
+    for size in sizes:
+        inventory = generate_local_inventory(make_synthetic_config(size, num_groups, groups_per_host))
+        layouts = {'grouped': inventory, 'shared': share_host_vars(inventory)}
+        for layout, data in layouts.items():
+            text, emit_seconds = timed(generate_inventory_yaml, data)
+            _, parse_seconds = timed(_parse_yaml, text)
+            rows.append({
+                'hosts': size,
+                'layout': layout,
+                'bytes': len(text.encode('utf-8')),
+                'emit_seconds': emit_seconds,
+                'parse_seconds': parse_seconds,
+            })
+    return rows
+
+
+def print_layout_table(rows: List[Dict[str, Any]]):
+    """打印布局对比表"""
+    print(f"{'hosts':>8}  {'layout':<8}  {'size (KiB)':>11}  {'emit (s)':>9}  {'parse (s)':>9}")
+    print('-' * 54)
+    for row in rows:
+        print(f"{row['hosts']:>8}  {row['layout']:<8}  {row['bytes'] / 1024:>11.1f}  "
+              f"{row['emit_seconds']:>9.3f}  {row['parse_seconds']:>9.3f}")
+
+
+def parse_sizes(value: str) -> List[int]:
+    """解析逗号分隔的主机数量列表"""
+    try:
+        return [int(v) for v in value.split(',') if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size list: {value}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="Inventory 生成性能基准 | Inventory generation benchmark")
+    subparsers = parser.add_subparsers(dest='command')
+
+    phases_parser = subparsers.add_parser('phases', help='测量各阶段耗时与内存 | Time and trace each phase')
+    phases_parser.add_argument('--sizes', type=parse_sizes, default=[10, 1000, 10000, 50000],
+                               help='主机数量列表（默认: 10,1000,10000,50000）')
+    phases_parser.add_argument('--groups', type=int, default=200, help='组数量（默认: 200）')
+    phases_parser.add_argument('--groups-per-host', type=int, default=3,
+                               help='每台主机所属组数（默认: 3）')
+    phases_parser.add_argument('--no-memory', action='store_true',
+                               help='跳过 tracemalloc 内存统计 | Skip peak memory tracing')
+    phases_parser.add_argument('--save-baseline', metavar='PATH',
+                               help='将结果保存为 JSON 基线 | Save results as a JSON baseline')
+    phases_parser.add_argument('--baseline', metavar='PATH',
+                               help='与 JSON 基线比较，出现回归时退出码为 1 | Compare against a baseline')
+    phases_parser.add_argument('--tolerance', type=float, default=1.5,
+                               help='允许相对基线的倍数（默认: 1.5）| Allowed ratio over baseline')
+
+    layout_parser = subparsers.add_parser('layout', help='对比 grouped/shared 布局 | Compare host vars layouts')
+    layout_parser.add_argument('--sizes', type=parse_sizes, default=[10, 1000, 10000],
+                               help='主机数量列表（默认: 10,1000,10000）')
+    layout_parser.add_argument('--groups', type=int, default=20, help='组数量（默认: 20）')
+    layout_parser.add_argument('--groups-per-host', type=int, default=3,
+                               help='每台主机所属组数（默认: 3）')
+
+    args = parser.parse_args()
+
+    if args.command == 'phases':
+        rows = bench_phases(args.sizes, args.groups, args.groups_per_host,
+                            measure_memory=not args.no_memory)
+        print_phase_table(rows)
+
+        if args.save_baseline:
+            Path(args.save_baseline).parent.mkdir(parents=True, exist_ok=True)
+            with open(args.save_baseline, 'w', encoding='utf-8') as f:
+                json.dump(rows, f, indent=2)
+            print(f"\n✓ Baseline saved: {args.save_baseline}")
+
+        if args.baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                regressions = compare_to_baseline(rows, json.load(f), args.tolerance)
+            if regressions:
+                print("\n✗ Regressions detected:")
+                for line in regressions:
+                    print(f"  - {line}")
+                sys.exit(1)
+            print("\n✓ No regressions against baseline")
+    elif args.command == 'layout':
+        loader = 'CSafeLoader' if hasattr(yaml, 'CSafeLoader') else 'SafeLoader'
+        print(f"YAML loader: {loader}, groups: {args.groups}, groups per host: {args.groups_per_host}\n")
+        print_layout_table(bench_layouts(args.sizes, args.groups, args.groups_per_host))
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,11 +10,46 @@ Cloudflare DNS & Proxy Manager
 """
 
 import os
+import re
 import sys
 import json
+import time
+import hashlib
+import threading
 import requests
 import argparse
-from typing import Dict, List, Optional
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from env_file import load_env_file
+from generate_inventory import DEFAULT_CONFIG_FILE, _parse_yaml, atomic_output, load_config_cached
+
+# Zone 列表缓存与区域快照（默认位于项目根目录 .cache/ 下，已被 .gitignore 忽略）
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'cloudflare')
+DEFAULT_ZONE_CACHE = os.path.join(CACHE_DIR, 'zones.json')
+ZONE_CACHE_VERSION = 1
+DEFAULT_ZONE_CACHE_TTL = 3600
+
+# 声明式 DNS 状态文件与区域快照的格式版本
+DNS_STATE_VERSION = 1
+ZONE_SNAPSHOT_VERSION = 1
+
+# 故障转移：默认从 roles/prometheus 部署的 Prometheus 读取 node_exporter 的 up 指标
+DEFAULT_PROMETHEUS_URL = 'http://localhost:9090'
+DEFAULT_HEALTH_QUERY = 'up{job="node_exporter"}'
+
+# 服务域名环境变量 -> 优先承载该服务的角色（按顺序匹配 servers-config.yml 中的 roles）
+SERVICE_DOMAINS = {
+    'GRAFANA_DOMAIN': ('grafana', 'observability'),
+    'PROMETHEUS_DOMAIN': ('prometheus', 'observability'),
+    'LOKI_DOMAIN': ('loki', 'observability'),
+}
+
+# Zone ID 为 32 位十六进制字符串
+ZONE_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
 
 # ANSI 颜色代码
 class Colors:
@@ -36,14 +71,474 @@ def print_header(message: str):
     print_colored(f"  {message}", Colors.BOLD + Colors.CYAN)
     print_colored(f"{'='*60}\n", Colors.CYAN)
 
+def normalize_record(record: Dict) -> Dict:
+    """规范化 DNS 记录用于比较：类型大写、名称小写、代理记录 TTL 固定为 1"""
+    proxied = bool(record.get('proxied', False))
+    return {
+        'type': str(record['type']).upper(),
+        'name': str(record['name']).lower().rstrip('.'),
+        'content': str(record['content']),
+        'proxied': proxied,
+        'ttl': 1 if proxied else int(record.get('ttl', 1)),
+    }
+
+def index_dns_records(records: List[Dict]) -> Dict[Tuple[str, str], List[Dict]]:
+    """按 (类型, 名称) 建立现有记录索引"""
+    index: Dict[Tuple[str, str], List[Dict]] = {}
+    for record in records:
+        key = (record['type'].upper(), record['name'].lower().rstrip('.'))
+        index.setdefault(key, []).append(record)
+    return index
+
+def plan_dns_changes(desired: List[Dict], existing: List[Dict], prune: bool = False) -> List[Dict]:
+    """
+    在本地计算 DNS 变更计划（不发起任何 API 请求）
+    
+    同一 (类型, 名称) 下先按内容精确配对，剩余的期望记录复用剩余的现有记录做更新，
+    仍不足时创建；prune=True 时删除多余记录及期望类型中未声明的记录。
+    
+    Args:
+        desired: 期望的记录列表 (type, name, content, proxied, ttl)
+        existing: 区域内现有记录（list_all_dns_records 的结果）
+        prune: 是否删除未声明的记录
+        
+    Returns:
+        动作列表，action 为 create / update / delete / noop
+    """
+    index = index_dns_records(existing)
+    wanted: Dict[Tuple[str, str], List[Dict]] = {}
+    for record in desired:
+        record = normalize_record(record)
+        wanted.setdefault((record['type'], record['name']), []).append(record)
+    
+    plan = []
+    for key, records in wanted.items():
+        current = list(index.get(key, []))
+        pending = []
+        for record in records:
+            match = next((c for c in current if str(c.get('content')) == record['content']), None)
+            if match is None:
+                pending.append(record)
+                continue
+            current.remove(match)
+            action = 'noop' if normalize_record(match) == record else 'update'
+            plan.append({'action': action, **record, 'record_id': match['id'], 'current': match})
+        for record in pending:
+            if current:
+                match = current.pop(0)
+                plan.append({'action': 'update', **record, 'record_id': match['id'], 'current': match})
+            else:
+                plan.append({'action': 'create', **record, 'record_id': None, 'current': None})
+        if prune:
+            for match in current:
+                plan.append({'action': 'delete', **normalize_record(match),
+                             'record_id': match['id'], 'current': match})
+    
+    if prune:
+        managed_types = {key[0] for key in wanted}
+        for key, records in index.items():
+            if key in wanted or key[0] not in managed_types:
+                continue
+            for match in records:
+                plan.append({'action': 'delete', **normalize_record(match),
+                             'record_id': match['id'], 'current': match})
+    
+    return plan
+
+def delete_steps(records: List[Dict]) -> List[Dict]:
+    """把现有记录转换为 delete 计划项（供 apply_dns_plan 并发执行）"""
+    return [{'action': 'delete', **normalize_record(r), 'record_id': r['id'], 'current': r}
+            for r in records]
+
+def print_dns_results(results: List[Dict]):
+    """按计划顺序打印每条写操作的结果"""
+    for result in results:
+        step = result['step']
+        if not result['ok']:
+            print_colored(f"  ✗ {step['action']}: {step['name']} ({step['type']}) - {result['error']}", Colors.RED)
+        elif step['action'] == 'delete':
+            print_colored(f"  ✓ 已删除: {step['name']} ({step['type']})", Colors.GREEN)
+        else:
+            print_colored(f"  ✓ {step['name']} -> {step['content']}", Colors.GREEN)
+
+def write_json_atomic(path: str, data):
+    """原子写入 JSON 文件（自动创建目录）"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with atomic_output(path) as f:
+        json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+def _record_sort_key(record: Dict) -> Tuple:
+    return (record['name'], record['type'], record['content'], record.get('id') or '')
+
+def resolve_host_ips(config: Dict, environ: Dict[str, str],
+                     server_environments: Optional[List[str]] = None) -> Tuple[List[Tuple], List[str]]:
+    """
+    按 servers-config.yml 顺序解析主机 IP（取自 env_var，去除 CIDR 后缀）
+    
+    Returns:
+        ([(主机名, 主机配置, IP), ...], [缺少 IP 的主机名])
+    """
+    hosts = []
+    missing = []
+    for host_name, server in (config.get('production_servers') or {}).items():
+        if server_environments and server.get('server_environment') not in server_environments:
+            continue
+        value = environ.get(server.get('env_var', ''), '').strip()
+        if value:
+            hosts.append((host_name, server, value.split('/')[0]))
+        else:
+            missing.append(host_name)
+    return hosts, missing
+
+def service_candidates(hosts: List[Tuple], environ: Dict[str, str]) -> Dict[str, Dict]:
+    """
+    列出每个已配置服务域名的候选主机，按优先级排序
+    
+    先按 SERVICE_DOMAINS 中角色的顺序，再按 servers-config.yml 中主机的顺序；
+    第一个候选是首选目标，其余是故障转移的备选。
+    
+    Returns:
+        {环境变量名: {'domain': 域名, 'candidates': [(主机名, IP, 角色), ...]}}
+    """
+    services = {}
+    for env_name, roles in SERVICE_DOMAINS.items():
+        service_domain = environ.get(env_name)
+        if not service_domain:
+            continue
+        candidates = []
+        seen = set()
+        for role in roles:
+            for host_name, server, ip in hosts:
+                if role in (server.get('roles') or []) and host_name not in seen:
+                    seen.add(host_name)
+                    candidates.append((host_name, ip, role))
+        services[env_name] = {'domain': service_domain.lower().rstrip('.'), 'candidates': candidates}
+    return services
+
+def build_dns_state(config: Dict, domain: str, environ: Optional[Dict[str, str]] = None,
+                    server_environments: Optional[List[str]] = None) -> Dict:
+    """
+    从 servers-config.yml 生成声明式 DNS 状态
+    
+    - 每台主机一条 A 记录: <主机名>.<domain> -> env_var 中的 IP（不代理，保持 SSH 直连）
+    - GRAFANA/PROMETHEUS/LOKI_DOMAIN 指向第一台承载对应角色的主机（启用代理）
+    
+    记录按名称排序，相同输入总是生成相同的文件。
+    
+    Args:
+        config: load_config 的结果
+        domain: 主机记录所在的域名
+        environ: 环境变量（默认 os.environ）
+        server_environments: 只包含这些 server_environment 的主机（默认全部）
+        
+    Returns:
+        {'version', 'domain', 'records': [...], 'missing': [缺少 IP 的主机名]}
+    """
+    environ = os.environ if environ is None else environ
+    domain = domain.lower().rstrip('.')
+    hosts, missing = resolve_host_ips(config, environ, server_environments)
+    records = [{
+        'type': 'A',
+        'name': f"{host_name}.{domain}",
+        'content': ip,
+        'proxied': False,
+        'ttl': 1,
+        'source': f"host {host_name} ({server.get('alias', host_name)})",
+    } for host_name, server, ip in hosts]
+    
+    for env_name, service in service_candidates(hosts, environ).items():
+        if service['candidates']:
+            host_name, ip, role = service['candidates'][0]
+            records.append({
+                'type': 'A',
+                'name': service['domain'],
+                'content': ip,
+                'proxied': True,
+                'ttl': 1,
+                'source': f"service {env_name} -> {host_name} (role {role})",
+            })
+    
+    records.sort(key=_record_sort_key)
+    return {'version': DNS_STATE_VERSION, 'domain': domain, 'records': records, 'missing': sorted(missing)}
+
+def load_dns_state(path: str) -> Dict:
+    """读取 DNS 状态文件（YAML 或 JSON）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        state = _parse_yaml(f.read())
+    if not isinstance(state, dict) or state.get('version') != DNS_STATE_VERSION:
+        raise Exception(f"不支持的 DNS 状态文件: {path} (需要 version: {DNS_STATE_VERSION})")
+    return state
+
+def zone_snapshot_path(zone: str) -> str:
+    """区域快照的默认路径: .cache/cloudflare/zone-<zone>.json"""
+    return os.path.join(CACHE_DIR, f"zone-{re.sub(r'[^A-Za-z0-9.-]', '_', zone)}.json")
+
+def load_zone_snapshot(path: str) -> Optional[Dict]:
+    """读取区域快照，文件缺失或版本不符时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('version') != ZONE_SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+def save_zone_snapshot(path: str, zone_id: str, records: List[Dict], fetched_at: Optional[float] = None):
+    """保存区域快照（只保留比较需要的字段，按名称排序以便 diff）"""
+    fields = ('id', 'type', 'name', 'content', 'proxied', 'ttl')
+    write_json_atomic(path, {
+        'version': ZONE_SNAPSHOT_VERSION,
+        'zone_id': zone_id,
+        'fetched_at': time.time() if fetched_at is None else fetched_at,
+        'records': sorted(({k: r.get(k) for k in fields} for r in records), key=_record_sort_key),
+    })
+
+def apply_results_to_records(records: List[Dict], results: List[Dict]) -> List[Dict]:
+    """将成功的写操作合并进快照记录，使后续 plan 无需重新拉取"""
+    by_id = {r['id']: r for r in records}
+    created = []
+    for result in results:
+        if not result['ok']:
+            continue
+        step = result['step']
+        if step['action'] == 'delete':
+            by_id.pop(step['record_id'], None)
+            continue
+        record = {k: step[k] for k in ('type', 'name', 'content', 'proxied', 'ttl')}
+        record.update(result.get('record') or {})
+        record.setdefault('id', step['record_id'])
+        if step['action'] == 'create':
+            created.append(record)
+        else:
+            by_id[step['record_id']] = record
+    return list(by_id.values()) + created
+
+def print_dns_plan(plan: List[Dict]):
+    """打印变更计划"""
+    symbols = {
+        'create': ('✚', Colors.GREEN),
+        'update': ('⟳', Colors.YELLOW),
+        'delete': ('✗', Colors.RED),
+    }
+    changes = [step for step in plan if step['action'] != 'noop']
+    for step in changes:
+        symbol, color = symbols[step['action']]
+        detail = f"{step['name']} ({step['type']}) -> {step['content']} (代理: {'✓' if step['proxied'] else '✗'})"
+        if step['action'] == 'update':
+            detail += f"  [当前: {step['current'].get('content')}, 代理: {'✓' if step['current'].get('proxied') else '✗'}]"
+        print_colored(f"  {symbol} {step['action']}: {detail}", color)
+    unchanged = len(plan) - len(changes)
+    print_colored(f"\n  计划: {len(changes)} 项变更, {unchanged} 项无需变更", Colors.BLUE)
+
+class RequestStats:
+    """API 请求计数与延迟统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """清零统计"""
+        with self._lock:
+            self.requests = 0
+            self.retries = 0
+            self.rate_limited = 0
+            self.errors = 0
+            self.total_seconds = 0.0
+            self.max_seconds = 0.0
+            self.by_method: Dict[str, int] = {}
+
+    def record(self, method: str, seconds: float, ok: bool):
+        """记录一次 HTTP 往返"""
+        with self._lock:
+            self.requests += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.by_method[method] = self.by_method.get(method, 0) + 1
+            if not ok:
+                self.errors += 1
+
+    def record_retry(self, rate_limited: bool):
+        """记录一次重试"""
+        with self._lock:
+            self.retries += 1
+            if rate_limited:
+                self.rate_limited += 1
+
+    def snapshot(self) -> Dict:
+        """返回当前统计的副本"""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'rate_limited': self.rate_limited,
+                'errors': self.errors,
+                'total_seconds': round(self.total_seconds, 4),
+                'avg_ms': round(self.total_seconds / self.requests * 1000, 2) if self.requests else 0.0,
+                'max_ms': round(self.max_seconds * 1000, 2),
+                'by_method': dict(self.by_method),
+            }
+
+
+class ZoneIndex:
+    """
+    Zone 名称的后缀树（按标签倒序），查找复杂度为 O(域名标签数)
+    Suffix trie over zone names keyed on reversed labels; a lookup walks the
+    domain's labels once and returns the longest matching zone.
+    """
+
+    def __init__(self, zones: List[Dict]):
+        self._root: Dict = {}
+        for zone in zones:
+            node = self._root
+            for label in reversed(zone['name'].lower().rstrip('.').split('.')):
+                node = node.setdefault(label, {})
+            node[None] = zone
+
+    def lookup(self, domain: str) -> Optional[Dict]:
+        """返回包含 domain 的最长后缀 Zone，未找到时返回 None"""
+        node = self._root
+        match = None
+        for label in reversed(domain.lower().rstrip('.').split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            match = node.get(None, match)
+        return match
+
+
+class ZoneCache:
+    """
+    Zone 列表缓存：内存 + 可选磁盘 JSON，带 TTL
+    
+    磁盘缓存以认证信息的 sha256 区分账号，不同 Token 不会读到彼此的 Zone 列表。
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = DEFAULT_ZONE_CACHE_TTL,
+                 account_key: str = ''):
+        self.path = path
+        self.ttl = ttl
+        self.account_key = account_key
+        self.zones: Optional[List[Dict]] = None
+        self.index: Optional[ZoneIndex] = None
+        self.fetched_at = 0.0
+
+    def fresh(self) -> bool:
+        return self.zones is not None and time.time() - self.fetched_at < self.ttl
+
+    def set(self, zones: List[Dict], fetched_at: Optional[float] = None):
+        """更新内存缓存并重建索引"""
+        self.zones = zones
+        self.index = ZoneIndex(zones)
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    def clear(self):
+        self.zones = None
+        self.index = None
+        self.fetched_at = 0.0
+
+    def load(self) -> bool:
+        """从磁盘读取未过期的缓存；文件缺失、损坏、过期或属于其他账号时返回 False"""
+        if not self.path:
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if (not isinstance(data, dict) or data.get('version') != ZONE_CACHE_VERSION
+                or data.get('account') != self.account_key
+                or time.time() - data.get('fetched_at', 0) >= self.ttl):
+            return False
+        self.set(data['zones'], data['fetched_at'])
+        return True
+
+    def save(self):
+        """原子写入磁盘缓存（尽力而为，失败不影响主流程）"""
+        if not self.path or self.zones is None:
+            return
+        data = {
+            'version': ZONE_CACHE_VERSION,
+            'account': self.account_key,
+            'fetched_at': self.fetched_at,
+            'zones': [{'id': z['id'], 'name': z['name'], 'status': z.get('status')} for z in self.zones],
+        }
+        try:
+            write_json_atomic(self.path, data)
+        except OSError:
+            pass
+
+
+class TokenBucket:
+    """
+    令牌桶限速器（线程安全）
+    
+    每次请求预约一个令牌；令牌可以透支为负数，调用方按透支量睡眠，
+    因此并发线程会被排成均匀的请求序列而不是互相轮询。
+    Each call reserves one token; the balance may go negative and the caller
+    sleeps off the debt, so concurrent workers queue up at a steady rate.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate)
+        self.burst = float(max(1, burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """取得一个令牌，必要时阻塞；返回等待的秒数"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def drain(self):
+        """收到 429 后清空突发额度，其余线程退回稳定速率"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0)
+
+
 class CloudflareManager:
     """Cloudflare API 管理器"""
     
     BASE_URL = "https://api.cloudflare.com/client/v4"
+
+    # Cloudflare 每个用户/Token 限额 1200 次 / 5 分钟（= 4 次/秒）；
+    # 留一点余量，使任意 5 分钟窗口内 突发 + 速率 * 300 < 1200
+    # Cloudflare allows 1200 requests per 5 minutes per user; stay just under it
+    DEFAULT_RATE_LIMIT = 3.9
+    DEFAULT_BURST = 10
+    DEFAULT_MAX_WORKERS = 8
+
+    # 5xx 与连接错误只对幂等方法重试；429 表示请求未被处理，任何方法都可重试
+    # 5xx/connection errors are retried for idempotent methods only; a 429
+    # means the request was not processed, so any method may be retried
+    IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'})
+    RETRY_STATUSES = frozenset({500, 502, 503, 504})
     
     def __init__(self, api_token: Optional[str] = None, 
                  email: Optional[str] = None, 
-                 api_key: Optional[str] = None):
+                 api_key: Optional[str] = None,
+                 base_url: Optional[str] = None,
+                 timeout: float = 30,
+                 max_retries: int = 5,
+                 backoff_factor: float = 0.5,
+                 pool_size: int = 20,
+                 rate_limit: Optional[float] = DEFAULT_RATE_LIMIT,
+                 burst: int = DEFAULT_BURST,
+                 max_workers: int = DEFAULT_MAX_WORKERS,
+                 zone_cache_path: Optional[str] = None,
+                 zone_cache_ttl: float = DEFAULT_ZONE_CACHE_TTL):
         """
         初始化 Cloudflare 管理器
         
@@ -51,6 +546,16 @@ class CloudflareManager:
             api_token: API Token (推荐)
             email: 账户邮箱 (与 api_key 配合使用)
             api_key: Global API Key (与 email 配合使用)
+            base_url: API 地址（默认官方 API，可指向本地测试服务）
+            timeout: 单次请求超时（秒）
+            max_retries: 429/5xx/连接错误的最大重试次数
+            backoff_factor: 指数退避基数（秒），无 Retry-After 时使用
+            pool_size: 连接池大小（keep-alive 连接数）
+            rate_limit: 每秒请求数上限（令牌桶），None 或 0 表示不限速
+            burst: 令牌桶容量（允许的突发请求数）
+            max_workers: 批量写操作的并发线程数
+            zone_cache_path: Zone 列表磁盘缓存文件（None 表示只缓存在内存中）
+            zone_cache_ttl: Zone 列表缓存有效期（秒）
         """
         if api_token:
             self.headers = {
@@ -65,56 +570,232 @@ class CloudflareManager:
             }
         else:
             raise ValueError("必须提供 API Token 或 Email + API Key")
-    
+
+        self.base_url = (base_url or self.BASE_URL).rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.stats = RequestStats()
+        self.rate_limiter = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.max_workers = max(1, max_workers)
+        account_key = hashlib.sha256(json.dumps(self.headers, sort_keys=True).encode()).hexdigest()
+        self.zone_cache = ZoneCache(zone_cache_path, zone_cache_ttl, account_key)
+
+        # 持久会话：复用 TCP+TLS 连接，启用 gzip
+        # Persistent session: reuse TCP+TLS connections, accept gzip
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _retry_delay(self, response: Optional[requests.Response], attempt: int) -> float:
+        """计算重试等待时间：优先使用 Retry-After / Ratelimit 头，否则指数退避"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return max(0.0, float(retry_after))
+                except ValueError:
+                    pass
+            # Cloudflare 新版限速头: Ratelimit: "default";r=0;t=30
+            ratelimit = response.headers.get('Ratelimit', '')
+            for part in ratelimit.split(';'):
+                key, _, value = part.strip().partition('=')
+                if key == 't' and value.isdigit():
+                    return float(value)
+        return self.backoff_factor * (2 ** attempt)
+
     def _request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict:
-        """发送 API 请求"""
-        url = f"{self.BASE_URL}{endpoint}"
+        """发送 API 请求（连接池 + 限速感知重试）"""
+        url = f"{self.base_url}{endpoint}"
+        method = method.upper()
+        attempt = 0
+        
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            response = None
+            started = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method=method,
+                    url=url,
+                    json=data,
+                    timeout=self.timeout
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.stats.record(method, time.perf_counter() - started, ok=False)
+                if attempt < self.max_retries and method in self.IDEMPOTENT_METHODS:
+                    self.stats.record_retry(rate_limited=False)
+                    time.sleep(self._retry_delay(None, attempt))
+                    attempt += 1
+                    continue
+                raise Exception(f"请求失败: {str(e)}")
+            except requests.exceptions.RequestException as e:
+                self.stats.record(method, time.perf_counter() - started, ok=False)
+                raise Exception(f"请求失败: {str(e)}")
+
+            self.stats.record(method, time.perf_counter() - started, ok=response.ok)
+
+            retryable = (response.status_code == 429 or
+                         (response.status_code in self.RETRY_STATUSES
+                          and method in self.IDEMPOTENT_METHODS))
+            if response.status_code == 429 and self.rate_limiter:
+                self.rate_limiter.drain()
+            if retryable and attempt < self.max_retries:
+                self.stats.record_retry(rate_limited=response.status_code == 429)
+                time.sleep(self._retry_delay(response, attempt))
+                attempt += 1
+                continue
+            break
         
         try:
-            response = requests.request(
-                method=method,
-                url=url,
-                headers=self.headers,
-                json=data,
-                timeout=30
-            )
-            response.raise_for_status()
             result = response.json()
-            
-            if not result.get('success', False):
-                errors = result.get('errors', [])
-                error_msg = ', '.join([e.get('message', 'Unknown error') for e in errors])
-                raise Exception(f"API Error: {error_msg}")
-            
-            return result
+        except ValueError:
+            result = None
+        
+        # 4xx/5xx 响应同样带有 Cloudflare 错误信封，优先报告其中的错误信息
+        errors = result.get('errors') if isinstance(result, dict) else None
+        if errors and (not response.ok or not result.get('success', False)):
+            error_msg = ', '.join([e.get('message', 'Unknown error') for e in errors])
+            status = '' if response.ok else f" (HTTP {response.status_code})"
+            raise Exception(f"API Error: {error_msg}{status}")
+        
+        try:
+            response.raise_for_status()
         except requests.exceptions.RequestException as e:
             raise Exception(f"请求失败: {str(e)}")
+        if not isinstance(result, dict) or not result.get('success', False):
+            raise Exception(f"请求失败: 无效的 API 响应 ({response.status_code})")
+        
+        return result
+
+    def get_request_stats(self) -> Dict:
+        """获取请求计数与延迟统计"""
+        return self.stats.snapshot()
+    
+    def _iter_pages(self, endpoint: str, per_page: int, params: Optional[Dict] = None,
+                    prefetch: bool = True) -> Iterator[Dict]:
+        """
+        按 result_info.total_pages 惰性遍历分页结果
+        
+        prefetch=True 时在后台线程预取下一页，调用方处理当前页的同时下一页已在路上；
+        内存中最多同时保留两页。
+        """
+        query = dict(params or {})
+        query['per_page'] = per_page
+        
+        def fetch(page: int) -> Dict:
+            query['page'] = page
+            return self._request('GET', f'{endpoint}?{urlencode(query)}')
+        
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            page = 1
+            result = fetch(page)
+            while True:
+                total_pages = (result.get('result_info') or {}).get('total_pages', 1)
+                pending = None
+                if executor and page < total_pages:
+                    pending = executor.submit(fetch, page + 1)
+                yield from result.get('result', [])
+                if page >= total_pages:
+                    return
+                page += 1
+                result = pending.result() if pending else fetch(page)
+        finally:
+            if executor:
+                executor.shutdown(wait=True, cancel_futures=True)
     
-    def list_zones(self) -> List[Dict]:
+    def iter_zones(self, per_page: int = 50, prefetch: bool = True) -> Iterator[Dict]:
+        """逐个产出账号下的 Zone（自动分页，Cloudflare 单页最多 50 个）"""
+        return self._iter_pages('/zones', per_page, prefetch=prefetch)
+    
+    def list_zones(self, per_page: int = 50) -> List[Dict]:
         """列出所有可用区域"""
-        result = self._request('GET', '/zones')
-        return result.get('result', [])
+        return list(self.iter_zones(per_page))
+    
+    def get_zones(self, refresh: bool = False) -> List[Dict]:
+        """
+        获取 Zone 列表，优先使用内存/磁盘缓存
+        
+        Args:
+            refresh: 忽略缓存，重新从 API 拉取
+        """
+        if not refresh and (self.zone_cache.fresh() or self.zone_cache.load()):
+            return self.zone_cache.zones
+        self.zone_cache.set(self.list_zones())
+        self.zone_cache.save()
+        return self.zone_cache.zones
+    
+    def invalidate_zone_cache(self):
+        """清空内存中的 Zone 缓存（磁盘缓存在下次刷新时覆盖）"""
+        self.zone_cache.clear()
     
     def get_zone_id(self, domain: str) -> Optional[str]:
-        """根据域名获取 Zone ID"""
-        zones = self.list_zones()
-        for zone in zones:
-            if zone['name'] == domain or domain.endswith(f".{zone['name']}"):
-                return zone['id']
-        return None
+        """
+        根据域名获取 Zone ID（最长后缀匹配）
+        
+        缓存命中时不发起 API 请求；未命中时刷新一次 Zone 列表，以发现新添加的 Zone。
+        """
+        cached = self.zone_cache.fresh() or self.zone_cache.load()
+        if not cached:
+            self.get_zones(refresh=True)
+        zone = self.zone_cache.index.lookup(domain)
+        if zone is None and cached:
+            self.get_zones(refresh=True)
+            zone = self.zone_cache.index.lookup(domain)
+        return zone['id'] if zone else None
+    
+    def resolve_zone(self, zone: str) -> str:
+        """接受 Zone ID 或域名，返回 Zone ID"""
+        if ZONE_ID_PATTERN.match(zone):
+            return zone
+        zone_id = self.get_zone_id(zone)
+        if not zone_id:
+            raise Exception(f"未找到域名 {zone} 对应的 Zone")
+        return zone_id
+    
+    def iter_dns_records(self, zone_id: str, name: Optional[str] = None,
+                         record_type: Optional[str] = None, per_page: int = 1000,
+                         prefetch: bool = True) -> Iterator[Dict]:
+        """
+        逐条产出 DNS 记录（自动分页，内存占用与区域大小无关）
+        
+        Args:
+            zone_id: Zone ID
+            name: 过滤记录名称
+            record_type: 过滤记录类型
+            per_page: 每页记录数
+            prefetch: 是否在后台预取下一页
+        """
+        params = {}
+        if name:
+            params['name'] = name
+        if record_type:
+            params['type'] = record_type
+        return self._iter_pages(f'/zones/{zone_id}/dns_records', per_page, params, prefetch)
     
     def list_dns_records(self, zone_id: str, name: Optional[str] = None, 
                         record_type: Optional[str] = None) -> List[Dict]:
         """列出 DNS 记录"""
-        params = []
-        if name:
-            params.append(f"name={name}")
-        if record_type:
-            params.append(f"type={record_type}")
-        
-        query = f"?{'&'.join(params)}" if params else ""
-        result = self._request('GET', f'/zones/{zone_id}/dns_records{query}')
-        return result.get('result', [])
+        return list(self.iter_dns_records(zone_id, name, record_type))
+    
+    def list_all_dns_records(self, zone_id: str, per_page: int = 1000) -> List[Dict]:
+        """列出区域内全部 DNS 记录"""
+        return list(self.iter_dns_records(zone_id, per_page=per_page))
     
     def create_dns_record(self, zone_id: str, record_type: str, name: str, 
                          content: str, proxied: bool = False, ttl: int = 1) -> Dict:
@@ -177,6 +858,76 @@ class CloudflareManager:
                 zone_id, record_type, name, content, proxied, ttl
             )
     
+    def _apply_dns_step(self, zone_id: str, step: Dict) -> Dict:
+        """执行单条计划项，异常转为结果而不是向上抛出"""
+        record = None
+        try:
+            if step['action'] == 'create':
+                record = self.create_dns_record(zone_id, step['type'], step['name'], step['content'],
+                                                step['proxied'], step['ttl'])
+            elif step['action'] == 'update':
+                record = self.update_dns_record(zone_id, step['record_id'], step['type'], step['name'],
+                                                step['content'], step['proxied'], step['ttl'])
+            elif step['action'] == 'delete':
+                self.delete_dns_record(zone_id, step['record_id'])
+            return {'step': step, 'ok': True, 'error': None, 'record': record}
+        except Exception as e:
+            return {'step': step, 'ok': False, 'error': str(e), 'record': None}
+    
+    def apply_dns_plan(self, zone_id: str, plan: List[Dict],
+                       max_workers: Optional[int] = None) -> List[Dict]:
+        """
+        并发执行变更计划（noop 跳过），返回按计划顺序排列的结果
+        
+        先并发执行全部 delete，再并发执行 create/update，避免同名 CNAME 与 A 记录冲突；
+        所有请求共享令牌桶限速与连接池。
+        
+        Args:
+            zone_id: Zone ID
+            plan: plan_dns_changes / delete_steps 生成的计划
+            max_workers: 并发线程数（默认使用初始化时的 max_workers）
+        """
+        steps = [step for step in plan if step['action'] != 'noop']
+        if not steps:
+            return []
+        
+        workers = min(max_workers or self.max_workers, len(steps))
+        outcomes: Dict[int, Dict] = {}
+        waves = (
+            [i for i, step in enumerate(steps) if step['action'] == 'delete'],
+            [i for i, step in enumerate(steps) if step['action'] != 'delete'],
+        )
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for wave in waves:
+                results = executor.map(lambda i: self._apply_dns_step(zone_id, steps[i]), wave)
+                outcomes.update(zip(wave, results))
+        return [outcomes[i] for i in range(len(steps))]
+    
+    def reconcile_dns_records(self, zone_id: str, desired: List[Dict],
+                              prune: bool = False, dry_run: bool = False) -> Dict:
+        """
+        一次拉取区域全部记录，本地计算差异后只执行需要的写操作
+        
+        Args:
+            zone_id: Zone ID
+            desired: 期望的记录列表
+            prune: 是否删除期望类型中未声明的记录
+            dry_run: 只计算计划，不执行
+            
+        Returns:
+            {'plan': [...], 'results': [...]}
+        """
+        existing = self.list_all_dns_records(zone_id)
+        plan = plan_dns_changes(desired, existing, prune=prune)
+        results = [] if dry_run else self.apply_dns_plan(zone_id, plan)
+        return {'plan': plan, 'results': results}
+    
+    def snapshot_zone(self, zone_id: str, path: str) -> List[Dict]:
+        """拉取区域全部记录并保存为快照，返回记录列表"""
+        records = self.list_all_dns_records(zone_id)
+        save_zone_snapshot(path, zone_id, records)
+        return records
+    
     def toggle_proxy(self, zone_id: str, name: str, proxied: bool) -> Dict:
         """切换 DNS 记录的代理状态"""
         records = self.list_dns_records(zone_id, name=name)
@@ -198,7 +949,212 @@ class CloudflareManager:
             ttl=1 if proxied else record.get('ttl', 1)
         )
 
-def load_from_env(manager: CloudflareManager, zone_id: str):
+def print_request_stats(manager: CloudflareManager):
+    """打印 API 请求统计"""
+    stats = manager.get_request_stats()
+    print_header("API 请求统计")
+    print_colored(f"  请求数: {stats['requests']}  重试: {stats['retries']}  "
+                  f"限速(429): {stats['rate_limited']}  错误: {stats['errors']}", Colors.BLUE)
+    print_colored(f"  总耗时: {stats['total_seconds']:.2f}s  平均: {stats['avg_ms']:.1f}ms  "
+                  f"最大: {stats['max_ms']:.1f}ms", Colors.BLUE)
+    methods = ', '.join(f"{method} {count}" for method, count in sorted(stats['by_method'].items()))
+    if methods:
+        print_colored(f"  按方法: {methods}", Colors.BLUE)
+
+def query_prometheus(session: requests.Session, prometheus_url: str, query: str,
+                     timeout: float = 10) -> List[Dict]:
+    """执行 Prometheus 即时查询，返回 data.result 向量"""
+    try:
+        response = session.get(f"{prometheus_url.rstrip('/')}/api/v1/query",
+                               params={'query': query}, timeout=timeout)
+        response.raise_for_status()
+        body = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        raise Exception(f"Prometheus 查询失败: {str(e)}")
+    if body.get('status') != 'success':
+        raise Exception(f"Prometheus 查询失败: {body.get('error', 'unknown error')}")
+    return body['data']['result']
+
+def health_by_ip(samples: List[Dict], label: str = 'instance') -> Dict[str, bool]:
+    """
+    将 Prometheus 样本转换为 {IP: 是否健康}
+    
+    instance 标签形如 "1.2.3.4:9100" 或 "[2001:db8::1]:9100"，去掉端口后即主机 IP；
+    同一 IP 有多条样本（如 up 与 probe_success）时，全部为 1 才视为健康。
+    """
+    health: Dict[str, bool] = {}
+    for sample in samples:
+        target = sample.get('metric', {}).get(label, '')
+        if target.startswith('['):
+            ip = target[1:target.find(']')]
+        elif target.count(':') == 1:
+            ip = target.split(':')[0]
+        else:
+            ip = target
+        healthy = float(sample['value'][1]) >= 1
+        health[ip] = health.get(ip, True) and healthy
+    return health
+
+class FailoverController:
+    """
+    基于 Prometheus 健康数据的服务域名故障转移
+    
+    - 滞回：主机连续 fail_after 次不健康才判定为故障，连续 recover_after 次健康才判定为恢复
+    - 粘滞：当前目标健康时不做任何修改，恢复后也不自动切回，避免来回切换
+    - 最少写入：只在当前目标被判定故障时，把记录更新为下一个健康候选（一次 PUT）
+    - Prometheus 不可用时保持现状，不会把查询失败当作主机故障
+    """
+    
+    def __init__(self, manager: CloudflareManager, zone_id: str, services: Dict[str, Dict],
+                 prometheus_url: str = DEFAULT_PROMETHEUS_URL, query: str = DEFAULT_HEALTH_QUERY,
+                 label: str = 'instance', fail_after: int = 2, recover_after: int = 3,
+                 interval: float = 15.0, dry_run: bool = False,
+                 session: Optional[requests.Session] = None):
+        """
+        Args:
+            manager: CloudflareManager
+            zone_id: Zone ID
+            services: service_candidates 的结果
+            prometheus_url: Prometheus 地址
+            query: 健康查询（值为 1 表示健康）
+            label: 样本中携带主机地址的标签
+            fail_after: 判定故障所需的连续失败次数
+            recover_after: 判定恢复所需的连续成功次数
+            interval: 轮询间隔（秒），建议与 scrape_interval 一致
+            dry_run: 只打印计划，不写入 DNS
+        """
+        self.manager = manager
+        self.zone_id = zone_id
+        self.services = {k: v for k, v in services.items() if v['candidates']}
+        self.prometheus_url = prometheus_url
+        self.query = query
+        self.label = label
+        self.fail_after = max(1, fail_after)
+        self.recover_after = max(1, recover_after)
+        self.interval = interval
+        self.dry_run = dry_run
+        self.session = session or requests.Session()
+        self.hosts: Dict[str, Dict] = {}
+        self.records: Optional[List[Dict]] = None
+    
+    def is_healthy(self, ip: str) -> bool:
+        """主机的滞回后状态（尚未观测过的主机视为健康）"""
+        return self.hosts.get(ip, {'healthy': True})['healthy']
+    
+    def observe(self, health: Dict[str, bool]) -> List[Tuple[str, bool]]:
+        """
+        记录一次观测，返回状态发生翻转的 [(IP, 新状态)]
+        
+        候选主机在查询结果中缺失时按不健康计（目标已不在抓取中）。
+        """
+        ips = dict.fromkeys(ip for service in self.services.values() for _, ip, _ in service['candidates'])
+        transitions = []
+        for ip in ips:
+            state = self.hosts.setdefault(ip, {'healthy': True, 'streak': 0})
+            seen = health.get(ip, False)
+            if seen == state['healthy']:
+                state['streak'] = 0
+                continue
+            state['streak'] += 1
+            if state['streak'] >= (self.recover_after if seen else self.fail_after):
+                state['healthy'] = seen
+                state['streak'] = 0
+                transitions.append((ip, seen))
+        return transitions
+    
+    def sync_records(self):
+        """拉取服务域名当前的 A 记录（每个域名一次过滤查询）"""
+        records = []
+        for service in self.services.values():
+            records.extend(self.manager.iter_dns_records(self.zone_id, name=service['domain'],
+                                                         record_type='A', prefetch=False))
+        self.records = records
+    
+    def desired_records(self) -> List[Dict]:
+        """计算每个服务域名应指向的 IP"""
+        desired = []
+        for env_name, service in self.services.items():
+            current = next((r for r in self.records if r['name'] == service['domain']), None)
+            ips = [ip for _, ip, _ in service['candidates']]
+            if current and current['content'] in ips and self.is_healthy(current['content']):
+                target = current['content']
+            else:
+                target = next((ip for ip in ips if self.is_healthy(ip)), None)
+                if target is None:
+                    # 没有健康候选：保持现状，不做无意义的写入
+                    if current is None:
+                        continue
+                    target = current['content']
+            desired.append({
+                'type': 'A',
+                'name': service['domain'],
+                'content': target,
+                'proxied': current.get('proxied', True) if current else True,
+                'ttl': current.get('ttl', 1) if current else 1,
+            })
+        return desired
+    
+    def step(self, health: Dict[str, bool]) -> Dict:
+        """
+        处理一次观测：先同步记录，再更新滞回状态，必要时切换记录
+        
+        Cloudflare 调用失败时撤销本次观测并清空记录缓存后重新抛出，
+        下一轮会基于新的健康数据重新观测并重新同步，状态翻转不会丢失。
+        """
+        previous = {ip: dict(state) for ip, state in self.hosts.items()}
+        try:
+            if self.records is None:
+                self.sync_records()
+            transitions = self.observe(health)
+            plan = plan_dns_changes(self.desired_records(), self.records)
+            changes = [step for step in plan if step['action'] != 'noop']
+            results = []
+            if changes and not self.dry_run:
+                results = self.manager.apply_dns_plan(self.zone_id, plan)
+                self.records = apply_results_to_records(self.records, results)
+                if not all(r['ok'] for r in results):
+                    self.records = None  # 写入失败时下一轮重新同步
+        except Exception:
+            self.hosts = previous
+            self.records = None
+            raise
+        return {'transitions': transitions, 'plan': plan, 'changes': changes, 'results': results}
+    
+    def poll(self) -> Dict[str, bool]:
+        """从 Prometheus 读取一次健康状态"""
+        return health_by_ip(query_prometheus(self.session, self.prometheus_url, self.query), self.label)
+    
+    def run(self, iterations: Optional[int] = None):
+        """循环轮询；iterations 为 None 时一直运行"""
+        count = 0
+        while iterations is None or count < iterations:
+            if count:
+                time.sleep(self.interval)
+            count += 1
+            stamp = time.strftime('%H:%M:%S')
+            try:
+                health = self.poll()
+            except Exception as e:
+                print_colored(f"[{stamp}] ⚠ {str(e)}，保持当前记录", Colors.YELLOW)
+                continue
+            try:
+                outcome = self.step(health)
+            except Exception as e:
+                print_colored(f"[{stamp}] ⚠ Cloudflare: {str(e)}，保持当前记录", Colors.YELLOW)
+                continue
+            for ip, healthy in outcome['transitions']:
+                status, color = ('恢复', Colors.GREEN) if healthy else ('故障', Colors.RED)
+                print_colored(f"[{stamp}] {status}: {ip}", color)
+            for step in outcome['changes']:
+                current = (step.get('current') or {}).get('content', '-')
+                prefix = '(dry run) ' if self.dry_run else ''
+                print_colored(f"[{stamp}] {prefix}切换 {step['name']}: {current} -> {step['content']}",
+                              Colors.YELLOW)
+            for result in outcome['results']:
+                if not result['ok']:
+                    print_colored(f"[{stamp}] ✗ {result['step']['name']} - {result['error']}", Colors.RED)
+
+def load_from_env(manager: CloudflareManager, zone_id: str, dry_run: bool = False):
     """从环境变量加载服务器配置并创建 DNS 记录"""
     print_header("从环境变量加载配置")
     
@@ -234,23 +1190,30 @@ def load_from_env(manager: CloudflareManager, zone_id: str):
     # 使用第一台服务器的 IP
     first_server_ip = list(servers.values())[0]
     
+    desired = []
     for service_name, domain in services.items():
+        service_type = service_name.replace('_DOMAIN', '').lower()
         if domain:
-            service_type = service_name.replace('_DOMAIN', '').lower()
-            try:
-                manager.upsert_dns_record(
-                    zone_id=zone_id,
-                    record_type='A',
-                    name=domain,
-                    content=first_server_ip,
-                    proxied=True  # 默认启用代理
-                )
-                print_colored(f"  ✓ {service_type}: {domain} -> {first_server_ip}", Colors.GREEN)
-            except Exception as e:
-                print_colored(f"  ✗ {service_type}: {domain} - {str(e)}", Colors.RED)
+            desired.append({
+                'type': 'A',
+                'name': domain,
+                'content': first_server_ip,
+                'proxied': True,  # 默认启用代理
+            })
         else:
-            service_type = service_name.replace('_DOMAIN', '').lower()
             print_colored(f"  ⊘ {service_type}: 未配置域名", Colors.YELLOW)
+    
+    if not desired:
+        return
+    
+    # 一次拉取全部记录，本地计算差异后只写入变化的记录
+    outcome = manager.reconcile_dns_records(zone_id, desired, dry_run=dry_run)
+    print_dns_plan(outcome['plan'])
+    if dry_run:
+        print_colored("\n  Dry run: 未执行任何写操作", Colors.YELLOW)
+        return
+    
+    print_dns_results(outcome['results'])
 
 def interactive_mode():
     """交互式模式"""
@@ -260,12 +1223,7 @@ def interactive_mode():
     env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
     if os.path.exists(env_path):
         print_colored(f"正在加载环境变量: {env_path}", Colors.BLUE)
-        with open(env_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    os.environ[key.strip()] = value.strip()
+        os.environ.update(load_env_file(env_path))
         print_colored("✓ 环境变量加载成功\n", Colors.GREEN)
     else:
         print_colored(f"⚠ 未找到 .env 文件: {env_path}\n", Colors.YELLOW)
@@ -283,7 +1241,8 @@ def interactive_mode():
         sys.exit(1)
     
     try:
-        manager = CloudflareManager(api_token=api_token, email=email, api_key=api_key)
+        manager = CloudflareManager(api_token=api_token, email=email, api_key=api_key,
+                                    zone_cache_path=DEFAULT_ZONE_CACHE)
         
         # 获取 Zone ID
         zone_id = os.getenv('CLOUDFLARE_ZONE_ID')
@@ -291,7 +1250,7 @@ def interactive_mode():
         
         if not zone_id:
             print_colored("未配置 CLOUDFLARE_ZONE_ID，正在查询...", Colors.YELLOW)
-            zones = manager.list_zones()
+            zones = manager.get_zones()
             
             if not zones:
                 print_colored("错误: 未找到任何域名区域", Colors.RED)
@@ -387,9 +1346,7 @@ def interactive_mode():
                     else:
                         confirm = input(f"确认删除 {len(records)} 条记录? (yes/no): ").strip().lower()
                         if confirm == 'yes':
-                            for record in records:
-                                manager.delete_dns_record(zone_id, record['id'])
-                                print_colored(f"  ✓ 已删除: {record['name']} ({record['type']})", Colors.GREEN)
+                            print_dns_results(manager.apply_dns_plan(zone_id, delete_steps(records)))
                         else:
                             print_colored("  取消操作", Colors.YELLOW)
                 except Exception as e:
@@ -416,6 +1373,81 @@ def interactive_mode():
         print_colored(f"\n✗ 错误: {str(e)}", Colors.RED)
         sys.exit(1)
 
+def manager_from_args(args) -> CloudflareManager:
+    """按命令行参数与环境变量创建管理器"""
+    return CloudflareManager(
+        api_token=args.token or os.getenv('CLOUDFLARE_API_TOKEN'),
+        email=args.email or os.getenv('CLOUDFLARE_EMAIL'),
+        api_key=args.api_key or os.getenv('CLOUDFLARE_API_KEY'),
+        base_url=args.api_url,
+        rate_limit=args.rate_limit,
+        max_workers=args.workers,
+        zone_cache_path=args.zone_cache or None,
+        zone_cache_ttl=args.zone_cache_ttl,
+    )
+
+def run_dns_state(args):
+    """dns-state: 从 servers-config.yml 生成声明式 DNS 状态文件"""
+    state = build_dns_state(load_config_cached(args.config), args.domain,
+                            server_environments=args.server_environment)
+    for host_name in state['missing']:
+        print(f"⚠ {host_name}: 未设置 IP 环境变量，已跳过", file=sys.stderr)
+    text = yaml.safe_dump(state, allow_unicode=True, sort_keys=False)
+    if args.output:
+        with atomic_output(args.output) as f:
+            f.write(text)
+        print_colored(f"✓ 已生成 {len(state['records'])} 条记录: {args.output}", Colors.GREEN)
+    else:
+        sys.stdout.write(text)
+
+def run_state_plan(args) -> int:
+    """
+    plan/apply: 基于区域快照计算（并执行）状态文件的差异
+    
+    plan 只在快照不存在或指定 --refresh 时调用 API 拉取一次，之后完全离线、结果确定。
+    apply 总是先重新拉取区域记录再计算差异：快照之后在控制台或故障转移控制器中
+    修改/删除的记录不会被当作过期 record_id 写入，--prune 也只依据最新数据。
+    apply 成功的写操作会合并回快照，下一次 plan 无需重新拉取。
+    
+    Returns:
+        退出码：成功为 0；apply 有失败为 1；plan --detailed-exitcode 且有变更为 2
+    """
+    state = load_dns_state(args.file)
+    zone = args.zone_id or state['domain']
+    path = args.snapshot or zone_snapshot_path(zone)
+    
+    snapshot = load_zone_snapshot(path)
+    manager = None
+    if snapshot is None or args.refresh or args.command == 'apply':
+        manager = manager_from_args(args)
+        # 已有快照时沿用其中的 zone_id，省去一次区域解析
+        zone_id = snapshot['zone_id'] if snapshot and not args.refresh else manager.resolve_zone(zone)
+        manager.snapshot_zone(zone_id, path)
+        snapshot = load_zone_snapshot(path)
+    
+    age = int(time.time() - snapshot['fetched_at'])
+    print_header(f"DNS {args.command} - Zone: {zone}")
+    print_colored(f"  快照: {path} ({age} 秒前拉取, {len(snapshot['records'])} 条记录)\n", Colors.BLUE)
+    
+    plan = plan_dns_changes(state['records'], snapshot['records'], prune=args.prune)
+    print_dns_plan(plan)
+    changes = [step for step in plan if step['action'] != 'noop']
+    
+    if args.command == 'plan':
+        return 2 if changes and args.detailed_exitcode else 0
+    if not changes:
+        return 0
+    
+    manager = manager or manager_from_args(args)
+    results = manager.apply_dns_plan(snapshot['zone_id'], plan)
+    print_dns_results(results)
+    save_zone_snapshot(path, snapshot['zone_id'],
+                       apply_results_to_records(snapshot['records'], results),
+                       fetched_at=snapshot['fetched_at'])
+    if args.stats:
+        print_request_stats(manager)
+    return 0 if all(r['ok'] for r in results) else 1
+
 def main():
     # 检查是否有命令行参数（除了脚本名称）
     if len(sys.argv) == 1:
@@ -447,14 +1479,30 @@ def main():
   # 从环境变量批量配置
   %(prog)s from-env -z ZONE_ID
   
-  # 列出所有 DNS 记录
+  # 按 JSON 文件批量同步（一次拉取全部记录，只写差异）
+  %(prog)s reconcile -z ZONE_ID -f records.json --dry-run
+  
+  # 声明式：生成状态文件 -> 基于区域快照 plan -> apply
+  %(prog)s dns-state -d example.com -o dns-state.yml
+  %(prog)s plan -f dns-state.yml --detailed-exitcode
+  %(prog)s apply -f dns-state.yml
+  
+  # 根据 Prometheus 健康数据自动切换服务域名（连续 2 次失败切换）
+  %(prog)s failover -z example.com --prometheus-url http://10.0.0.1:9090
+  
+  # 列出所有 DNS 记录（-z 也可以直接写域名，Zone 列表会缓存在 .cache/cloudflare/）
   %(prog)s list -z ZONE_ID
+  %(prog)s list -z example.com
+  
+  # 流式导出全部记录（JSON Lines，逐页拉取，内存占用恒定）
+  %(prog)s export -z example.com -o records.jsonl
 
 环境变量:
   CLOUDFLARE_API_TOKEN    - API Token (推荐)
   CLOUDFLARE_EMAIL        - 账户邮箱
   CLOUDFLARE_API_KEY      - Global API Key
   CLOUDFLARE_ZONE_ID      - Zone ID (可选，可通过 -z 参数指定)
+  CLOUDFLARE_API_URL      - API 地址 (可选，用于本地 Fake API)
         """
     )
     
@@ -463,19 +1511,75 @@ def main():
     auth_group.add_argument('--token', help='Cloudflare API Token')
     auth_group.add_argument('--email', help='Cloudflare 账户邮箱')
     auth_group.add_argument('--api-key', help='Cloudflare Global API Key')
+    auth_group.add_argument('--api-url', default=os.getenv('CLOUDFLARE_API_URL'),
+                            help='API 地址（默认: 官方 API；可指向 tools/fake_cloudflare_api.py）')
+    parser.add_argument('--stats', action='store_true', help='结束时打印 API 请求数与延迟统计')
+    parser.add_argument('--workers', type=int, default=CloudflareManager.DEFAULT_MAX_WORKERS,
+                        help=f'批量写操作并发数 (默认: {CloudflareManager.DEFAULT_MAX_WORKERS})')
+    parser.add_argument('--zone-cache', default=DEFAULT_ZONE_CACHE,
+                        help='Zone 列表缓存文件，传空字符串禁用磁盘缓存 (默认: .cache/cloudflare/zones.json)')
+    parser.add_argument('--zone-cache-ttl', type=float, default=DEFAULT_ZONE_CACHE_TTL,
+                        help=f'Zone 列表缓存有效期，秒 (默认: {DEFAULT_ZONE_CACHE_TTL})')
+    parser.add_argument('--rate-limit', type=float, default=CloudflareManager.DEFAULT_RATE_LIMIT,
+                        help=f'每秒 API 请求上限，0 表示不限速 (默认: {CloudflareManager.DEFAULT_RATE_LIMIT})')
     
     # 子命令
     subparsers = parser.add_subparsers(dest='command', help='可用命令')
     
     # list 命令
     list_parser = subparsers.add_parser('list', help='列出 DNS 记录')
-    list_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID')
+    list_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID 或域名')
     list_parser.add_argument('-n', '--name', help='过滤记录名称')
     list_parser.add_argument('-t', '--type', help='过滤记录类型 (A, AAAA, CNAME, etc.)')
     
+    # export 命令
+    export_parser = subparsers.add_parser('export', help='按 JSON Lines 流式导出 DNS 记录')
+    export_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID 或域名')
+    export_parser.add_argument('-n', '--name', help='过滤记录名称')
+    export_parser.add_argument('-t', '--type', help='过滤记录类型 (A, AAAA, CNAME, etc.)')
+    export_parser.add_argument('-o', '--output', help='输出文件（默认: 标准输出）')
+    export_parser.add_argument('--per-page', type=int, default=1000, help='每页记录数 (默认: 1000)')
+    
+    # dns-state / plan / apply 命令（声明式）
+    state_parser = subparsers.add_parser('dns-state', help='从 servers-config.yml 生成声明式 DNS 状态文件')
+    state_parser.add_argument('-d', '--domain', required=True, help='主机记录所在域名 (例如: example.com)')
+    state_parser.add_argument('-c', '--config', default=DEFAULT_CONFIG_FILE,
+                              help=f'服务器配置文件 (默认: {DEFAULT_CONFIG_FILE})')
+    state_parser.add_argument('-e', '--server-environment', action='append',
+                              help='只包含指定 server_environment 的主机，可重复')
+    state_parser.add_argument('-o', '--output', help='输出文件（默认: 标准输出）')
+    
+    for command, help_text in (('plan', '对比状态文件与区域快照，显示变更计划'),
+                               ('apply', '重新拉取区域记录后按状态文件执行变更，并更新区域快照')):
+        command_parser = subparsers.add_parser(command, help=help_text)
+        command_parser.add_argument('-f', '--file', required=True, help='dns-state 生成的状态文件')
+        command_parser.add_argument('-z', '--zone-id', help='Zone ID 或域名（默认: 状态文件中的 domain）')
+        command_parser.add_argument('--snapshot', help='区域快照文件（默认: .cache/cloudflare/zone-<zone>.json）')
+        command_parser.add_argument('--refresh', action='store_true', help='重新拉取区域记录并更新快照（apply 总是重新拉取）')
+        command_parser.add_argument('--prune', action='store_true', help='删除同类型中未声明的记录')
+        if command == 'plan':
+            command_parser.add_argument('--detailed-exitcode', action='store_true',
+                                        help='有变更时退出码为 2（用于 CI）')
+    
+    # failover 命令
+    failover_parser = subparsers.add_parser('failover', help='根据 Prometheus 健康数据自动切换服务域名')
+    failover_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID 或域名')
+    failover_parser.add_argument('-c', '--config', default=DEFAULT_CONFIG_FILE,
+                                 help=f'服务器配置文件 (默认: {DEFAULT_CONFIG_FILE})')
+    failover_parser.add_argument('--prometheus-url', default=os.getenv('PROMETHEUS_URL', DEFAULT_PROMETHEUS_URL),
+                                 help=f'Prometheus 地址 (默认: $PROMETHEUS_URL 或 {DEFAULT_PROMETHEUS_URL})')
+    failover_parser.add_argument('--query', default=DEFAULT_HEALTH_QUERY,
+                                 help=f'健康查询，值为 1 表示健康 (默认: {DEFAULT_HEALTH_QUERY})')
+    failover_parser.add_argument('--label', default='instance', help='携带主机地址的标签 (默认: instance)')
+    failover_parser.add_argument('--interval', type=float, default=15, help='轮询间隔，秒 (默认: 15)')
+    failover_parser.add_argument('--fail-after', type=int, default=2, help='连续失败几次判定故障 (默认: 2)')
+    failover_parser.add_argument('--recover-after', type=int, default=3, help='连续成功几次判定恢复 (默认: 3)')
+    failover_parser.add_argument('--iterations', type=int, help='轮询次数后退出（默认: 一直运行）')
+    failover_parser.add_argument('--dry-run', action='store_true', help='只打印切换计划，不写入 DNS')
+    
     # add 命令
     add_parser = subparsers.add_parser('add', help='创建 DNS 记录')
-    add_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID')
+    add_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID 或域名')
     add_parser.add_argument('-t', '--type', default='A', help='记录类型 (默认: A)')
     add_parser.add_argument('-n', '--name', required=True, help='记录名称')
     add_parser.add_argument('-c', '--content', required=True, help='记录值 (IP 地址)')
@@ -484,7 +1588,7 @@ def main():
     
     # upsert 命令
     upsert_parser = subparsers.add_parser('upsert', help='创建或更新 DNS 记录')
-    upsert_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID')
+    upsert_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID 或域名')
     upsert_parser.add_argument('-t', '--type', default='A', help='记录类型 (默认: A)')
     upsert_parser.add_argument('-n', '--name', required=True, help='记录名称')
     upsert_parser.add_argument('-c', '--content', required=True, help='记录值 (IP 地址)')
@@ -493,23 +1597,32 @@ def main():
     
     # delete 命令
     delete_parser = subparsers.add_parser('delete', help='删除 DNS 记录')
-    delete_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID')
+    delete_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID 或域名')
     delete_parser.add_argument('-n', '--name', required=True, help='记录名称')
     delete_parser.add_argument('-t', '--type', help='记录类型')
     
     # proxy-on 命令
     proxy_on_parser = subparsers.add_parser('proxy-on', help='启用小黄云代理')
-    proxy_on_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID')
+    proxy_on_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID 或域名')
     proxy_on_parser.add_argument('-n', '--name', required=True, help='记录名称')
     
     # proxy-off 命令
     proxy_off_parser = subparsers.add_parser('proxy-off', help='禁用小黄云代理')
-    proxy_off_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID')
+    proxy_off_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID 或域名')
     proxy_off_parser.add_argument('-n', '--name', required=True, help='记录名称')
     
     # from-env 命令
     from_env_parser = subparsers.add_parser('from-env', help='从环境变量批量配置')
-    from_env_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID')
+    from_env_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID 或域名')
+    from_env_parser.add_argument('--dry-run', action='store_true', help='只显示变更计划，不执行')
+    
+    # reconcile 命令
+    reconcile_parser = subparsers.add_parser('reconcile', help='按 JSON 记录列表批量同步 DNS（一次拉取，只写差异）')
+    reconcile_parser.add_argument('-z', '--zone-id', required=True, help='Zone ID 或域名')
+    reconcile_parser.add_argument('-f', '--file', required=True,
+                                  help='期望记录 JSON 文件: [{"type", "name", "content", "proxied", "ttl"}, ...]')
+    reconcile_parser.add_argument('--prune', action='store_true', help='删除同类型中未声明的记录')
+    reconcile_parser.add_argument('--dry-run', action='store_true', help='只显示变更计划，不执行')
     
     # zones 命令
     subparsers.add_parser('zones', help='列出所有可用区域')
@@ -521,17 +1634,23 @@ def main():
         return
     
     try:
-        # 从参数或环境变量获取认证信息
-        api_token = args.token or os.getenv('CLOUDFLARE_API_TOKEN')
-        email = args.email or os.getenv('CLOUDFLARE_EMAIL')
-        api_key = args.api_key or os.getenv('CLOUDFLARE_API_KEY')
+        # 声明式状态命令：有快照时完全离线运行，不需要认证信息
+        if args.command == 'dns-state':
+            run_dns_state(args)
+            return
+        if args.command in ('plan', 'apply'):
+            sys.exit(run_state_plan(args))
+        
+        manager = manager_from_args(args)
         
-        manager = CloudflareManager(api_token=api_token, email=email, api_key=api_key)
+        # -z 既可以是 Zone ID，也可以是域名（通过缓存的 Zone 索引解析）
+        if getattr(args, 'zone_id', None):
+            args.zone_id = manager.resolve_zone(args.zone_id)
         
         # 执行命令
         if args.command == 'zones':
             print_header("可用区域列表")
-            zones = manager.list_zones()
+            zones = manager.get_zones(refresh=True)
             for zone in zones:
                 status = "✓" if zone['status'] == 'active' else "✗"
                 print_colored(f"  {status} {zone['name']}", Colors.GREEN)
@@ -539,17 +1658,31 @@ def main():
         
         elif args.command == 'list':
             print_header(f"DNS 记录列表 - Zone: {args.zone_id}")
-            records = manager.list_dns_records(args.zone_id, args.name, args.type)
+            count = 0
+            for record in manager.iter_dns_records(args.zone_id, args.name, args.type):
+                count += 1
+                proxy_status = "🟡" if record.get('proxied') else "⚪"
+                print_colored(
+                    f"  {proxy_status} {record['name']} ({record['type']}) -> {record['content']}",
+                    Colors.GREEN
+                )
             
-            if not records:
+            if not count:
                 print_colored("  未找到记录", Colors.YELLOW)
-            else:
-                for record in records:
-                    proxy_status = "🟡" if record.get('proxied') else "⚪"
-                    print_colored(
-                        f"  {proxy_status} {record['name']} ({record['type']}) -> {record['content']}",
-                        Colors.GREEN
-                    )
+        
+        elif args.command == 'export':
+            out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+            try:
+                count = 0
+                for record in manager.iter_dns_records(args.zone_id, args.name, args.type,
+                                                       per_page=args.per_page):
+                    out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    count += 1
+            finally:
+                if args.output:
+                    out.close()
+            if args.output:
+                print_colored(f"✓ 已导出 {count} 条记录: {args.output}", Colors.GREEN)
         
         elif args.command == 'add':
             print_header("创建 DNS 记录")
@@ -583,9 +1716,10 @@ def main():
                 print_colored(f"  ✗ 未找到记录: {args.name}", Colors.RED)
                 return
             
-            for record in records:
-                manager.delete_dns_record(args.zone_id, record['id'])
-                print_colored(f"  ✓ 已删除: {record['name']} ({record['type']})", Colors.GREEN)
+            results = manager.apply_dns_plan(args.zone_id, delete_steps(records))
+            print_dns_results(results)
+            if not all(r['ok'] for r in results):
+                sys.exit(1)
         
         elif args.command == 'proxy-on':
             print_header("启用小黄云代理")
@@ -598,8 +1732,46 @@ def main():
             print_colored(f"\n✓ 已禁用代理: {args.name}", Colors.GREEN)
         
         elif args.command == 'from-env':
-            load_from_env(manager, args.zone_id)
+            load_from_env(manager, args.zone_id, dry_run=args.dry_run)
             print_colored("\n✓ 批量配置完成", Colors.GREEN)
+        
+        elif args.command == 'failover':
+            hosts, missing = resolve_host_ips(load_config_cached(args.config), os.environ)
+            services = service_candidates(hosts, os.environ)
+            print_header(f"DNS 故障转移 - Prometheus: {args.prometheus_url}")
+            for env_name, service in services.items():
+                chain = ' -> '.join(f"{host}({ip})" for host, ip, _ in service['candidates']) or '无候选主机'
+                print_colored(f"  {service['domain']}: {chain}", Colors.BLUE)
+            if missing:
+                print_colored(f"  ⚠ 未设置 IP 的主机: {', '.join(missing)}", Colors.YELLOW)
+            controller = FailoverController(
+                manager, args.zone_id, services,
+                prometheus_url=args.prometheus_url, query=args.query, label=args.label,
+                fail_after=args.fail_after, recover_after=args.recover_after,
+                interval=args.interval, dry_run=args.dry_run,
+            )
+            if not controller.services:
+                raise Exception("没有可故障转移的服务域名（检查 *_DOMAIN 环境变量与主机角色）")
+            try:
+                controller.run(args.iterations)
+            except KeyboardInterrupt:
+                print_colored("\n已停止", Colors.YELLOW)
+        
+        elif args.command == 'reconcile':
+            print_header(f"同步 DNS 记录 - Zone: {args.zone_id}")
+            with open(args.file, 'r', encoding='utf-8') as f:
+                desired = json.load(f)
+            outcome = manager.reconcile_dns_records(args.zone_id, desired,
+                                                    prune=args.prune, dry_run=args.dry_run)
+            print_dns_plan(outcome['plan'])
+            print_dns_results(outcome['results'])
+            if not all(r['ok'] for r in outcome['results']):
+                sys.exit(1)
+            if not args.dry_run:
+                print_colored(f"\n✓ 已应用 {len(outcome['results'])} 项变更", Colors.GREEN)
+        
+        if args.stats:
+            print_request_stats(manager)
     
     except Exception as e:
         print_colored(f"\n✗ 错误: {str(e)}", Colors.RED)
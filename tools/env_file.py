@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Env File - 共享的 .env 解析器
+Shared .env parser used by secrets_uploader, ssh_key_deployer and cloudflare_manager
+
+语法 | Grammar:
+    KEY=value                  未加引号：去除首尾空白，空白后的 # 开始行内注释
+    export KEY=value           兼容 shell 的 export 前缀
+    KEY='literal $VALUE'       单引号：原样保留，可跨行，不做插值
+    KEY="line1\\nline2 ${X}"   双引号：可跨行（PEM 私钥等），支持 \\n \\t \\r \\" \\\\ \\$ 转义和插值
+    ${VAR} / $VAR              插值：先查本文件中已定义的变量，再查环境变量
+    ${VAR:-default}            VAR 未设置或为空时使用 default（${VAR-default} 仅在未设置时）
+
+无法解析的引用（未定义且无默认值）保持原样，避免把密码中的 $ 当作变量吞掉。
+需要原样取值的调用方（如上传密钥）可传 interpolate=False, inline_comments=False，
+此时未加引号的值中的 $NAME 与 " #..." 都按字面保留。
+
+整个文件由一个预编译的正则单遍扫描；词法结果按 (mtime_ns, size) 缓存，
+插值在每次读取时基于当前环境变量重新计算。
+
+使用方法 | Usage:
+    from env_file import load_env_file
+    values = load_env_file('.env')
+"""
+
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+
+
+# 单遍扫描：每次匹配一个赋值语句（可跨多行的引号值）或跳过一行（空行、注释、无法识别的行）
+_TOKEN_RE = re.compile(r'''
+    [ \t]*(?:export[ \t]+)?
+    (?P<key>[A-Za-z_][A-Za-z0-9_.]*)
+    [ \t]*=[ \t]*
+    (?:
+        '(?P<single>[^']*)'
+      | "(?P<double>(?:\\.|[^"\\])*)"
+      | (?P<bare>[^\n]*?)
+    )
+    (?:(?P<comment>[ \t]+\#[^\n]*)|[ \t]*)
+    (?:\r?\n|\Z)
+  | [^\n]+\Z
+  | [^\n]*\n
+''', re.VERBOSE)
+
+# 双引号值：转义与插值在同一遍替换中处理
+_DOUBLE_RE = re.compile(r'\\(.)|\$\{([A-Za-z_][A-Za-z0-9_]*)(?:(:?-)([^}]*))?\}|\$([A-Za-z_][A-Za-z0-9_]*)',
+                        re.DOTALL)
+# 未加引号的值：只做插值
+_BARE_RE = re.compile(r'\$\{([A-Za-z_][A-Za-z0-9_]*)(?:(:?-)([^}]*))?\}|\$([A-Za-z_][A-Za-z0-9_]*)')
+
+_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '"': '"', '\\': '\\', '$': '$'}
+
+# 词法缓存：路径 -> (mtime_ns, size, [(key, value, quoting, comment)])
+_TOKEN_CACHE: Dict[str, Tuple[int, int, List[Tuple[str, str, str, str]]]] = {}
+
+
+def tokenize_env(text: str) -> List[Tuple[str, str, str, str]]:
+    """
+    将 .env 文本切分为 (key, 原始值, 引号类型, 行内注释) 列表
+
+    引号类型为 'single'、'double' 或 'bare'；行内注释为值后面的 " #..."（含前导空白，
+    没有时为空串）。同名变量按出现顺序全部保留，由插值阶段决定最终值（后者覆盖前者）。
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        key = match.group('key')
+        if key is None:
+            continue
+        for quoting in ('single', 'double', 'bare'):
+            value = match.group(quoting)
+            if value is not None:
+                tokens.append((key, value, quoting, match.group('comment') or ''))
+                break
+    return tokens
+
+
+def _lookup(name: str, values: Mapping[str, str], environ: Mapping[str, str]) -> Optional[str]:
+    if name in values:
+        return values[name]
+    return environ.get(name)
+
+
+def _expand(match: re.Match, values: Mapping[str, str], environ: Mapping[str, str], offset: int) -> str:
+    """替换一个 ${VAR} / ${VAR:-default} / $VAR 引用；无法解析时保持原样"""
+    braced, operator, default, plain = match.group(offset, offset + 1, offset + 2, offset + 3)
+    current = _lookup(braced or plain, values, environ)
+    if operator == ':-' and not current:
+        return default
+    if operator == '-' and current is None:
+        return default
+    return match.group(0) if current is None else current
+
+
+def resolve_env(tokens: List[Tuple[str, str, str, str]], environ: Optional[Mapping[str, str]] = None,
+                interpolate: bool = True, inline_comments: bool = True) -> Dict[str, str]:
+    """
+    按顺序处理转义与插值，返回 {KEY: value}
+
+    Args:
+        interpolate: False 时 $VAR / ${VAR} 原样保留
+        inline_comments: False 时未加引号值后的 " #..." 视为值的一部分（与旧版逐行解析一致）
+    """
+    environ = os.environ if environ is None else environ
+    values: Dict[str, str] = {}
+    for key, value, quoting, comment in tokens:
+        if quoting == 'double':
+            def replace(match, values=values):
+                if match.group(1) is not None:
+                    return _ESCAPES.get(match.group(1), match.group(0))
+                if not interpolate:
+                    return match.group(0)
+                return _expand(match, values, environ, 2)
+            if '\\' in value or '$' in value:
+                value = _DOUBLE_RE.sub(replace, value)
+        elif quoting == 'bare':
+            value = value.strip() if inline_comments else (value + comment).strip()
+            if interpolate and '$' in value:
+                value = _BARE_RE.sub(lambda m: _expand(m, values, environ, 1), value)
+        values[key] = value
+    return values
+
+
+def parse_env(text: str, environ: Optional[Mapping[str, str]] = None,
+              interpolate: bool = True, inline_comments: bool = True) -> Dict[str, str]:
+    """解析 .env 文本"""
+    return resolve_env(tokenize_env(text), environ, interpolate, inline_comments)
+
+
+def load_env_file(path: Union[str, Path], environ: Optional[Mapping[str, str]] = None,
+                  interpolate: bool = True, inline_comments: bool = True) -> Dict[str, str]:
+    """
+    读取并解析 .env 文件；文件未变化（mtime_ns + size）时复用缓存的词法结果
+
+    Raises:
+        FileNotFoundError: 文件不存在
+    """
+    key = os.path.abspath(path)
+    stat = os.stat(key)
+    cached = _TOKEN_CACHE.get(key)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        tokens = cached[2]
+    else:
+        with open(key, 'r', encoding='utf-8') as f:
+            tokens = tokenize_env(f.read())
+        _TOKEN_CACHE[key] = (stat.st_mtime_ns, stat.st_size, tokens)
+    return resolve_env(tokens, environ, interpolate, inline_comments)
+
+
+def clear_cache():
+    """清空词法缓存"""
+    _TOKEN_CACHE.clear()
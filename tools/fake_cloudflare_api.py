@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Fake Cloudflare API - 本地 Cloudflare API 替身，用于离线测试与压测
+Local stand-in for the Cloudflare v4 API used by cloudflare_manager.py
+
+实现的接口 | Implemented endpoints:
+    GET    /client/v4/zones
+    GET    /client/v4/zones/{zone_id}/dns_records
+    POST   /client/v4/zones/{zone_id}/dns_records
+    PUT    /client/v4/zones/{zone_id}/dns_records/{record_id}
+    PATCH  /client/v4/zones/{zone_id}/dns_records/{record_id}
+    DELETE /client/v4/zones/{zone_id}/dns_records/{record_id}
+
+支持 page/per_page 分页与 result_info、success/errors 响应信封、
+令牌桶限速（超限返回 429 + Retry-After）以及模拟网络延迟。
+
+使用方法 | Usage:
+    python tools/fake_cloudflare_api.py --port 8787 --zone example.com --records 1000
+    python tools/fake_cloudflare_api.py --rate-limit 4 --burst 10 --latency 0.02
+    python tools/cloudflare_manager.py --token test list -z example.com   # CLOUDFLARE_API_URL=http://127.0.0.1:8787/client/v4
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+
+API_PREFIX = '/client/v4'
+
+# Cloudflare 接口的分页上限 | Page size limits of the real API
+MAX_PER_PAGE = {'zones': 50, 'dns_records': 5000}
+DEFAULT_PER_PAGE = {'zones': 20, 'dns_records': 100}
+
+
+def make_zone_id(name: str) -> str:
+    """按域名生成稳定的 32 位十六进制 Zone ID"""
+    return hashlib.md5(name.encode('utf-8')).hexdigest()
+
+
+class FakeCloudflareState:
+    """Zone 与 DNS 记录的内存存储，以及限速与请求统计（线程安全）"""
+
+    def __init__(self, rate_limit: Optional[float] = None, burst: int = 10):
+        self.lock = threading.Lock()
+        self.zones: Dict[str, Dict] = {}
+        self.records: Dict[str, Dict[str, Dict]] = {}
+        self.rate_limit = rate_limit
+        self.burst = float(max(1, burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self.requests = 0
+        self.rate_limited = 0
+        self.by_method: Dict[str, int] = {}
+
+    def add_zone(self, name: str, status: str = 'active') -> str:
+        """添加 Zone，返回 Zone ID"""
+        zone_id = make_zone_id(name)
+        with self.lock:
+            self.zones[zone_id] = {'id': zone_id, 'name': name, 'status': status}
+            self.records.setdefault(zone_id, {})
+        return zone_id
+
+    def add_record(self, zone_id: str, record_type: str, name: str, content: str,
+                   proxied: bool = False, ttl: int = 1) -> Dict:
+        """直接写入一条记录（用于预置数据，不计入请求统计）"""
+        record = {
+            'id': uuid.uuid4().hex,
+            'zone_id': zone_id,
+            'zone_name': self.zones[zone_id]['name'],
+            'type': record_type,
+            'name': name,
+            'content': content,
+            'proxied': proxied,
+            'ttl': 1 if proxied else ttl,
+        }
+        with self.lock:
+            self.records[zone_id][record['id']] = record
+        return record
+
+    def seed(self, zone: str, count: int, prefix: str = 'host') -> str:
+        """添加 Zone 并预置 count 条 A 记录"""
+        zone_id = self.add_zone(zone)
+        for i in range(count):
+            self.add_record(zone_id, 'A', f"{prefix}-{i:05d}.{zone}",
+                            f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}")
+        return zone_id
+
+    def take_token(self) -> float:
+        """限速检查：返回 0 表示放行，否则返回建议的 Retry-After 秒数"""
+        with self.lock:
+            if not self.rate_limit:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate_limit)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            self.rate_limited += 1
+            return (1 - self._tokens) / self.rate_limit
+
+    def count(self, method: str):
+        with self.lock:
+            self.requests += 1
+            self.by_method[method] = self.by_method.get(method, 0) + 1
+
+    def snapshot_stats(self) -> Dict:
+        """返回服务端统计副本"""
+        with self.lock:
+            return {'requests': self.requests, 'rate_limited': self.rate_limited,
+                    'by_method': dict(self.by_method)}
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = 0
+            self.rate_limited = 0
+            self.by_method = {}
+
+
+def envelope(result=None, errors: Optional[List[Dict]] = None,
+             result_info: Optional[Dict] = None) -> Dict:
+    """构造 Cloudflare 风格的响应信封"""
+    body = {'success': not errors, 'errors': errors or [], 'messages': [], 'result': result}
+    if result_info is not None:
+        body['result_info'] = result_info
+    return body
+
+
+def paginate(items: List[Dict], query: Dict[str, List[str]], kind: str) -> Tuple[List[Dict], Dict]:
+    """按 page/per_page 切片，返回 (当前页, result_info)"""
+    try:
+        page = max(1, int(query.get('page', ['1'])[0]))
+        per_page = int(query.get('per_page', [str(DEFAULT_PER_PAGE[kind])])[0])
+    except ValueError:
+        page, per_page = 1, DEFAULT_PER_PAGE[kind]
+    per_page = max(1, min(per_page, MAX_PER_PAGE[kind]))
+    start = (page - 1) * per_page
+    chunk = items[start:start + per_page]
+    return chunk, {
+        'page': page,
+        'per_page': per_page,
+        'count': len(chunk),
+        'total_count': len(items),
+        'total_pages': max(1, math.ceil(len(items) / per_page)),
+    }
+
+
+class FakeCloudflareHandler(BaseHTTPRequestHandler):
+    """HTTP 请求处理（HTTP/1.1 keep-alive，便于测量连接复用）"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeCloudflare/1.0'
+    # 头部与正文分两次写出，关闭 Nagle 避免与客户端延迟 ACK 叠加出 40ms 停顿
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _send(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status: int, code: int, message: str, headers: Optional[Dict[str, str]] = None):
+        self._send(status, envelope(errors=[{'code': code, 'message': message}]), headers)
+
+    def _read_json(self) -> Optional[Dict]:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return None
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return None
+
+    def _handle(self, method: str):
+        state: FakeCloudflareState = self.server.state
+        body = self._read_json() if method in ('POST', 'PUT', 'PATCH') else None
+        state.count(method)
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if not (self.headers.get('Authorization') or self.headers.get('X-Auth-Key')):
+            self._error(403, 10000, 'Authentication error')
+            return
+
+        retry_after = state.take_token()
+        if retry_after:
+            self._error(429, 10013, 'Rate limited', {'Retry-After': str(max(1, math.ceil(retry_after)))})
+            return
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if not url.path.startswith(API_PREFIX):
+            self._error(404, 7000, 'No route for that URI')
+            return
+        parts = [p for p in url.path[len(API_PREFIX):].split('/') if p]
+
+        if parts == ['zones'] and method == 'GET':
+            self._list_zones(state, query)
+        elif len(parts) == 3 and parts[0] == 'zones' and parts[2] == 'dns_records':
+            if method == 'GET':
+                self._list_records(state, parts[1], query)
+            elif method == 'POST':
+                self._create_record(state, parts[1], body)
+            else:
+                self._error(405, 10000, 'Method not allowed')
+        elif len(parts) == 4 and parts[0] == 'zones' and parts[2] == 'dns_records':
+            if method in ('PUT', 'PATCH'):
+                self._update_record(state, parts[1], parts[3], body, replace=method == 'PUT')
+            elif method == 'DELETE':
+                self._delete_record(state, parts[1], parts[3])
+            elif method == 'GET':
+                self._get_record(state, parts[1], parts[3])
+            else:
+                self._error(405, 10000, 'Method not allowed')
+        else:
+            self._error(404, 7000, 'No route for that URI')
+
+    def _list_zones(self, state: FakeCloudflareState, query: Dict[str, List[str]]):
+        with state.lock:
+            zones = sorted(state.zones.values(), key=lambda z: z['name'])
+        if 'name' in query:
+            zones = [z for z in zones if z['name'] == query['name'][0]]
+        chunk, info = paginate(zones, query, 'zones')
+        self._send(200, envelope(chunk, result_info=info))
+
+    def _zone_records(self, state: FakeCloudflareState, zone_id: str) -> Optional[Dict[str, Dict]]:
+        records = state.records.get(zone_id)
+        if records is None:
+            self._error(404, 7003, 'Could not route to /zones/{}, perhaps your object identifier is invalid?'
+                        .format(zone_id))
+        return records
+
+    def _list_records(self, state: FakeCloudflareState, zone_id: str, query: Dict[str, List[str]]):
+        with state.lock:
+            records = self._zone_records(state, zone_id)
+            if records is None:
+                return
+            items = sorted(records.values(), key=lambda r: (r['name'], r['type'], r['id']))
+        if 'name' in query:
+            items = [r for r in items if r['name'] == query['name'][0].lower()]
+        if 'type' in query:
+            items = [r for r in items if r['type'] == query['type'][0].upper()]
+        chunk, info = paginate(items, query, 'dns_records')
+        self._send(200, envelope(chunk, result_info=info))
+
+    def _validate(self, body: Optional[Dict]) -> Optional[str]:
+        if not isinstance(body, dict):
+            return 'Invalid request body'
+        for field in ('type', 'name', 'content'):
+            if not body.get(field):
+                return f"DNS record {field} is required"
+        return None
+
+    def _create_record(self, state: FakeCloudflareState, zone_id: str, body: Optional[Dict]):
+        error = self._validate(body)
+        if error:
+            self._error(400, 9000, error)
+            return
+        with state.lock:
+            records = self._zone_records(state, zone_id)
+            if records is None:
+                return
+            name = body['name'].lower().rstrip('.')
+            for existing in records.values():
+                if (existing['type'], existing['name'], existing['content']) == (body['type'], name, body['content']):
+                    self._error(400, 81058, 'An identical record already exists.')
+                    return
+            proxied = bool(body.get('proxied', False))
+            record = {
+                'id': uuid.uuid4().hex,
+                'zone_id': zone_id,
+                'zone_name': state.zones[zone_id]['name'],
+                'type': body['type'],
+                'name': name,
+                'content': body['content'],
+                'proxied': proxied,
+                'ttl': 1 if proxied else int(body.get('ttl', 1)),
+            }
+            records[record['id']] = record
+        self._send(200, envelope(record))
+
+    def _get_record(self, state: FakeCloudflareState, zone_id: str, record_id: str):
+        with state.lock:
+            records = self._zone_records(state, zone_id)
+            if records is None:
+                return
+            record = records.get(record_id)
+        if record is None:
+            self._error(404, 81044, 'Record does not exist.')
+            return
+        self._send(200, envelope(record))
+
+    def _update_record(self, state: FakeCloudflareState, zone_id: str, record_id: str,
+                       body: Optional[Dict], replace: bool):
+        error = self._validate(body) if replace else (None if isinstance(body, dict) else 'Invalid request body')
+        if error:
+            self._error(400, 9000, error)
+            return
+        with state.lock:
+            records = self._zone_records(state, zone_id)
+            if records is None:
+                return
+            record = records.get(record_id)
+            if record is None:
+                self._error(404, 81044, 'Record does not exist.')
+                return
+            for field in ('type', 'name', 'content', 'proxied', 'ttl'):
+                if field in body:
+                    record[field] = body[field].lower().rstrip('.') if field == 'name' else body[field]
+            if record['proxied']:
+                record['ttl'] = 1
+            result = dict(record)
+        self._send(200, envelope(result))
+
+    def _delete_record(self, state: FakeCloudflareState, zone_id: str, record_id: str):
+        with state.lock:
+            records = self._zone_records(state, zone_id)
+            if records is None:
+                return
+            if records.pop(record_id, None) is None:
+                self._error(404, 81044, 'Record does not exist.')
+                return
+        self._send(200, envelope({'id': record_id}))
+
+
+class FakeCloudflareAPI:
+    """
+    在后台线程运行的 Fake Cloudflare API 服务
+
+    用法:
+        with FakeCloudflareAPI(rate_limit=4) as api:
+            zone_id = api.state.seed('example.com', 1000)
+            manager = CloudflareManager(api_token='test', base_url=api.url)
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, rate_limit: Optional[float] = None,
+                 burst: int = 10, latency: float = 0.0, verbose: bool = False):
+        self.state = FakeCloudflareState(rate_limit, burst)
+        self.server = ThreadingHTTPServer((host, port), FakeCloudflareHandler)
+        self.server.daemon_threads = True
+        self.server.state = self.state
+        self.server.latency = latency
+        self.server.verbose = verbose
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def start(self) -> 'FakeCloudflareAPI':
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='本地 Fake Cloudflare API | Local fake Cloudflare API')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址（默认: 127.0.0.1）')
+    parser.add_argument('--port', type=int, default=8787, help='监听端口（默认: 8787）')
+    parser.add_argument('--zone', action='append', help='预置的 Zone，可重复（默认: example.com）')
+    parser.add_argument('--records', type=int, default=0, help='每个 Zone 预置的 A 记录数')
+    parser.add_argument('--rate-limit', type=float, help='每秒允许的请求数，超出返回 429（默认: 不限速）')
+    parser.add_argument('--burst', type=int, default=10, help='限速令牌桶容量（默认: 10）')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求附加的延迟，秒（默认: 0）')
+    parser.add_argument('-v', '--verbose', action='store_true', help='打印访问日志')
+    args = parser.parse_args()
+
+    api = FakeCloudflareAPI(args.host, args.port, args.rate_limit, args.burst, args.latency, args.verbose)
+    for zone in args.zone or ['example.com']:
+        zone_id = api.state.seed(zone, args.records)
+        print(f"  {zone}: {zone_id} ({args.records} records)")
+    print(f"✓ Fake Cloudflare API listening on {api.url}")
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.server.server_close()
+        print(f"\n{json.dumps(api.state.snapshot_stats())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,21 +6,146 @@ Inventory Generator - 从统一配置生成 Ansible Inventory
 
 import sys
 import os
+import argparse
+import hashlib
+import json
+import pickle
+import stat
+import tempfile
 import yaml
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
 
 
-def load_config(config_file: str = "inventories/production/servers-config.yml") -> Dict[str, Any]:
+DEFAULT_CONFIG_FILE = "inventories/production/servers-config.yml"
+
+# 解析缓存目录（相对项目根目录，make clean 会清理 .cache/）
+# Parsed-config cache directory (relative to project root, removed by make clean)
+CONFIG_CACHE_DIR = ".cache/inventory"
+CONFIG_CACHE_VERSION = 1
+
+# 二进制快照格式版本，结构变化时递增 | Bump when the snapshot layout changes
+SNAPSHOT_SCHEMA_VERSION = 1
+OUTPUT_FORMATS = ('yaml', 'json', 'pickle')
+
+# grouped: 主机变量在每个所属组中重复输出（默认，兼容现有 hosts.yml）
+# shared:  主机变量只在 all.hosts 中输出一次，组内只引用主机名
+# grouped repeats host vars in every group (default); shared emits them
+# once under all.hosts and lists bare host names in groups
+INVENTORY_LAYOUTS = ('grouped', 'shared')
+
+INVENTORY_TITLES = {
+    'local': "# 本地环境 Inventory (使用环境变量)",
+    'github-actions': "# GitHub Actions Inventory (使用 Secrets)",
+}
+
+# 各环境包含的 server_environment 取值；None 表示全部服务器（production 的现有行为）
+# 可在 servers-config.yml 中用 environments: 覆盖
+# server_environment values included per environment; None keeps every
+# server (current production behaviour). Override with an ``environments:``
+# section in servers-config.yml.
+DEFAULT_ENVIRONMENTS = {
+    'production': {'server_environments': None},
+    'staging': {'server_environments': ['staging', 'test']},
+    'development': {'server_environments': ['development']},
+}
+
+# 各 flavour 在环境目录下的输出文件名（不含扩展名）
+# Output file stem per flavour inside each environment directory
+FLAVOUR_OUTPUT_STEMS = {
+    'local': 'hosts',
+    'github-actions': 'hosts.github-actions',
+}
+OUTPUT_EXTENSIONS = {'yaml': 'yml', 'json': 'json', 'pickle': 'pickle'}
+
+# 优先使用 libyaml 的 C 解析器 | Prefer the libyaml C loader when available
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def _project_root() -> Path:
+    """获取项目根目录 | Get the project root (parent of tools/)"""
+    return Path(__file__).parent.parent
+
+
+def _parse_yaml(text: str) -> Any:
+    """解析 YAML 文本 | Parse YAML text with the fastest safe loader"""
+    return yaml.load(text, Loader=_YAML_LOADER)
+
+
+def load_config(config_file: str = DEFAULT_CONFIG_FILE) -> Dict[str, Any]:
     """加载服务器配置"""
     # 获取脚本所在目录的父目录（项目根目录）
     # Get the parent directory of the script (project root)
-    script_dir = Path(__file__).parent
-    project_root = script_dir.parent
-    config_path = project_root / config_file
+    config_path = _project_root() / config_file
     
     with open(config_path, 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+        return _parse_yaml(f.read())
+
+
+def _read_config_cache(cache_path: Path) -> Optional[Dict[str, Any]]:
+    """读取解析缓存，缓存损坏或版本不符时返回 None"""
+    try:
+        with open(cache_path, 'rb') as f:
+            entry = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        return None
+    if not isinstance(entry, dict) or entry.get('version') != CONFIG_CACHE_VERSION:
+        return None
+    return entry
+
+
+def _write_config_cache(cache_path: Path, entry: Dict[str, Any]) -> None:
+    """原子写入解析缓存；缓存只是优化，写入失败时静默忽略"""
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_output(str(cache_path), binary=True) as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
+
+
+def load_config_cached(config_file: str = DEFAULT_CONFIG_FILE,
+                       cache_dir: Optional[str] = None) -> Dict[str, Any]:
+    """加载服务器配置（带解析缓存）
+
+    缓存以配置文件的 mtime 和内容 sha256 为键：
+    mtime 和大小未变时直接复用缓存，不读取文件；
+    mtime 变化但内容哈希一致时（如 git checkout）复用缓存并刷新 mtime；
+    否则重新解析 YAML 并写入缓存。
+
+    The cache is keyed on the file's mtime and sha256: an unchanged
+    mtime/size reuses the cache without reading the file, a touched but
+    identical file reuses it after re-hashing, anything else is re-parsed.
+    """
+    config_path = _project_root() / config_file
+    cache_root = Path(cache_dir) if cache_dir else _project_root() / CONFIG_CACHE_DIR
+    cache_key = hashlib.sha256(str(config_path.resolve()).encode('utf-8')).hexdigest()[:16]
+    cache_path = cache_root / f"servers-config-{cache_key}.pickle"
+
+    stat = config_path.stat()
+    cached = _read_config_cache(cache_path)
+    if (cached is not None
+            and cached['mtime_ns'] == stat.st_mtime_ns
+            and cached['size'] == stat.st_size):
+        return cached['config']
+
+    raw = config_path.read_bytes()
+    digest = hashlib.sha256(raw).hexdigest()
+    if cached is not None and cached['sha256'] == digest:
+        config = cached['config']
+    else:
+        config = _parse_yaml(raw.decode('utf-8'))
+
+    _write_config_cache(cache_path, {
+        'version': CONFIG_CACHE_VERSION,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': digest,
+        'config': config,
+    })
+    return config
 
 
 def generate_local_inventory(config: Dict[str, Any]) -> Dict[str, Any]:
@@ -153,69 +278,549 @@ def generate_github_actions_inventory(config: Dict[str, Any],
     return inventory
 
 
+def share_host_vars(inventory: Dict[str, Any]) -> Dict[str, Any]:
+    """转换为 shared 布局：主机变量只保留一份
+
+    Ansible 的主机变量本就按主机合并，与组无关，因此将各组中的主机变量
+    合并到 all.hosts 后语义不变，输出体积和解析时间不再随主机所属组数增长。
+
+    Ansible merges host vars per host regardless of the group that declared
+    them, so hoisting them into all.hosts keeps the same semantics while the
+    output no longer grows with the number of groups per host.
+    """
+    root = inventory['all']
+    hosts: Dict[str, Dict[str, Any]] = {}
+    for host_name, host_vars in (root.get('hosts') or {}).items():
+        hosts.setdefault(host_name, {}).update(host_vars or {})
+
+    children = {}
+    for group_name, group in (root.get('children') or {}).items():
+        members = {}
+        for host_name, host_vars in (group.get('hosts') or {}).items():
+            hosts.setdefault(host_name, {}).update(host_vars or {})
+            members[host_name] = None
+        children[group_name] = {**group, 'hosts': members}
+
+    shared: Dict[str, Any] = {'hosts': hosts, 'children': children}
+    if 'vars' in root:
+        shared['vars'] = root['vars']
+    return {'all': shared}
+
+
+class NoAliasDumper(yaml.SafeDumper):
+    """Custom dumper to handle Jinja2 templates properly"""
+
+    def ignore_aliases(self, data):
+        return True
+
+
+# 自定义字符串表示器，对 Jinja2 模板使用双引号
+# Custom string representer: use double quotes for Jinja2 templates
+def represent_str(dumper, data):
+    # 如果字符串包含 Jinja2 模板语法，使用双引号样式
+    # If string contains Jinja2 template syntax, use double-quoted style
+    if '{{' in data and '}}' in data:
+        # 使用双引号样式 (") 而不是单引号 (')
+        # Use double-quoted style (") instead of single-quoted (')
+        return dumper.represent_scalar('tag:yaml.org,2002:str', data, style='"')
+    # 对于普通字符串，使用默认样式
+    # For regular strings, use default style
+    return dumper.represent_scalar('tag:yaml.org,2002:str', data)
+
+
+# 注册自定义的字符串表示器
+# Register custom string representer
+NoAliasDumper.add_representer(str, represent_str)
+
+YAML_DUMP_OPTIONS = {
+    'default_flow_style': False,
+    'allow_unicode': True,
+    'sort_keys': False,
+    'indent': 2,
+}
+
+# 流式输出时逐项展开的层级：根 -> all -> children/hosts -> 单个组/主机
+# Levels expanded entry by entry when streaming: root -> all -> children/hosts
+STREAM_DEPTH = 3
+
+
 def generate_inventory_yaml(inventory: Dict[str, Any]) -> str:
     """生成 YAML 格式的 inventory"""
-    
-    # Custom dumper to handle Jinja2 templates properly
-    class NoAliasDumper(yaml.SafeDumper):
-        def ignore_aliases(self, data):
-            return True
-    
-    # 自定义字符串表示器，对 Jinja2 模板使用双引号
-    # Custom string representer: use double quotes for Jinja2 templates
-    def represent_str(dumper, data):
-        # 如果字符串包含 Jinja2 模板语法，使用双引号样式
-        # If string contains Jinja2 template syntax, use double-quoted style
-        if '{{' in data and '}}' in data:
-            # 使用双引号样式 (") 而不是单引号 (')
-            # Use double-quoted style (") instead of single-quoted (')
-            return dumper.represent_scalar('tag:yaml.org,2002:str', data, style='"')
-        # 对于普通字符串，使用默认样式
-        # For regular strings, use default style
-        return dumper.represent_scalar('tag:yaml.org,2002:str', data)
-    
-    # 注册自定义的字符串表示器
-    # Register custom string representer
-    NoAliasDumper.add_representer(str, represent_str)
-    
-    return yaml.dump(inventory, 
-                     Dumper=NoAliasDumper,
-                     default_flow_style=False, 
-                     allow_unicode=True,
-                     sort_keys=False,
-                     indent=2)
+    return yaml.dump(inventory, Dumper=NoAliasDumper, **YAML_DUMP_OPTIONS)
+
+
+def _emit_yaml_node(dumper: NoAliasDumper, data: Any):
+    """表示并序列化单个子树，随后清空 dumper 的对象表以释放内存"""
+    node = dumper.represent_data(data)
+    dumper.anchor_node(node)
+    dumper.serialize_node(node, None, None)
+    dumper.represented_objects = {}
+    dumper.object_keeper = []
+    dumper.alias_key = None
+    dumper.serialized_nodes = {}
+    dumper.anchors = {}
+
+
+def _emit_yaml_streamed(dumper: NoAliasDumper, data: Any, depth: int):
+    """逐项输出映射的前 depth 层，更深的子树整体输出"""
+    if depth == 0 or not isinstance(data, dict) or not data:
+        _emit_yaml_node(dumper, data)
+        return
+    dumper.emit(yaml.MappingStartEvent(anchor=None, tag='tag:yaml.org,2002:map',
+                                       implicit=True, flow_style=False))
+    for key, value in data.items():
+        _emit_yaml_node(dumper, key)
+        _emit_yaml_streamed(dumper, value, depth - 1)
+    dumper.emit(yaml.MappingEndEvent())
+
+
+def write_inventory_yaml(inventory: Dict[str, Any], stream) -> None:
+    """将 inventory 以 YAML 流式写入文件对象
+
+    逐组（shared 布局下逐主机）表示和输出，任一时刻只有一个组的节点树在内存中；
+    输出与 generate_inventory_yaml 逐字节一致。
+
+    Write the inventory to ``stream`` one group (or shared host) at a time,
+    so only a single group's node tree is held in memory. The output is
+    byte-identical to ``generate_inventory_yaml``.
+    """
+    dumper = NoAliasDumper(stream, **YAML_DUMP_OPTIONS)
+    try:
+        dumper.open()
+        dumper.emit(yaml.DocumentStartEvent(explicit=False))
+        _emit_yaml_streamed(dumper, inventory, STREAM_DEPTH)
+        dumper.emit(yaml.DocumentEndEvent(explicit=False))
+        dumper.close()
+    finally:
+        dumper.dispose()
+
+
+@contextmanager
+def _temp_output(path: str, binary: bool = False, mode: Optional[int] = None):
+    """在目标目录创建临时文件，产出 (临时路径, 文件对象)
+
+    权限在写入任何内容之前通过 fchmod 设置：mode 为空时沿用目标文件权限（不存在则按 umask）。
+    The mode is applied with fchmod before anything is written: ``mode``
+    if given, else the target's current mode, else 0666 & ~umask.
+    """
+    target = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix='.tmp')
+    try:
+        if mode is None and target.exists():
+            mode = stat.S_IMODE(target.stat().st_mode)
+        elif mode is None:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.fchmod(fd, mode)
+        f = os.fdopen(fd, 'wb' if binary else 'w', **({} if binary else {'encoding': 'utf-8'}))
+    except BaseException:
+        os.close(fd)
+        os.unlink(tmp_path)
+        raise
+    try:
+        with f:
+            yield tmp_path, f
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+@contextmanager
+def atomic_output(path: str, binary: bool = False, mode: Optional[int] = None):
+    """原子写入文件：先写同目录临时文件，成功后 os.replace 替换目标
+
+    Write to a temporary file in the target directory and ``os.replace``
+    it into place on success, so readers never see a partial file.
+    ``mode`` forces the file mode (e.g. 0o600 for secrets) from the first
+    byte on; by default the target's existing mode is kept.
+    """
+    with _temp_output(path, binary, mode) as (tmp_path, f):
+        yield f
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def generate_inventory_json(inventory: Dict[str, Any]) -> str:
+    """生成紧凑 JSON 格式的 inventory
+
+    不设置 indent 时 json 使用 C 加速编码器；Ansible 的 yaml 插件可直接读取 .json 文件。
+    Without indent json uses its C-accelerated encoder; Ansible's yaml
+    inventory plugin reads .json files as-is.
+    """
+    return json.dumps(inventory, ensure_ascii=False, separators=(',', ':'))
+
+
+def generate_inventory_snapshot(inventory: Dict[str, Any]) -> bytes:
+    """生成带 schema 版本的 pickle 二进制快照
+
+    快照只应由本工具生成并在本地读取，不要加载来源不明的文件。
+    Snapshots are meant to be produced by this tool and read locally;
+    never load a snapshot from an untrusted source.
+    """
+    return pickle.dumps(
+        {'schema': SNAPSHOT_SCHEMA_VERSION, 'inventory': inventory},
+        protocol=pickle.HIGHEST_PROTOCOL,
+    )
+
+
+def load_inventory(path: str) -> Dict[str, Any]:
+    """加载生成的 inventory（pickle 快照、JSON 或 YAML，按内容自动识别）
+
+    Load a generated inventory, detecting pickle snapshot, JSON or YAML
+    from the file contents.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+
+    if raw[:1] == b'\x80':
+        snapshot = pickle.loads(raw)
+        if not isinstance(snapshot, dict) or snapshot.get('schema') != SNAPSHOT_SCHEMA_VERSION:
+            raise ValueError(
+                f"Unsupported inventory snapshot schema in {path}: "
+                f"expected {SNAPSHOT_SCHEMA_VERSION}, got {snapshot.get('schema') if isinstance(snapshot, dict) else None}"
+            )
+        return snapshot['inventory']
+
+    text = raw.decode('utf-8')
+    if text.lstrip().startswith('{'):
+        return json.loads(text)
+    return _parse_yaml(text)
+
+
+def _index_inventory(inventory: Dict[str, Any]) -> Dict[str, Any]:
+    """将生成的 inventory 展开为 主机 -> (所属组, 主机变量) 与 组 -> (组变量, 成员) 的索引"""
+    root = (inventory or {}).get('all') or {}
+    hosts: Dict[str, Dict[str, Any]] = {}
+    groups: Dict[str, Dict[str, Any]] = {}
+
+    def add_host(host_name: str, host_vars: Optional[Dict[str, Any]], group: Optional[str]):
+        entry = hosts.setdefault(host_name, {'groups': set(), 'vars': {}})
+        entry['vars'].update(host_vars or {})
+        if group:
+            entry['groups'].add(group)
+
+    for host_name, host_vars in (root.get('hosts') or {}).items():
+        add_host(host_name, host_vars, None)
+
+    for group_name, group in (root.get('children') or {}).items():
+        group = group or {}
+        members = group.get('hosts') or {}
+        groups[group_name] = {'vars': group.get('vars') or {}, 'hosts': set(members)}
+        for host_name, host_vars in members.items():
+            add_host(host_name, host_vars, group_name)
+
+    return {'vars': root.get('vars') or {}, 'hosts': hosts, 'groups': groups}
+
+
+def diff_inventories(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """比较两份生成的 inventory，返回机器可读的变更列表
+
+    affected_hosts 包含新增/修改的主机，以及全局或组变量变化波及的主机，
+    可直接用于 --limit 或清理 fact 缓存；removed 的主机已不在新 inventory 中。
+
+    Compare two generated inventories. ``affected_hosts`` lists every host
+    in the new inventory whose effective vars or membership may differ and
+    is suitable for ``--limit``; removed hosts are reported separately.
+    """
+    old = _index_inventory(previous)
+    new = _index_inventory(current)
+
+    def compare(old_items: Dict[str, Any], new_items: Dict[str, Any]) -> Dict[str, List[str]]:
+        return {
+            'added': sorted(set(new_items) - set(old_items)),
+            'removed': sorted(set(old_items) - set(new_items)),
+            'modified': sorted(name for name in set(old_items) & set(new_items)
+                               if old_items[name] != new_items[name]),
+        }
+
+    host_changes = compare(old['hosts'], new['hosts'])
+    group_changes = compare(old['groups'], new['groups'])
+    global_vars_changed = old['vars'] != new['vars']
+
+    if global_vars_changed:
+        affected = set(new['hosts'])
+    else:
+        affected = set(host_changes['added']) | set(host_changes['modified'])
+        for group_name in group_changes['added'] + group_changes['modified']:
+            affected |= new['groups'][group_name]['hosts']
+
+    affected_hosts = sorted(affected)
+    return {
+        'changed': bool(global_vars_changed or affected_hosts
+                        or host_changes['removed'] or group_changes['removed']),
+        'global_vars_changed': global_vars_changed,
+        'hosts': host_changes,
+        'groups': group_changes,
+        'affected_hosts': affected_hosts,
+        'limit': ','.join(affected_hosts),
+    }
+
+
+def build_delta_inventory(inventory: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+    """只保留变更涉及的组和主机，生成增量 inventory
+
+    组变量始终保留以便增量 inventory 可独立使用；全局变量仅在变化时输出。
+    Keep only the groups and hosts touched by ``changes``. Group vars are
+    kept so the delta is usable on its own; ``all.vars`` only when changed.
+    """
+    root = inventory['all']
+    affected = set(changes['affected_hosts'])
+    changed_groups = set(changes['groups']['added']) | set(changes['groups']['modified'])
+
+    children = {}
+    for group_name, group in (root.get('children') or {}).items():
+        hosts = {name: host_vars for name, host_vars in (group.get('hosts') or {}).items()
+                 if name in affected}
+        if hosts or group_name in changed_groups:
+            children[group_name] = {'hosts': hosts, 'vars': group.get('vars', {})}
+
+    delta: Dict[str, Any] = {'all': {'children': children}}
+    if 'hosts' in root:
+        delta['all']['hosts'] = {name: host_vars for name, host_vars in root['hosts'].items()
+                                 if name in affected}
+    if changes['global_vars_changed']:
+        delta['all']['vars'] = root.get('vars', {})
+    return delta
+
+
+def write_inventory(stream, inventory: Dict[str, Any], output_format: str, title: str) -> None:
+    """按格式写出 inventory；YAML 带标题注释并流式输出
+
+    Write the inventory in ``output_format``. YAML is streamed with the
+    same header comments the CLI has always printed.
+    """
+    if output_format == 'pickle':
+        stream.write(generate_inventory_snapshot(inventory))
+    elif output_format == 'json':
+        stream.write(generate_inventory_json(inventory) + '\n')
+    else:
+        stream.write(f"{title}\n# 从 servers-config.yml 生成\n\n")
+        write_inventory_yaml(inventory, stream)
+        stream.write('\n')
+
+
+def build_inventory(config: Dict[str, Any], flavour: str, layout: str = 'grouped') -> Dict[str, Any]:
+    """按 flavour 与布局生成 inventory 字典"""
+    if flavour == 'local':
+        inventory = generate_local_inventory(config)
+    else:
+        inventory = generate_github_actions_inventory(config, use_secrets=True)
+    if layout == 'shared':
+        inventory = share_host_vars(inventory)
+    return inventory
+
+
+def select_environment(config: Dict[str, Any],
+                       server_environments: Optional[Iterable[str]]) -> Dict[str, Any]:
+    """按 server_environment 过滤服务器，返回该环境的配置
+
+    未声明 server_environment 的服务器视为 production。
+    Servers without ``server_environment`` count as production.
+    """
+    if server_environments is None:
+        return config
+    wanted = set(server_environments)
+    selected = dict(config)
+    for section in ('production_servers', 'github_actions_servers'):
+        selected[section] = {
+            name: info for name, info in (config.get(section) or {}).items()
+            if info.get('server_environment', 'production') in wanted
+        }
+    return selected
+
+
+def iter_environments(config: Dict[str, Any], root: Optional[str] = None,
+                      environments: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[str, Path, Dict[str, Any]]]:
+    """逐个产出 (环境名, inventories/<环境> 目录, 该环境的配置)
+
+    环境取自 environments 参数、servers-config.yml 的 environments: 或 DEFAULT_ENVIRONMENTS；
+    generate_all_environments 与 known_hosts.py 共用同一划分。
+    Yield each environment's name, directory and filtered config; shared
+    by generate_all_environments and tools/known_hosts.py.
+    """
+    root_path = Path(root) if root else _project_root()
+    environments = environments or config.get('environments') or DEFAULT_ENVIRONMENTS
+    for env_name, env_def in environments.items():
+        env_config = select_environment(config, (env_def or {}).get('server_environments'))
+        yield env_name, root_path / 'inventories' / env_name, env_config
+
+
+def _render_inventory_job(job: Dict[str, Any]) -> str:
+    """进程池工作函数：生成一份 inventory 写入目标目录的临时文件，返回临时路径"""
+    inventory = build_inventory(job['config'], job['flavour'], job['layout'])
+    binary = job['format'] == 'pickle'
+    with _temp_output(job['path'], binary) as (tmp_path, f):
+        write_inventory(f, inventory, job['format'], INVENTORY_TITLES[job['flavour']])
+    return tmp_path
+
+
+def generate_all_environments(config: Dict[str, Any], root: Optional[str] = None,
+                              environments: Optional[Dict[str, Any]] = None,
+                              flavours: Iterable[str] = ('local', 'github-actions'),
+                              output_format: str = 'yaml', layout: str = 'grouped',
+                              max_workers: Optional[int] = None) -> List[str]:
+    """一次生成所有环境、所有 flavour 的 inventory
+
+    配置只解析一次，各环境的生成分发到进程池；所有输出先写临时文件，
+    全部成功后才统一替换，任一失败则不修改任何现有文件。
+
+    Generate every environment/flavour from one parsed config, fanning the
+    work out over a process pool. Outputs are written to temp files and
+    only renamed into place once all of them succeeded.
+    """
+    jobs = []
+    for env_name, env_dir, env_config in iter_environments(config, root, environments):
+        env_dir.mkdir(parents=True, exist_ok=True)
+        for flavour in flavours:
+            filename = f"{FLAVOUR_OUTPUT_STEMS[flavour]}.{OUTPUT_EXTENSIONS[output_format]}"
+            jobs.append({
+                'environment': env_name,
+                'config': env_config,
+                'flavour': flavour,
+                'layout': layout,
+                'format': output_format,
+                'path': str(env_dir / filename),
+            })
+
+    if max_workers == 1 or len(jobs) <= 1:
+        results = []
+        for job in jobs:
+            try:
+                results.append((_render_inventory_job(job), None))
+            except Exception as e:
+                results.append((None, e))
+                break
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_render_inventory_job, job) for job in jobs]
+        results = [(None, f.exception()) if f.exception() else (f.result(), None) for f in futures]
+
+    tmp_paths = [tmp_path for tmp_path, _ in results if tmp_path]
+    failures = [(job, error) for job, (_, error) in zip(jobs, results) if error]
+    if failures or len(tmp_paths) != len(jobs):
+        for tmp_path in tmp_paths:
+            os.unlink(tmp_path)
+        if not failures:
+            raise Exception(f"只生成了 {len(tmp_paths)}/{len(jobs)} 份 inventory，未修改任何文件")
+        # 保留原异常类型，只补充出错的环境 | Keep the exception type, name the failing environment
+        job, error = failures[0]
+        error.add_note(f"while generating {job['environment']}/{job['flavour']} ({job['path']})")
+        raise error
+
+    written = []
+    for job, tmp_path in zip(jobs, tmp_paths):
+        os.replace(tmp_path, job['path'])
+        written.append(job['path'])
+    return written
+
+
+def positive_int(value: str) -> int:
+    """argparse 类型：正整数 | argparse type accepting integers >= 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return number
 
 
 def main():
     """主函数"""
-    if len(sys.argv) < 2:
-        print("Usage: python generate_inventory.py [local|github-actions]")
-        print("\nExamples:")
-        print("  python generate_inventory.py local")
-        print("  python generate_inventory.py github-actions")
+    parser = argparse.ArgumentParser(
+        description="从 servers-config.yml 生成 Ansible Inventory",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python generate_inventory.py local
+  python generate_inventory.py github-actions
+  python generate_inventory.py local --format json > hosts.json
+  python generate_inventory.py local --format pickle > hosts.pickle
+  python generate_inventory.py local --layout shared
+  python generate_inventory.py local --output inventories/production/hosts.yml
+
+  # 一次生成 production/staging/development 的 local 与 github-actions inventory
+  # Generate every environment and both flavours in one run
+  python generate_inventory.py all --jobs 4
+
+  # 只输出相对上次生成结果的增量，并写出变更列表
+  # Emit only the delta against the previous output plus a change list
+  python generate_inventory.py local --previous inventories/production/hosts.yml \\
+      --delta --changes /tmp/inventory-changes.json
+        """
+    )
+    parser.add_argument('mode', nargs='?', choices=['local', 'github-actions', 'all'],
+                        help='Inventory 类型，all 生成所有环境 | Inventory flavour, or all environments')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='yaml',
+                        help='输出格式（默认: yaml）| Output format (default: yaml)')
+    parser.add_argument('-o', '--output', metavar='PATH',
+                        help='原子写入该文件而不是标准输出 | Write atomically to PATH instead of stdout')
+    parser.add_argument('--layout', choices=INVENTORY_LAYOUTS, default='grouped',
+                        help='主机变量布局（默认: grouped）| Host vars layout (default: grouped)')
+    parser.add_argument('--previous', metavar='PATH',
+                        help='上次生成的 inventory（yaml/json/pickle），用于计算变更 | '
+                             'Previously generated inventory to diff against')
+    parser.add_argument('--changes', metavar='PATH',
+                        help='将 JSON 变更列表写入该文件（需要 --previous）| '
+                             'Write the JSON change list here (requires --previous)')
+    parser.add_argument('--delta', action='store_true',
+                        help='只输出变更的组和主机（需要 --previous）| '
+                             'Emit only changed groups and hosts (requires --previous)')
+    parser.add_argument('--jobs', type=positive_int, default=None,
+                        help='all 模式的并行进程数（默认: CPU 数）| Worker processes for all mode')
+
+    args = parser.parse_args()
+
+    if not args.mode:
+        parser.print_usage()
+        print("\nAvailable modes: local, github-actions, all")
         sys.exit(1)
-    
-    mode = sys.argv[1]
+
+    if args.mode == 'all':
+        if args.output or args.previous or args.changes or args.delta:
+            parser.error('all mode writes inventories/<env>/ itself; '
+                         '--output/--previous/--changes/--delta are not supported')
+        written = generate_all_environments(load_config_cached(), output_format=args.format,
+                                            layout=args.layout, max_workers=args.jobs)
+        for path in written:
+            print(f"✓ Inventory written: {os.path.relpath(path, _project_root())}")
+        return
+
     config = load_config()
-    
-    if mode == 'local':
-        print("# 本地环境 Inventory (使用环境变量)")
-        print("# 从 servers-config.yml 生成")
-        print()
-        inventory = generate_local_inventory(config)
-        print(generate_inventory_yaml(inventory))
-        
-    elif mode == 'github-actions':
-        print("# GitHub Actions Inventory (使用 Secrets)")
-        print("# 从 servers-config.yml 生成")
-        print()
-        inventory = generate_github_actions_inventory(config, use_secrets=True)
-        print(generate_inventory_yaml(inventory))
-        
+    title = INVENTORY_TITLES[args.mode]
+    inventory = build_inventory(config, args.mode, args.layout)
+
+    if (args.changes or args.delta) and not args.previous:
+        parser.error('--changes and --delta require --previous')
+
+    if args.previous:
+        previous = load_inventory(args.previous) if os.path.exists(args.previous) else {}
+        changes = diff_inventories(previous, inventory)
+        if args.changes:
+            with open(args.changes, 'w', encoding='utf-8') as f:
+                json.dump(changes, f, ensure_ascii=False, indent=2)
+        if args.delta:
+            title += " - 增量 | Delta"
+            inventory = build_delta_inventory(inventory, changes)
+
+    if args.output:
+        if (args.previous and not changes['changed'] and not args.delta
+                and os.path.exists(args.output)):
+            print(f"✓ Inventory unchanged, kept: {args.output}", file=sys.stderr)
+            return
+        with atomic_output(args.output, binary=args.format == 'pickle') as f:
+            write_inventory(f, inventory, args.format, title)
+        print(f"✓ Inventory written: {args.output}", file=sys.stderr)
+    elif args.format == 'pickle':
+        write_inventory(sys.stdout.buffer, inventory, args.format, title)
+        sys.stdout.buffer.flush()
     else:
-        print(f"Unknown mode: {mode}")
-        print("Available modes: local, github-actions")
-        sys.exit(1)
+        write_inventory(sys.stdout, inventory, args.format, title)
 
 
 if __name__ == '__main__':
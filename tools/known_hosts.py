@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Known Hosts - 主机密钥采集与固定
+Collect SSH host keys for servers-config.yml hosts and pin them in a managed known_hosts file
+
+并发连接每台主机，对每种主机密钥类型各做一次 SSH 握手（不认证），
+把结果写入每个环境目录下受管的 known_hosts（inventories/<环境>/known_hosts，
+已加入 .gitignore）。环境划分与 generate_inventory.py all 相同，每个文件只包含该环境
+inventory 中的主机。已记录的主机密钥发生变化时不会被覆盖，需显式 --update。
+
+Ansible 通过 servers-config.yml global_vars 中的 UserKnownHostsFile={{ inventory_dir }}/known_hosts
+读取所用 inventory 对应环境的文件；ssh_key_deployer 使用 RejectPolicy 严格校验
+production 的文件（包含全部主机）。
+
+使用方法 | Usage:
+    python tools/known_hosts.py                                  # servers-config.yml 中的全部主机
+    python tools/known_hosts.py --group web_servers --environment production
+    python tools/known_hosts.py --host 203.0.113.10 --host [2001:db8::1]:2222
+    python tools/known_hosts.py --check                          # 只比对，不写文件
+    python tools/known_hosts.py --update                         # 接受已变化的主机密钥（确认重装后）
+    python tools/known_hosts.py --known-hosts /tmp/known_hosts   # 全部主机写入单个文件
+"""
+
+import argparse
+import base64
+import hashlib
+import logging
+import os
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import paramiko
+
+from env_file import load_env_file
+from generate_inventory import DEFAULT_CONFIG_FILE, atomic_output, iter_environments, load_config_cached
+
+
+# production 的受管 known_hosts 文件（与 servers-config.yml 同目录，对应 Ansible 的 inventory_dir）
+DEFAULT_KNOWN_HOSTS = str(Path(DEFAULT_CONFIG_FILE).parent / "known_hosts")
+
+# 采集的主机密钥类型（每种类型一次握手，主机不支持的类型会被跳过）
+DEFAULT_KEY_TYPES = ('ssh-ed25519', 'ecdsa-sha2-nistp256', 'rsa-sha2-512')
+
+DEFAULT_PARALLELISM = 20
+DEFAULT_TIMEOUT = 10
+
+KNOWN_HOSTS_HEADER = (
+    "# Managed by tools/known_hosts.py - 由 tools/known_hosts.py 生成，请勿手动编辑\n"
+    "# 重新采集: python tools/known_hosts.py [--update]\n"
+)
+
+# 采集时逐个尝试密钥类型，主机不支持某类型时 paramiko 会记录 ERROR 日志；
+# 该情况属于预期，具体错误以异常形式返回给调用方
+logging.getLogger('paramiko.transport').addHandler(logging.NullHandler())
+
+# 解析缓存：路径 -> (mtime_ns, size, KnownHosts)
+_CACHE: Dict[str, Tuple[int, int, 'KnownHosts']] = {}
+
+
+def host_entry(host: str, port: int = 22) -> str:
+    """known_hosts 中的主机名写法：端口 22 为裸地址，否则为 [host]:port"""
+    host = host.strip('[]')
+    return host if int(port) == 22 else f"[{host}]:{port}"
+
+
+def fingerprint(key_base64: str) -> str:
+    """OpenSSH 风格的 SHA256 指纹"""
+    digest = hashlib.sha256(base64.b64decode(key_base64)).digest()
+    return "SHA256:" + base64.b64encode(digest).decode('ascii').rstrip('=')
+
+
+def parse_host_port(host_str, default_port=22):
+    """解析 IP、IP:PORT 或 [IPv6]:PORT"""
+    host_str = host_str.strip()
+    if host_str.startswith('[') and ']:' in host_str:
+        host, port_str = host_str[1:].split(']:', 1)
+    elif host_str.count(':') == 1:  # 不是 IPv6
+        host, port_str = host_str.split(':', 1)
+    else:
+        return host_str.strip('[]'), default_port
+    try:
+        return host, int(port_str)
+    except ValueError:
+        return host, default_port
+
+
+def hosts_from_config(config_file=DEFAULT_CONFIG_FILE, environ=None, server_environments=None,
+                      groups=None, port=None):
+    """
+    从 servers-config.yml 读取目标主机，IP 取自各主机 env_var（.env 或环境变量，去除 CIDR 后缀）
+
+    Returns:
+        tuple: ([{'name', 'host', 'port'}, ...], [缺少 IP 的主机名])
+    """
+    if environ is None:
+        environ = dict(os.environ)
+        if Path('.env').exists():
+            environ = {**load_env_file('.env'), **environ}
+    port = port or int(environ.get('ANSIBLE_PORT') or 22)
+    config = load_config_cached(config_file)
+
+    targets = []
+    missing = []
+    for name, server in (config.get('production_servers') or {}).items():
+        if server_environments and server.get('server_environment') not in server_environments:
+            continue
+        if groups and not set(groups) & set(server.get('groups') or []):
+            continue
+        value = environ.get(server.get('env_var', ''), '').strip()
+        if value:
+            targets.append({'name': name, 'host': value.split('/')[0], 'port': port})
+        else:
+            missing.append(name)
+    return targets, missing
+
+
+def environment_known_hosts(config_file=DEFAULT_CONFIG_FILE, root=None) -> Dict[str, List[str]]:
+    """
+    各环境的受管 known_hosts 路径 -> 该环境 inventory 中的主机名
+
+    环境与目录和 generate_inventory.py all 相同（inventories/<环境>/），
+    因此每个 inventory 的 {{ inventory_dir }}/known_hosts 都包含它自己的主机。
+    """
+    config = load_config_cached(config_file)
+    return {str(env_dir / 'known_hosts'): list(env_config.get('production_servers') or {})
+            for _, env_dir, env_config in iter_environments(config, root)}
+
+
+class KnownHosts:
+    """
+    受管 known_hosts 文件：{主机名写法: {密钥类型: base64}}
+
+    按主机名建立索引，查找一台主机不需要遍历整个文件；散列主机名（|1|...）
+    与 @cert-authority 等标记行不属于受管格式，读取时忽略。
+    """
+
+    def __init__(self, path=DEFAULT_KNOWN_HOSTS):
+        self.path = Path(path)
+        self.entries: Dict[str, Dict[str, str]] = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 3 or fields[0].startswith(('#', '@', '|')):
+                continue
+            for name in fields[0].split(','):
+                self.entries.setdefault(name, {})[fields[1]] = fields[2]
+
+    def lookup(self, host, port=22) -> Dict[str, str]:
+        """返回主机已记录的 {密钥类型: base64}，未记录时为空字典"""
+        return dict(self.entries.get(host_entry(host, port), {}))
+
+    def compare(self, host, port, keys: Dict[str, str]) -> str:
+        """与记录比对：'new' 未记录，'unchanged' 完全一致，'changed' 任一密钥或类型不同"""
+        pinned = self.entries.get(host_entry(host, port))
+        if not pinned:
+            return 'new'
+        return 'unchanged' if pinned == keys else 'changed'
+
+    def set(self, host, port, keys: Dict[str, str]):
+        self.entries[host_entry(host, port)] = dict(keys)
+
+    def save(self):
+        """按主机名排序后原子写入"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_output(str(self.path)) as f:
+            f.write(KNOWN_HOSTS_HEADER)
+            for name in sorted(self.entries):
+                for key_type, key in sorted(self.entries[name].items()):
+                    f.write(f"{name} {key_type} {key}\n")
+
+    def pkeys(self, host, port=22) -> Dict[str, paramiko.PKey]:
+        """该主机已记录的 {密钥类型: paramiko.PKey}（跳过 paramiko 不支持的类型）"""
+        entry = host_entry(host, port)
+        pkeys = {}
+        for key_type, key in self.entries.get(entry, {}).items():
+            parsed = paramiko.hostkeys.HostKeyEntry.from_line(f"{entry} {key_type} {key}")
+            if parsed is not None:
+                pkeys[key_type] = parsed.key
+        return pkeys
+
+
+def load_known_hosts(path=DEFAULT_KNOWN_HOSTS) -> KnownHosts:
+    """读取 known_hosts；文件未变化（mtime_ns + size）时复用缓存，批量连接只解析一次"""
+    key = os.path.abspath(path)
+    try:
+        stat = os.stat(key)
+    except FileNotFoundError:
+        return KnownHosts(key)
+    cached = _CACHE.get(key)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    known = KnownHosts(key)
+    _CACHE[key] = (stat.st_mtime_ns, stat.st_size, known)
+    return known
+
+
+def pin_host_key(ssh: paramiko.SSHClient, host, port=22, path=DEFAULT_KNOWN_HOSTS):
+    """
+    让 SSHClient 只信任受管 known_hosts 中该主机的密钥（RejectPolicy）
+
+    Raises:
+        paramiko.SSHException: 主机未记录（连接前即失败，不做无谓的握手）
+    """
+    entry = host_entry(host, port)
+    pkeys = load_known_hosts(path).pkeys(host, port)
+    if not pkeys:
+        raise paramiko.SSHException(f"{entry} 不在 {path} 中，请先运行 python tools/known_hosts.py 采集主机密钥")
+    for key_type, key in pkeys.items():
+        ssh.get_host_keys().add(entry, key_type, key)
+    ssh.set_missing_host_key_policy(paramiko.RejectPolicy())
+
+
+def scan_host_keys(host, port=22, key_types=DEFAULT_KEY_TYPES, timeout=DEFAULT_TIMEOUT) -> Dict[str, str]:
+    """
+    采集一台主机的主机密钥：每种类型一次只协商到密钥交换的握手，不认证
+
+    Returns:
+        {密钥类型: base64}，例如 {'ssh-ed25519': 'AAAA...', 'ssh-rsa': 'AAAA...'}
+
+    Raises:
+        OSError / paramiko.SSHException: 连接失败，或主机不提供任何请求的密钥类型
+    """
+    deadline = time.monotonic() + timeout
+    keys: Dict[str, str] = {}
+    for key_type in key_types:
+        remaining = max(1.0, deadline - time.monotonic())
+        sock = socket.create_connection((host.strip('[]'), port), timeout=remaining)
+        transport = paramiko.Transport(sock)
+        try:
+            transport.get_security_options().key_types = [key_type]
+            transport.start_client(timeout=remaining)
+            key = transport.get_remote_server_key()
+            keys[key.get_name()] = key.get_base64()
+        except paramiko.ssh_exception.IncompatiblePeer:
+            continue
+        finally:
+            transport.close()
+    if not keys:
+        raise paramiko.SSHException(f"主机未提供以下任何类型的主机密钥: {', '.join(key_types)}")
+    return keys
+
+
+def scan_hosts(targets, known: KnownHosts, key_types=DEFAULT_KEY_TYPES, parallelism=DEFAULT_PARALLELISM,
+               timeout=DEFAULT_TIMEOUT, on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """
+    并发采集并与 known 比对（不修改 known）
+
+    Returns:
+        按 targets 顺序排列的结果：
+        {'name', 'host', 'port', 'ok', 'status', 'keys', 'error', 'seconds'}，
+        status 为 'new' / 'unchanged' / 'changed'（失败时为 None）
+    """
+    def scan(target):
+        start = time.monotonic()
+        result = {'name': target.get('name') or target['host'], 'host': target['host'], 'port': target['port'],
+                  'ok': False, 'status': None, 'keys': {}, 'error': None, 'seconds': 0.0}
+        try:
+            result['keys'] = scan_host_keys(target['host'], target['port'], key_types, timeout)
+            result['status'] = known.compare(target['host'], target['port'], result['keys'])
+            result['ok'] = True
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        result['seconds'] = time.monotonic() - start
+        return result
+
+    if not targets:
+        return []
+    results = [None] * len(targets)
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(targets)))) as executor:
+        futures = {executor.submit(scan, target): idx for idx, target in enumerate(targets)}
+        for future in as_completed(futures):
+            result = results[futures[future]] = future.result()
+            if on_result:
+                on_result(result)
+    return results
+
+
+def record_scan(known: KnownHosts, results: List[Dict], update=False) -> int:
+    """
+    将采集结果写入 known（未保存）：新主机总是记录，密钥变化的主机仅在 update=True 时覆盖
+
+    Returns:
+        写入的主机数
+    """
+    recorded = 0
+    for result in results:
+        if result['status'] == 'new' or (update and result['status'] == 'changed'):
+            known.set(result['host'], result['port'], result['keys'])
+            recorded += 1
+    return recorded
+
+
+def record_environments(results: List[Dict], known_files: Dict[str, Optional[List[str]]], update=False,
+                        check=False) -> Dict[str, Dict[str, int]]:
+    """
+    把一次采集的结果分别记录到各个 known_hosts（每个文件只记录其主机，状态按该文件重新比对）
+
+    Args:
+        known_files: {路径: 主机名列表}，列表为 None 时该文件记录全部主机
+        check: 只比对，不写文件
+
+    Returns:
+        {路径: {'new', 'changed', 'recorded'}}
+    """
+    summary = {}
+    for path, names in known_files.items():
+        known = KnownHosts(path)
+        selected = [dict(r, status=known.compare(r['host'], r['port'], r['keys']))
+                    for r in results if r['ok'] and (names is None or r['name'] in names)]
+        counts = {status: sum(1 for r in selected if r['status'] == status) for status in ('new', 'changed')}
+        counts['recorded'] = 0
+        if not check:
+            counts['recorded'] = record_scan(known, selected, update=update)
+            # 没有主机的环境也写出空文件，使该环境的 UserKnownHostsFile 始终存在
+            if counts['recorded'] or not known.path.exists():
+                known.save()
+        summary[path] = counts
+    return summary
+
+
+def describe_result(result) -> str:
+    """单台主机结果的一行说明"""
+    label = f"{result['name']} ({host_entry(result['host'], result['port'])})"
+    if not result['ok']:
+        return f"✗ {label} {result['error']}"
+    prints = ', '.join(f"{key_type} {fingerprint(key)}" for key_type, key in sorted(result['keys'].items()))
+    marks = {'new': '+', 'unchanged': '✓', 'changed': '⚠️  密钥已变化'}
+    return f"{marks[result['status']]} {label} {prints}"
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="采集主机 SSH 密钥并写入受管 known_hosts | Collect and pin SSH host keys")
+    parser.add_argument('--config', default=DEFAULT_CONFIG_FILE,
+                        help=f'servers-config.yml 路径（默认: {DEFAULT_CONFIG_FILE}）')
+    parser.add_argument('--group', action='append', help='只采集这些组的主机，可重复')
+    parser.add_argument('--environment', action='append',
+                        help='只采集这些 server_environment 的主机，可重复')
+    parser.add_argument('--host', action='append',
+                        help='直接指定主机（IP、IP:PORT 或 [IPv6]:PORT），可重复；指定后不读取 servers-config.yml')
+    parser.add_argument('--port', type=int, default=None,
+                        help='SSH 端口（默认: ANSIBLE_PORT 或 22）')
+    parser.add_argument('--known-hosts', default=None, metavar='PATH',
+                        help='把全部主机写入这一个文件（默认: 按环境写入 inventories/<环境>/known_hosts；'
+                             '指定 --host 时为 servers-config.yml 同目录下的 known_hosts）')
+    parser.add_argument('--key-type', action='append', dest='key_types',
+                        help=f"采集的主机密钥类型，可重复（默认: {', '.join(DEFAULT_KEY_TYPES)}）")
+    parser.add_argument('--parallel', type=int, default=DEFAULT_PARALLELISM,
+                        help=f'并发主机数（默认: {DEFAULT_PARALLELISM}）')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f'单台主机超时秒数（默认: {DEFAULT_TIMEOUT}）')
+    parser.add_argument('--update', action='store_true',
+                        help='覆盖已变化的主机密钥（仅在确认主机重装或换钥后使用）')
+    parser.add_argument('--check', action='store_true', help='只比对，不写文件')
+    args = parser.parse_args()
+
+    if args.known_hosts or args.host:
+        known_files = {args.known_hosts or str(Path(args.config).parent / "known_hosts"): None}
+    else:
+        known_files = environment_known_hosts(args.config)
+    if args.host:
+        targets = []
+        for host_str in args.host:
+            host, port = parse_host_port(host_str, args.port or 22)
+            targets.append({'name': host, 'host': host, 'port': port})
+    else:
+        targets, missing = hosts_from_config(args.config, server_environments=args.environment,
+                                             groups=args.group, port=args.port)
+        for name in missing:
+            print(f"⚠️  {name}: 未设置 IP 环境变量，跳过")
+    if not targets:
+        print("❌ 没有可采集的主机")
+        sys.exit(1)
+
+    # 逐台输出的状态按第一个文件（production，包含全部主机）比对
+    known = KnownHosts(next(iter(known_files)))
+    print(f"🔑 采集 {len(targets)} 台主机的主机密钥（并发 {args.parallel}，单机超时 {args.timeout}s）...")
+    results = scan_hosts(targets, known, tuple(args.key_types or DEFAULT_KEY_TYPES), args.parallel,
+                         args.timeout, on_result=lambda r: print(describe_result(r), flush=True))
+
+    counts = {status: sum(1 for r in results if r['status'] == status)
+              for status in ('new', 'unchanged', 'changed')}
+    failed = sum(1 for r in results if not r['ok'])
+    print(f"\n新增: {counts['new']} | 未变: {counts['unchanged']} | 已变化: {counts['changed']} | 失败: {failed}")
+
+    summary = record_environments(results, known_files, update=args.update, check=args.check)
+    if not args.check:
+        for path, env_counts in summary.items():
+            print(f"✓ 已写入 {env_counts['recorded']} 台主机到 {path}")
+    changed = any(env_counts['changed'] for env_counts in summary.values())
+    new = any(env_counts['new'] for env_counts in summary.values())
+    if changed and not args.update:
+        print("⚠️  已变化的主机密钥未写入；确认主机确实重装或换钥后使用 --update 接受")
+    sys.exit(1 if failed or (changed and not args.update) or (args.check and new) else 0)
+
+
+if __name__ == "__main__":
+    main()
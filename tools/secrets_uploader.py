@@ -15,49 +15,327 @@ GitHub Secrets Uploader - 从 .env 文件批量上传 Secrets 到 GitHub
 
 import os
 import sys
+import time
+import hmac
+import json
+import hashlib
+import secrets as secrets_module
 import argparse
 import base64
+import fnmatch
+import re
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, List, Pattern, Tuple, Optional
 import requests
+from requests.adapters import HTTPAdapter
 from nacl import encoding, public
 
+from env_file import load_env_file
+from generate_inventory import atomic_output
+
+
+# 已上传 secrets 的本地清单（项目根目录 .cache/ 下，已被 .gitignore 忽略）
+DEFAULT_MANIFEST = Path(__file__).resolve().parent.parent / ".cache" / "secrets" / "manifest.json"
+MANIFEST_VERSION = 1
+
+
+class SecretsManifest:
+    """
+    已上传 secrets 的本地清单
+    
+    GitHub 不返回 secret 的值，因此本地记录每个已上传值的加盐哈希（HMAC-SHA256，
+    盐随清单随机生成）以及上传后远端返回的 updated_at：
+    值未变且远端 updated_at 与清单一致时即可跳过上传。
+    清单文件权限为 0600，不保存任何明文。
+    """
+    
+    def __init__(self, path: Path = DEFAULT_MANIFEST):
+        self.path = Path(path)
+        self.salt = secrets_module.token_hex(16)
+        self.targets: Dict[str, Dict[str, Dict[str, str]]] = {}
+        self.load()
+    
+    def load(self):
+        """读取清单；缺失、损坏或版本不符时从空清单开始"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get('version') == MANIFEST_VERSION:
+            self.salt = data['salt']
+            self.targets = data.get('targets', {})
+    
+    def save(self):
+        """原子写入清单（目录 0700，文件 0600）"""
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        with atomic_output(str(self.path), mode=0o600) as f:
+            json.dump({'version': MANIFEST_VERSION, 'salt': self.salt, 'targets': self.targets},
+                      f, indent=1, sort_keys=True)
+    
+    def digest(self, value: str) -> str:
+        """值的加盐哈希"""
+        return hmac.new(self.salt.encode('utf-8'), value.encode('utf-8'), hashlib.sha256).hexdigest()
+    
+    def is_current(self, target: str, name: str, value: str, remote_updated_at: Optional[str]) -> bool:
+        """远端存在、值未变且远端未被他人修改时返回 True"""
+        entry = self.targets.get(target, {}).get(name)
+        return (entry is not None and remote_updated_at is not None
+                and entry.get('updated_at') == remote_updated_at
+                and hmac.compare_digest(entry.get('hash', ''), self.digest(value)))
+    
+    def record(self, target: str, name: str, value: str, updated_at: Optional[str]):
+        """记录一次成功上传"""
+        self.targets.setdefault(target, {})[name] = {'hash': self.digest(value), 'updated_at': updated_at}
+
+
+def plan_secret_uploads(secrets: Dict[str, str], remote: Dict[str, str],
+                        manifest: Optional[SecretsManifest], target: str,
+                        force: bool = False) -> Tuple[Dict[str, str], List[str]]:
+    """
+    按清单与远端 updated_at 决定需要上传的 secrets
+    
+    Returns:
+        (需要上传的 {名称: 值}, 跳过的名称列表)
+    """
+    if force or manifest is None:
+        return dict(secrets), []
+    pending = {}
+    skipped = []
+    for name, value in secrets.items():
+        if manifest.is_current(target, name, value, remote.get(name)):
+            skipped.append(name)
+        else:
+            pending[name] = value
+    return pending, skipped
+
+
+ORG_VISIBILITIES = ('all', 'private', 'selected')
+
+
+def parse_target(spec: str) -> Dict:
+    """
+    解析上传目标
+    
+    支持的格式：
+        owner/repo | repo:owner/repo         仓库 secrets
+        env:owner/repo/ENVIRONMENT           Actions 环境 secrets
+        org:ORG[:all|private]                组织 secrets（默认 private）
+        org:ORG:selected:ID1,ID2             仅对指定仓库 ID 可见的组织 secrets
+    
+    Returns:
+        {'scope', 'repo', 'environment', 'org', 'visibility', 'selected_repository_ids'}
+    """
+    target = {'scope': 'repo', 'repo': None, 'environment': None, 'org': None,
+              'visibility': None, 'selected_repository_ids': None}
+    scope, _, rest = spec.partition(':') if ':' in spec else ('repo', '', spec)
+    
+    if scope == 'repo' and rest.count('/') == 1 and all(rest.split('/')):
+        target['repo'] = rest
+    elif scope == 'env' and rest.count('/') == 2 and all(rest.split('/')):
+        owner, repo, environment = rest.split('/')
+        target.update(scope='env', repo=f"{owner}/{repo}", environment=environment)
+    elif scope == 'org' and rest:
+        org, _, visibility = rest.partition(':')
+        visibility, _, ids = visibility.partition(':')
+        visibility = visibility or 'private'
+        if visibility not in ORG_VISIBILITIES or (ids and visibility != 'selected'):
+            raise Exception(f"无效的组织 secret 可见性: {spec}")
+        try:
+            selected = [int(i) for i in ids.split(',') if i] if ids else None
+        except ValueError:
+            raise Exception(f"无效的仓库 ID 列表: {spec}")
+        target.update(scope='org', org=org, visibility=visibility, selected_repository_ids=selected)
+    else:
+        raise Exception(f"无效的上传目标: {spec}（应为 owner/repo、env:owner/repo/ENV 或 org:ORG[:visibility]）")
+    return target
+
+
+def format_target(target: Dict) -> str:
+    """parse_target 结果的规范字符串，用作清单与按目标规则的键"""
+    if target['scope'] == 'org':
+        spec = f"org:{target['org']}:{target['visibility']}"
+        if target['selected_repository_ids']:
+            spec += ':' + ','.join(str(i) for i in target['selected_repository_ids'])
+        return spec
+    if target['scope'] == 'env':
+        return f"env:{target['repo']}/{target['environment']}"
+    return f"repo:{target['repo']}"
+
+
+def canonical_target(spec: str) -> str:
+    """将任意等价写法（如 owner/repo 与 repo:owner/repo）归一化"""
+    return format_target(parse_target(spec))
+
 
 class GitHubSecretsUploader:
-    """GitHub Secrets 上传工具"""
+    """GitHub Secrets 上传工具（仓库、Actions 环境或组织）"""
+    
+    # GitHub 对写操作有二级限速，并发不宜过高
+    DEFAULT_MAX_WORKERS = 4
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
     
-    def __init__(self, repo: str, token: str):
+    def __init__(self, repo: str, token: str,
+                 api_base: str = "https://api.github.com",
+                 timeout: float = 30,
+                 max_retries: int = 5,
+                 backoff_factor: float = 0.5,
+                 max_workers: int = DEFAULT_MAX_WORKERS,
+                 environment: Optional[str] = None,
+                 org: Optional[str] = None,
+                 visibility: str = 'private',
+                 selected_repository_ids: Optional[List[int]] = None):
         """
         初始化上传器
         
         Args:
-            repo: GitHub 仓库，格式：owner/repo
-            token: GitHub Personal Access Token (需要 repo 权限)
+            repo: GitHub 仓库，格式：owner/repo（组织 secrets 时为 None）
+            token: GitHub Personal Access Token (需要 repo 权限；组织 secrets 需要 admin:org)
+            api_base: API 地址
+            timeout: 单次请求超时（秒）
+            max_retries: 限速/5xx 的最大重试次数
+            backoff_factor: 指数退避基数（秒），无 Retry-After 时使用
+            max_workers: 批量上传的并发数
+            environment: Actions 环境名，设置后上传为环境 secrets
+            org: 组织名，设置后上传为组织 secrets
+            visibility: 组织 secrets 的可见性（all / private / selected）
+            selected_repository_ids: visibility 为 selected 时可见的仓库 ID
         """
         self.repo = repo
+        self.environment = environment
+        self.org = org
+        self.visibility = visibility
+        self.selected_repository_ids = selected_repository_ids
         self.token = token
-        self.api_base = "https://api.github.com"
+        self.api_base = api_base.rstrip('/')
         self.headers = {
             "Authorization": f"token {token}",
             "Accept": "application/vnd.github.v3+json"
         }
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_workers = max(1, max_workers)
+        self._public_key: Optional[Tuple[str, str]] = None
+        self._sealed_boxes: Dict[str, public.SealedBox] = {}
         
-    def get_public_key(self) -> Tuple[str, str]:
+        # 持久会话：所有请求复用同一组 keep-alive 连接
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+    
+    def _retry_delay(self, response: requests.Response, attempt: int) -> Optional[float]:
         """
-        获取仓库的公钥（用于加密 secrets）
+        计算限速/服务端错误的重试等待时间，不应重试时返回 None
+        
+        GitHub 的限速可能是 429，也可能是带 Retry-After 或
+        x-ratelimit-remaining: 0 的 403。
+        """
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                pass
+        if response.headers.get('X-RateLimit-Remaining') == '0':
+            reset = response.headers.get('X-RateLimit-Reset', '')
+            if reset.isdigit():
+                return max(0.0, int(reset) - time.time()) + 1
+        if response.status_code in self.RETRY_STATUSES:
+            return self.backoff_factor * (2 ** attempt)
+        return None
+    
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """发送请求（连接池 + 限速退避）；重试次数用尽后返回最后一次响应"""
+        attempt = 0
+        while True:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            if response.status_code < 400 or attempt >= self.max_retries:
+                return response
+            delay = self._retry_delay(response, attempt)
+            if delay is None:
+                return response
+            time.sleep(delay)
+            attempt += 1
+    
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+    
+    @classmethod
+    def from_target(cls, spec: str, token: str, **kwargs) -> 'GitHubSecretsUploader':
+        """按 parse_target 格式的目标字符串创建上传器"""
+        target = parse_target(spec)
+        if target['scope'] == 'org':
+            return cls(None, token, org=target['org'], visibility=target['visibility'],
+                       selected_repository_ids=target['selected_repository_ids'], **kwargs)
+        return cls(target['repo'], token, environment=target['environment'], **kwargs)
+    
+    def _secrets_url(self, path: str = '') -> str:
+        if self.org:
+            return f"{self.api_base}/orgs/{self.org}/actions/secrets{path}"
+        if self.environment:
+            return f"{self.api_base}/repos/{self.repo}/environments/{self.environment}/secrets{path}"
+        return f"{self.api_base}/repos/{self.repo}/actions/secrets{path}"
+    
+    @property
+    def target(self) -> str:
+        """目标标识（parse_target 的规范格式），也用作清单中的键"""
+        scope = 'org' if self.org else 'env' if self.environment else 'repo'
+        return format_target({'scope': scope, 'repo': self.repo, 'environment': self.environment,
+                              'org': self.org, 'visibility': self.visibility,
+                              'selected_repository_ids': self.selected_repository_ids})
+    
+    def list_secrets(self) -> Dict[str, str]:
+        """
+        列出远端已有的 secrets（自动分页）
+        
+        Returns:
+            {名称: updated_at}
+        """
+        remote = {}
+        page = 1
+        while True:
+            response = self._request('GET', self._secrets_url(), params={'per_page': 100, 'page': page})
+            if response.status_code != 200:
+                raise Exception(f"获取 secrets 列表失败: {response.status_code} - {response.text}")
+            data = response.json()
+            for item in data.get('secrets', []):
+                remote[item['name']] = item.get('updated_at')
+            if page * 100 >= data.get('total_count', 0):
+                return remote
+            page += 1
+        
+    def get_public_key(self, refresh: bool = False) -> Tuple[str, str]:
+        """
+        获取仓库的公钥（用于加密 secrets），结果在实例内缓存
         
         Returns:
             (key_id, public_key) 元组
         """
-        url = f"{self.api_base}/repos/{self.repo}/actions/secrets/public-key"
-        response = requests.get(url, headers=self.headers)
+        if self._public_key and not refresh:
+            return self._public_key
+        
+        response = self._request('GET', self._secrets_url('/public-key'))
         
         if response.status_code != 200:
             raise Exception(f"获取公钥失败: {response.status_code} - {response.text}")
         
         data = response.json()
-        return data["key_id"], data["key"]
+        self._public_key = (data["key_id"], data["key"])
+        return self._public_key
+    
+    def _sealed_box(self, public_key: str) -> public.SealedBox:
+        """按公钥缓存 SealedBox，批量加密时只构造一次"""
+        box = self._sealed_boxes.get(public_key)
+        if box is None:
+            public_key_obj = public.PublicKey(public_key.encode("utf-8"), encoding.Base64Encoder())
+            box = self._sealed_boxes[public_key] = public.SealedBox(public_key_obj)
+        return box
     
     def encrypt_secret(self, public_key: str, secret_value: str) -> str:
         """
@@ -70,11 +348,24 @@ class GitHubSecretsUploader:
         Returns:
             Base64 编码的加密后的值
         """
-        public_key_obj = public.PublicKey(public_key.encode("utf-8"), encoding.Base64Encoder())
-        sealed_box = public.SealedBox(public_key_obj)
-        encrypted = sealed_box.encrypt(secret_value.encode("utf-8"))
+        encrypted = self._sealed_box(public_key).encrypt(secret_value.encode("utf-8"))
         return base64.b64encode(encrypted).decode("utf-8")
     
+    def _put_secret(self, secret_name: str, encrypted_value: str, key_id: str) -> Optional[str]:
+        """上传已加密的 secret，成功返回 None，失败返回错误描述"""
+        body = {
+            "encrypted_value": encrypted_value,
+            "key_id": key_id
+        }
+        if self.org:
+            body["visibility"] = self.visibility
+            if self.selected_repository_ids:
+                body["selected_repository_ids"] = self.selected_repository_ids
+        response = self._request('PUT', self._secrets_url(f'/{secret_name}'), json=body)
+        if response.status_code in [201, 204]:
+            return None
+        return f"{response.status_code} - {response.text}"
+    
     def upload_secret(self, secret_name: str, secret_value: str) -> bool:
         """
         上传单个 secret
@@ -87,46 +378,77 @@ class GitHubSecretsUploader:
             是否成功
         """
         try:
-            # 获取公钥
             key_id, public_key = self.get_public_key()
-            
-            # 加密 secret
-            encrypted_value = self.encrypt_secret(public_key, secret_value)
-            
-            # 上传 secret
-            url = f"{self.api_base}/repos/{self.repo}/actions/secrets/{secret_name}"
-            payload = {
-                "encrypted_value": encrypted_value,
-                "key_id": key_id
-            }
-            
-            response = requests.put(url, headers=self.headers, json=payload)
-            
-            if response.status_code in [201, 204]:
-                return True
-            else:
-                print(f"  ✗ 上传失败: {response.status_code} - {response.text}")
+            error = self._put_secret(secret_name, self.encrypt_secret(public_key, secret_value), key_id)
+            if error:
+                print(f"  ✗ 上传失败: {error}")
                 return False
+            return True
                 
         except Exception as e:
             print(f"  ✗ 错误: {str(e)}")
             return False
     
+    def encrypt_batch(self, secrets: Dict[str, str]) -> Tuple[str, Dict[str, str]]:
+        """用（缓存的）公钥加密全部值，返回 (key_id, {名称: 密文})"""
+        key_id, public_key = self.get_public_key()
+        return key_id, {name: self.encrypt_secret(public_key, value) for name, value in secrets.items()}
+    
+    def upload_encrypted(self, secret_name: str, encrypted_value: str, key_id: str) -> Dict:
+        """上传一个已加密的 secret，返回 {'name', 'ok', 'error'}（网络错误也记为失败）"""
+        try:
+            error = self._put_secret(secret_name, encrypted_value, key_id)
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        return {'name': secret_name, 'ok': error is None, 'error': error}
+    
+    def upload_secrets_batch(self, secrets: Dict[str, str],
+                             max_workers: Optional[int] = None,
+                             on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """
+        批量上传：公钥只获取一次，先用同一个 SealedBox 加密全部值，再并发上传
+        
+        Args:
+            secrets: {名称: 值}
+            max_workers: 并发数（默认使用初始化时的 max_workers）
+            on_result: 每完成一个上传时回调（按完成顺序）
+            
+        Returns:
+            按 secrets 顺序排列的结果 [{'name', 'ok', 'error'}]
+        """
+        key_id, encrypted = self.encrypt_batch(secrets)
+        
+        results: Dict[str, Dict] = {}
+        workers = min(max_workers or self.max_workers, max(1, len(encrypted)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self.upload_encrypted, name, value, key_id)
+                       for name, value in encrypted.items()]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result['name']] = result
+                if on_result:
+                    on_result(result)
+        return [results[name] for name in encrypted]
+    
     def test_connection(self) -> bool:
         """
         测试 GitHub API 连接和权限
         
+        直接请求仓库公钥：成功即说明仓库可访问且有 secrets 权限，
+        公钥同时被缓存，后续上传不再重复获取。
+        
         Returns:
             连接是否正常
         """
         try:
-            url = f"{self.api_base}/repos/{self.repo}"
-            response = requests.get(url, headers=self.headers)
+            response = self._request('GET', self._secrets_url('/public-key'))
             
             if response.status_code == 200:
+                data = response.json()
+                self._public_key = (data["key_id"], data["key"])
                 return True
             elif response.status_code == 404:
-                print(f"✗ 错误: 仓库 {self.repo} 不存在或无权访问")
+                print(f"✗ 错误: {self.target} 不存在或无权访问")
                 return False
             elif response.status_code == 401:
                 print("✗ 错误: Token 无效或已过期")
@@ -139,76 +461,216 @@ class GitHubSecretsUploader:
             return False
 
 
+def prepare_targets(uploaders: List[GitHubSecretsUploader], secrets: Dict[str, str],
+                    manifest: SecretsManifest, force: bool = False,
+                    secrets_by_target: Optional[Dict[str, Dict[str, str]]] = None) -> Optional[Dict[str, Dict]]:
+    """
+    并发检查每个目标：测试连接（同时缓存公钥）、列出远端 secrets 并按清单计划上传
+    
+    secrets_by_target 中列出的目标使用各自过滤后的 secrets，其余目标使用 secrets。
+    
+    Returns:
+        {目标: {'pending': {名称: 值}, 'skipped': [名称]}}；任一目标连接失败时返回 None
+    """
+    def prepare(uploader: GitHubSecretsUploader) -> Optional[Dict]:
+        if not uploader.test_connection():
+            return None
+        remote = {} if force else uploader.list_secrets()
+        target_secrets = (secrets_by_target or {}).get(uploader.target, secrets)
+        pending, skipped = plan_secret_uploads(target_secrets, remote, manifest, uploader.target, force=force)
+        return {'pending': pending, 'skipped': skipped}
+    
+    with ThreadPoolExecutor(max_workers=max(1, len(uploaders))) as executor:
+        plans = list(executor.map(prepare, uploaders))
+    if any(plan is None for plan in plans):
+        return None
+    return {uploader.target: plan for uploader, plan in zip(uploaders, plans)}
+
+
+def upload_to_targets(uploaders: List[GitHubSecretsUploader], plans: Dict[str, Dict],
+                      max_workers: int = GitHubSecretsUploader.DEFAULT_MAX_WORKERS,
+                      on_result: Optional[Callable[[Dict], None]] = None) -> Dict[str, List[Dict]]:
+    """
+    扇出上传：每个目标用各自缓存的公钥加密一次，全部 (目标, secret) 共用一个线程池并发上传
+    
+    Returns:
+        {目标: 按计划顺序排列的结果 [{'target', 'name', 'ok', 'error'}]}
+    """
+    jobs = []
+    for uploader in uploaders:
+        pending = plans[uploader.target]['pending']
+        if pending:
+            key_id, encrypted = uploader.encrypt_batch(pending)
+            jobs.extend((uploader, name, value, key_id) for name, value in encrypted.items())
+    
+    def upload(job: Tuple) -> Dict:
+        uploader, name, value, key_id = job
+        return dict(uploader.upload_encrypted(name, value, key_id), target=uploader.target)
+    
+    done: Dict[Tuple[str, str], Dict] = {}
+    if jobs:
+        with ThreadPoolExecutor(max_workers=min(max(1, max_workers), len(jobs))) as executor:
+            for future in as_completed([executor.submit(upload, job) for job in jobs]):
+                result = future.result()
+                done[(result['target'], result['name'])] = result
+                if on_result:
+                    on_result(result)
+    
+    results: Dict[str, List[Dict]] = {uploader.target: [] for uploader in uploaders}
+    for uploader, name, _, _ in jobs:
+        results[uploader.target].append(done[(uploader.target, name)])
+    return results
+
+
+def record_uploads(uploaders: List[GitHubSecretsUploader], plans: Dict[str, Dict],
+                   results: Dict[str, List[Dict]], manifest: SecretsManifest):
+    """
+    重新列出有成功上传的目标，把值哈希与远端新的 updated_at 写入清单
+    
+    上传已经完成，清单只是缓存：某个目标重新列出失败或清单无法写入时只打印警告，
+    该目标的清单条目保持不变（下次运行会重新比对并上传）。
+    """
+    changed = [u for u in uploaders if any(r['ok'] for r in results[u.target])]
+    if not changed:
+        return
+    
+    def list_remote(uploader: GitHubSecretsUploader) -> Optional[Dict[str, str]]:
+        try:
+            return uploader.list_secrets()
+        except Exception as e:
+            print(f"⚠️  {uploader.target}: 上传后重新列出 secrets 失败，未更新本地清单: {e}")
+            return None
+    
+    with ThreadPoolExecutor(max_workers=len(changed)) as executor:
+        remotes = list(executor.map(list_remote, changed))
+    for uploader, remote in zip(changed, remotes):
+        if remote is None:
+            continue
+        pending = plans[uploader.target]['pending']
+        for result in results[uploader.target]:
+            if result['ok']:
+                manifest.record(uploader.target, result['name'], pending[result['name']],
+                                remote.get(result['name']))
+    if all(remote is None for remote in remotes):
+        return
+    try:
+        manifest.save()
+    except OSError as e:
+        print(f"⚠️  无法写入本地清单 {manifest.path}: {e}")
+
+
 def parse_env_file(env_file: Path) -> Dict[str, str]:
     """
-    解析 .env 文件
+    解析 .env 文件（共享解析器：引号、多行值、export 前缀）
+    
+    密钥值按字面上传：不做 $VAR 插值，未加引号值中的 " #" 也不视为注释，
+    否则 PASSWORD=pa$USER 或 TOKEN=abc #x 会被静默改写后上传。
     
     Args:
         env_file: .env 文件路径
         
     Returns:
-        环境变量字典
+        环境变量字典（只包含非空值）
     """
     if not env_file.exists():
         raise FileNotFoundError(f"文件不存在: {env_file}")
     
-    env_vars = {}
+    values = load_env_file(env_file, interpolate=False, inline_comments=False)
+    return {key: value for key, value in values.items() if value}
+
+
+def _pattern_regex(pattern: str) -> str:
+    """
+    单个过滤模式 -> 正则（用 search 匹配）
+    
+        re:EXPR     正则表达式（原样使用，可含 (?i) 等内联标志与反向引用）
+        *?[ 通配    glob，匹配整个变量名：DB_* 匹配 DB_HOST，但不匹配 MY_DB_X（需要时写 *DB_*）
+        其他        子串匹配（与旧版 --exclude 行为一致）
+    """
+    if pattern.startswith('re:'):
+        return pattern[3:]
+    if any(c in pattern for c in '*?['):
+        return f"^{fnmatch.translate(pattern)}"
+    return re.escape(pattern)
+
+
+def compile_patterns(patterns: Optional[List[str]]) -> List[Pattern]:
+    """
+    逐个编译过滤模式，能安全合并时合并为一个正则；没有模式时返回空列表
     
-    with open(env_file, 'r', encoding='utf-8') as f:
-        for line_num, line in enumerate(f, 1):
-            line = line.strip()
-            
-            # 跳过空行和注释
-            if not line or line.startswith('#'):
-                continue
-            
-            # 解析 KEY=VALUE
-            if '=' in line:
-                key, value = line.split('=', 1)
-                key = key.strip()
-                value = value.strip()
-                
-                # 移除引号
-                if value.startswith('"') and value.endswith('"'):
-                    value = value[1:-1]
-                elif value.startswith("'") and value.endswith("'"):
-                    value = value[1:-1]
-                
-                # 只添加非空值
-                if value:
-                    env_vars[key] = value
+    含捕获组（反向引用按编号指向自身的组）或全局内联标志（如 (?i)）的正则
+    合并后语义会改变，此时保留为多个正则逐个匹配。
+    """
+    compiled = []
+    for pattern in patterns or []:
+        if not pattern:
+            continue
+        try:
+            compiled.append(re.compile(_pattern_regex(pattern)))
+        except re.error as e:
+            raise Exception(f"无效的过滤模式 {pattern!r}: {e}")
+    if len(compiled) > 1 and all(c.groups == 0 and c.flags == re.UNICODE for c in compiled):
+        return [re.compile('|'.join(f"(?:{c.pattern})" for c in compiled))]
+    return compiled
+
+
+class SecretFilter:
+    """
+    预编译的 include/exclude 过滤器
+    
+    通常所有模式合并为一个正则，每个变量名只做一次（或两次）search，
+    过滤耗时随变量数量线性增长，与模式数量基本无关。
+    """
+    
+    def __init__(self, exclude_patterns: Optional[List[str]] = None,
+                 include_patterns: Optional[List[str]] = None):
+        self.exclude = compile_patterns(exclude_patterns)
+        self.include = compile_patterns(include_patterns)
     
-    return env_vars
+    def matches(self, key: str) -> bool:
+        """变量名是否应上传：命中 include（若设置）且未命中 exclude"""
+        if self.include and not any(p.search(key) for p in self.include):
+            return False
+        return not any(p.search(key) for p in self.exclude)
+    
+    def apply(self, env_vars: Dict[str, str]) -> Dict[str, str]:
+        """过滤变量，保持原有顺序"""
+        return {key: value for key, value in env_vars.items() if self.matches(key)}
 
 
-def filter_secrets(env_vars: Dict[str, str], exclude_patterns: List[str] = None) -> Dict[str, str]:
+def filter_secrets(env_vars: Dict[str, str], exclude_patterns: List[str] = None,
+                   include_patterns: List[str] = None) -> Dict[str, str]:
     """
     过滤需要上传的 secrets
     
     Args:
         env_vars: 所有环境变量
-        exclude_patterns: 要排除的模式列表
+        exclude_patterns: 要排除的模式列表（子串、glob 或 re:正则）
+        include_patterns: 只上传匹配的变量（为空时不限制）
         
     Returns:
         过滤后的 secrets
     """
-    if exclude_patterns is None:
-        exclude_patterns = []
-    
-    filtered = {}
-    
-    for key, value in env_vars.items():
-        # 检查是否匹配排除模式
-        should_exclude = False
-        for pattern in exclude_patterns:
-            if pattern in key:
-                should_exclude = True
-                break
-        
-        if not should_exclude:
-            filtered[key] = value
+    return SecretFilter(exclude_patterns, include_patterns).apply(env_vars)
+
+
+def parse_target_rules(include_rules: Optional[List[str]] = None,
+                       exclude_rules: Optional[List[str]] = None) -> Dict[str, Dict[str, List[str]]]:
+    """
+    解析按目标的过滤规则 TARGET=PATTERN[,PATTERN...]
     
-    return filtered
+    Returns:
+        {规范目标: {'include': [...], 'exclude': [...]}}
+    """
+    rules: Dict[str, Dict[str, List[str]]] = {}
+    for kind, entries in (('include', include_rules), ('exclude', exclude_rules)):
+        for entry in entries or []:
+            target, sep, patterns = entry.partition('=')
+            if not sep or not patterns:
+                raise Exception(f"无效的目标规则: {entry}（应为 TARGET=PATTERN[,PATTERN...]）")
+            rule = rules.setdefault(canonical_target(target.strip()), {'include': [], 'exclude': []})
+            rule[kind].extend(p.strip() for p in patterns.split(',') if p.strip())
+    return rules
 
 
 def print_banner():
@@ -223,13 +685,20 @@ def print_banner():
     """)
 
 
-def print_summary(total: int, success: int, failed: int):
-    """打印上传摘要"""
+def print_summary(total: int, success: int, failed: int, skipped: int = 0,
+                  targets: Optional[Dict[str, Tuple[int, int, int]]] = None):
+    """打印上传摘要；targets 为 {目标: (成功, 失败, 未变化)} 时先逐个目标列出"""
     print("\n" + "="*60)
     print("📊 上传摘要")
     print("="*60)
+    if targets:
+        for target, (target_success, target_failed, target_skipped) in targets.items():
+            print(f"  {target}: ✓ {target_success}  ⏭ {target_skipped}  ✗ {target_failed}")
+        print("-"*60)
     print(f"  总计: {total}")
     print(f"  ✓ 成功: {success}")
+    if skipped:
+        print(f"  ⏭ 未变化: {skipped}")
     print(f"  ✗ 失败: {failed}")
     print("="*60)
 
@@ -312,22 +781,39 @@ def check_gitignore(env_file: Path) -> bool:
     return False
 
 
-def upload_secrets(env_file: str, repo: str, token: str,
+def upload_secrets(env_file: str, repo: Optional[str], token: str,
                    exclude_patterns: List[str] = None,
                    interactive: bool = False,
-                   dry_run: bool = False):
+                   dry_run: bool = False,
+                   workers: int = GitHubSecretsUploader.DEFAULT_MAX_WORKERS,
+                   force: bool = False,
+                   manifest_path: Path = DEFAULT_MANIFEST,
+                   targets: Optional[List[str]] = None,
+                   include_patterns: List[str] = None,
+                   target_rules: Optional[Dict[str, Dict[str, List[str]]]] = None):
     """
-    执行 secrets 上传
+    执行 secrets 上传（.env 只解析一次，可扇出到多个目标）
 
     Args:
         env_file: .env 文件路径
-        repo: GitHub 仓库
+        repo: GitHub 仓库（可为 None，仅使用 targets）
         token: GitHub Token
         exclude_patterns: 排除模式列表
         interactive: 是否交互式确认
         dry_run: 仅测试，不实际上传
+        workers: 并发上传数
+        force: 忽略本地清单，上传全部 secrets
+        manifest_path: 已上传 secrets 清单路径
+        targets: 额外的上传目标（parse_target 格式），与 repo 一起上传
+        include_patterns: 只上传匹配的变量
+        target_rules: 按目标追加的过滤规则（见 parse_target_rules）
     """
     try:
+        # 按规范写法去重：owner/repo 与 repo:owner/repo 只上传一次
+        targets = list(dict.fromkeys(canonical_target(t) for t in ([repo] if repo else []) + list(targets or [])))
+        if not targets:
+            raise Exception("至少需要一个上传目标")
+
         env_path = Path(env_file)
 
         # Security check: verify .env is in .gitignore
@@ -345,8 +831,12 @@ def upload_secrets(env_file: str, repo: str, token: str,
         env_vars = parse_env_file(env_path)
         print(f"✓ 找到 {len(env_vars)} 个环境变量")
         
-        # 过滤 secrets
-        secrets = filter_secrets(env_vars, exclude_patterns)
+        # 过滤 secrets；有按目标规则的目标在全局结果上再过滤一次
+        secrets = filter_secrets(env_vars, exclude_patterns, include_patterns)
+        secrets_by_target = {}
+        for target, rule in (target_rules or {}).items():
+            secrets_by_target[target] = filter_secrets(secrets, rule['exclude'], rule['include'])
+            print(f"  {target}: 按目标规则保留 {len(secrets_by_target[target])}/{len(secrets)} 个")
         
         if not secrets:
             print("✗ 没有找到需要上传的 secrets")
@@ -359,7 +849,7 @@ def upload_secrets(env_file: str, repo: str, token: str,
         
         # 确认
         if interactive:
-            confirm = input(f"\n确认上传到 {repo}? (yes/no): ").strip().lower()
+            confirm = input(f"\n确认上传到 {', '.join(targets)}? (yes/no): ").strip().lower()
             if confirm not in ['yes', 'y']:
                 print("✗ 操作已取消")
                 sys.exit(0)
@@ -368,33 +858,57 @@ def upload_secrets(env_file: str, repo: str, token: str,
             print("\n🔍 Dry run 模式，不实际上传")
             return
         
-        # 初始化上传器
-        print(f"\n🔗 连接到 GitHub: {repo}")
-        uploader = GitHubSecretsUploader(repo, token)
-        
-        # 测试连接
-        if not uploader.test_connection():
-            sys.exit(1)
-        print("✓ 连接成功")
-        
-        # 上传 secrets
-        print(f"\n🚀 开始上传 secrets...\n")
-        success_count = 0
-        failed_count = 0
-        
-        for i, (key, value) in enumerate(secrets.items(), 1):
-            print(f"[{i}/{len(secrets)}] 上传 {key}...", end=" ")
+        # 初始化每个目标的上传器，并发测试连接、缓存公钥并计划上传
+        print(f"\n🔗 连接到 GitHub: {', '.join(targets)}")
+        uploaders = [GitHubSecretsUploader.from_target(t, token, max_workers=workers) for t in targets]
+        try:
+            manifest = SecretsManifest(manifest_path)
+            plans = prepare_targets(uploaders, secrets, manifest, force=force,
+                                    secrets_by_target=secrets_by_target)
+            if plans is None:
+                sys.exit(1)
+            print("✓ 连接成功")
             
-            if uploader.upload_secret(key, value):
-                print("✓")
-                success_count += 1
-            else:
-                failed_count += 1
+            skipped = sum(len(plan['skipped']) for plan in plans.values())
+            pending = sum(len(plan['pending']) for plan in plans.values())
+            if skipped:
+                print(f"⏭  跳过 {skipped} 个未变化的 secrets")
+            
+            # 所有目标的 secrets 共用一个线程池并发上传
+            if pending:
+                print(f"\n🚀 开始上传 {pending} 个 secrets 到 {len(targets)} 个目标 (并发 {workers})...\n")
+            done = []
+            fan_out = len(targets) > 1
+            
+            def report(result: Dict):
+                done.append(result)
+                label = f"{result['target']} {result['name']}" if fan_out else result['name']
+                if result['ok']:
+                    print(f"[{len(done)}/{pending}] {label} ✓")
+                else:
+                    print(f"[{len(done)}/{pending}] {label} ✗ 上传失败: {result['error']}")
+            
+            results = upload_to_targets(uploaders, plans, max_workers=workers, on_result=report)
+            record_uploads(uploaders, plans, results, manifest)
+        finally:
+            for uploader in uploaders:
+                uploader.close()
+        
+        per_target = {}
+        for target, target_results in results.items():
+            ok = sum(1 for r in target_results if r['ok'])
+            per_target[target] = (ok, len(target_results) - ok, len(plans[target]['skipped']))
+        success_count = sum(v[0] for v in per_target.values())
+        failed_count = sum(v[1] for v in per_target.values())
         
         # 打印摘要
-        print_summary(len(secrets), success_count, failed_count)
+        total = sum(len(secrets_by_target.get(u.target, secrets)) for u in uploaders)
+        print_summary(total, success_count, failed_count, skipped=skipped,
+                      targets=per_target if fan_out else None)
         
-        if failed_count == 0:
+        if not pending:
+            print("\n✓ 所有 secrets 均已是最新，无需上传")
+        elif failed_count == 0:
             print("\n🎉 所有 secrets 上传成功！")
         else:
             print(f"\n⚠️  {failed_count} 个 secrets 上传失败，请检查错误信息")
@@ -428,6 +942,13 @@ def main():
   
   # Dry run（测试模式）
   python secrets_uploader.py --env .env --repo owner/repo --token ghp_xxx --dry-run
+  
+  # 同一份 .env 扇出到多个仓库、Actions 环境和组织 secrets
+  python secrets_uploader.py --env .env --token-env --repo owner/repo \\
+      --target owner/other-repo --target env:owner/repo/production --target org:my-org:private
+  
+  # 忽略本地清单，强制重新上传全部
+  python secrets_uploader.py --env .env --repo owner/repo --token-env --force
         """
     )
     
@@ -442,6 +963,12 @@ def main():
         help='GitHub 仓库，格式：owner/repo'
     )
     
+    parser.add_argument(
+        '--target',
+        action='append',
+        help='额外的上传目标，可重复：owner/repo、env:owner/repo/ENV、org:ORG[:all|private|selected:ID,...]'
+    )
+    
     parser.add_argument(
         '--token',
         help='[DEPRECATED] GitHub Personal Access Token. Use --token-env instead.'
@@ -455,7 +982,27 @@ def main():
     
     parser.add_argument(
         '--exclude',
-        help='要排除的变量关键词，用逗号分隔（如：LOCAL,TEST）'
+        help='要排除的变量，用逗号分隔：关键词（子串匹配）、glob 或 re:正则（如：LOCAL,TEST_*,re:_DEV$）。'
+             '注意 glob 匹配整个变量名：DB_* 不再匹配 MY_DB_X，需要子串语义时写 *DB_*'
+    )
+    
+    parser.add_argument(
+        '--include',
+        help='只上传匹配的变量，格式同 --exclude（glob 同样匹配整个变量名）'
+    )
+    
+    parser.add_argument(
+        '--include-for',
+        action='append',
+        metavar='TARGET=PATTERNS',
+        help='按目标追加 include 规则，可重复（如：env:owner/repo/prod=PROD_*）'
+    )
+    
+    parser.add_argument(
+        '--exclude-for',
+        action='append',
+        metavar='TARGET=PATTERNS',
+        help='按目标追加 exclude 规则，可重复（如：org:my-org=re:^LOCAL_）'
     )
     
     parser.add_argument(
@@ -470,6 +1017,25 @@ def main():
         help='跳过确认，直接上传'
     )
     
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=GitHubSecretsUploader.DEFAULT_MAX_WORKERS,
+        help=f'并发上传数（默认：{GitHubSecretsUploader.DEFAULT_MAX_WORKERS}）'
+    )
+    
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='忽略本地清单，上传全部 secrets'
+    )
+    
+    parser.add_argument(
+        '--manifest',
+        default=str(DEFAULT_MANIFEST),
+        help='已上传 secrets 清单路径（默认：.cache/secrets/manifest.json）'
+    )
+    
     args = parser.parse_args()
     
     # 获取脚本所在目录，默认 .env 在上一级（项目根目录）
@@ -477,7 +1043,7 @@ def main():
     default_env = script_dir.parent / ".env"
     
     # 检查是否需要交互式模式
-    if not args.env and not args.repo and not args.token and not args.token_env:
+    if not args.env and not args.repo and not args.target and not args.token and not args.token_env:
         interactive_mode()
     else:
         # 命令行模式 — resolve token
@@ -496,13 +1062,24 @@ def main():
             print("WARNING: --token is deprecated. Use --token-env with GITHUB_TOKEN instead.")
             token = args.token
 
-        if not args.repo or not token:
-            print("✗ 错误: --repo 和认证（--token 或 --token-env）是必需的")
+        if not (args.repo or args.target) or not token:
+            print("✗ 错误: --repo/--target 和认证（--token 或 --token-env）是必需的")
             parser.print_help()
             sys.exit(1)
         
         env_file = args.env or str(default_env)
         exclude_patterns = [p.strip() for p in args.exclude.split(',')] if args.exclude else []
+        include_patterns = [p.strip() for p in args.include.split(',')] if args.include else []
+        try:
+            target_rules = parse_target_rules(args.include_for, args.exclude_for)
+            targets = [canonical_target(t) for t in ([args.repo] if args.repo else []) + (args.target or [])]
+        except Exception as e:
+            print(f"✗ 错误: {e}")
+            sys.exit(1)
+        unknown = set(target_rules) - set(targets)
+        if unknown:
+            print(f"✗ 错误: 目标规则引用了未指定的目标: {', '.join(sorted(unknown))}")
+            sys.exit(1)
         
         print_banner()
         upload_secrets(
@@ -511,7 +1088,13 @@ def main():
             token,
             exclude_patterns,
             interactive=not args.yes,
-            dry_run=args.dry_run
+            dry_run=args.dry_run,
+            workers=args.workers,
+            force=args.force,
+            manifest_path=Path(args.manifest),
+            targets=args.target,
+            include_patterns=include_patterns,
+            target_rules=target_rules
         )
 
 
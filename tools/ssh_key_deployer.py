@@ -7,25 +7,43 @@ AnixOps SSH Key Deployer
 功能：
 1. 支持 IPv4 和 IPv6 地址
 2. 交互式用户界面
-3. 使用 ssh-copy-id 或 scp + ssh 部署公钥
+3. 通过单个 Paramiko 连接部署公钥（--ssh-copy-id 时先尝试 sshpass + ssh-copy-id）
 4. 批量部署到多台服务器
 5. 支持从 .env 文件读取服务器列表
 
+6. 并发批量部署（可限制并发数、单主机超时，结果实时输出）
+7. 直接从 servers-config.yml 读取目标主机
+8. 批量密钥轮换（写入新公钥 -> 新密钥验证 -> 删除旧公钥，可断点续跑）
+9. 主机密钥按受管 known_hosts 严格校验（由 tools/known_hosts.py 采集）
+10. 同一主机的多步操作复用连接池中已认证的连接（tools/ssh_pool.py）
+
 使用方法：
     python tools/ssh_key_deployer.py
     python tools/ssh_key_deployer.py --key-file ~/.ssh/id_rsa.pub --host 203.0.113.10
+    python tools/ssh_key_deployer.py --key-file ~/.ssh/id_rsa.pub --from-config --parallel 20 --timeout 30
+    python tools/ssh_key_deployer.py --key-file ~/.ssh/id_rsa.pub --from-config --group web_servers --environment production
+    python tools/ssh_key_deployer.py --rotate --old-key ~/.ssh/id_old.pub --new-key ~/.ssh/id_new.pub --from-config
+    python tools/ssh_key_deployer.py --key-file ~/.ssh/id_rsa.pub --host 203.0.113.10 --accept-new-host-keys
     
 依赖：
     pip install paramiko scp
 """
 
 import argparse
+import atexit
 import getpass
+import hashlib
+import json
 import os
 import re
+import shutil
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Callable, Dict, List, Optional
 
 try:
     import paramiko
@@ -35,6 +53,31 @@ except ImportError:
     print("请运行: pip install paramiko scp")
     sys.exit(1)
 
+from env_file import load_env_file
+from generate_inventory import DEFAULT_CONFIG_FILE, atomic_output
+from known_hosts import (
+    DEFAULT_KNOWN_HOSTS,
+    KnownHosts,
+    describe_result,
+    hosts_from_config,
+    parse_host_port,
+    record_scan,
+    scan_hosts,
+)
+from ssh_pool import SSHPool, open_client
+
+
+# 批量部署默认并发数与单主机超时（秒）
+DEFAULT_PARALLELISM = 10
+DEFAULT_HOST_TIMEOUT = 30
+
+# 密钥轮换进度文件（项目根目录 .cache/ 下，按新公钥区分）
+ROTATE_STATE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "ssh-rotate"
+ROTATE_STATE_VERSION = 1
+
+# 受管 known_hosts（tools/known_hosts.py 生成），所有连接都按此文件严格校验主机密钥
+KNOWN_HOSTS_FILE = DEFAULT_KNOWN_HOSTS
+
 
 class Colors:
     """终端颜色代码"""
@@ -126,54 +169,165 @@ def read_public_key(key_file_path):
         return None
 
 
-def deploy_key_ssh_copy_id(host, username, password, key_file):
+def install_key_ssh_copy_id(host, port, username, password, key_file, timeout=None):
     """
-    使用 ssh-copy-id 部署公钥（推荐方式）
+    sshpass + ssh-copy-id 部署公钥（不输出）
+    
+    Returns:
+        None 表示成功，否则为错误描述
+    """
+    if not shutil.which('sshpass'):
+        return "未找到 sshpass 工具"
+    
+    cmd = [
+        'sshpass', '-p', password,
+        'ssh-copy-id',
+        '-i', key_file,
+        '-p', str(port),
+        '-o', 'StrictHostKeyChecking=yes',
+        '-o', f'UserKnownHostsFile={os.path.abspath(KNOWN_HOSTS_FILE)}',
+    ]
+    if timeout:
+        cmd += ['-o', f'ConnectTimeout={max(1, int(timeout))}']
+    cmd.append(f'{username}@{host}')
+    
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return f"ssh-copy-id 超时（{timeout:.0f}s）"
+    if result.returncode != 0:
+        return f"ssh-copy-id 失败: {result.stderr.strip()}"
+    return None
+
+
+def deploy_key_ssh_copy_id(host, username, password, key_file, port=22):
+    """
+    使用 ssh-copy-id 部署公钥（仅在 --ssh-copy-id 时使用）
     
     Args:
         host: 服务器地址
         username: SSH 用户名
         password: SSH 密码
         key_file: 公钥文件路径
+        port: SSH 端口
         
     Returns:
         bool: 是否成功
     """
     try:
-        # 检查是否安装了 sshpass
-        result = subprocess.run(['which', 'sshpass'], 
-                              capture_output=True, 
-                              text=True)
-        
-        if result.returncode != 0:
-            print(f"{Colors.WARNING}⚠️  未找到 sshpass 工具{Colors.ENDC}")
-            print(f"{Colors.OKBLUE}尝试使用备用方案...{Colors.ENDC}")
-            return False
-        
-        # 使用 sshpass + ssh-copy-id
-        cmd = [
-            'sshpass', '-p', password,
-            'ssh-copy-id',
-            '-i', key_file,
-            '-o', 'StrictHostKeyChecking=no',
-            '-o', 'UserKnownHostsFile=/dev/null',
-            f'{username}@{host}'
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        if result.returncode == 0:
+        error = install_key_ssh_copy_id(host, port, username, password, key_file)
+        if error is None:
             print(f"{Colors.OKGREEN}✓ 公钥部署成功（使用 ssh-copy-id）{Colors.ENDC}")
             return True
+        if not shutil.which('sshpass'):
+            print(f"{Colors.WARNING}⚠️  未找到 sshpass 工具{Colors.ENDC}")
+            print(f"{Colors.OKBLUE}尝试使用备用方案...{Colors.ENDC}")
         else:
-            print(f"{Colors.FAIL}❌ ssh-copy-id 失败: {result.stderr}{Colors.ENDC}")
-            return False
+            print(f"{Colors.FAIL}❌ {error}{Colors.ENDC}")
+        return False
             
     except Exception as e:
         print(f"{Colors.WARNING}⚠️  ssh-copy-id 方式失败: {e}{Colors.ENDC}")
         return False
 
 
+# 幂等的远程安装命令：公钥从 stdin 读入（不拼进命令行，避免注入），
+# 已存在则不重复添加；文件末尾缺少换行时先补换行再追加
+INSTALL_KEY_COMMAND = (
+    "sh -c '"
+    'umask 077; mkdir -p ~/.ssh && chmod 700 ~/.ssh'
+    ' && touch ~/.ssh/authorized_keys && chmod 600 ~/.ssh/authorized_keys'
+    ' && IFS= read -r key'
+    ' && if grep -qF -- "$key" ~/.ssh/authorized_keys; then echo present;'
+    ' else if [ -n "$(tail -c 1 ~/.ssh/authorized_keys)" ]; then echo >> ~/.ssh/authorized_keys; fi;'
+    ' printf "%s\\n" "$key" >> ~/.ssh/authorized_keys && echo added; fi'
+    "'"
+)
+
+
+def run_remote(ssh, command, stdin_data=None, timeout=None):
+    """
+    在已连接的 SSHClient 上执行一条命令
+    
+    Returns:
+        tuple: (退出码, stdout, stderr)
+    """
+    stdin, stdout, stderr = ssh.exec_command(command, timeout=timeout)
+    if stdin_data is not None:
+        stdin.write(stdin_data)
+        stdin.flush()
+    stdin.channel.shutdown_write()
+    out = stdout.read().decode('utf-8', 'replace')
+    err = stderr.read().decode('utf-8', 'replace')
+    return stdout.channel.recv_exit_status(), out, err
+
+
+# 删除旧公钥：新公钥必须已在文件中，否则拒绝修改（避免把自己锁在门外）
+REMOVE_KEY_COMMAND = (
+    "sh -c '"
+    'umask 077; f=~/.ssh/authorized_keys; IFS= read -r old; IFS= read -r new;'
+    ' grep -qF -- "$new" "$f" || { echo "new key not installed" >&2; exit 3; };'
+    ' if grep -qF -- "$old" "$f"; then'
+    ' grep -vF -- "$old" "$f" > "$f.rotate" && chmod 600 "$f.rotate" && mv "$f.rotate" "$f" && echo removed;'
+    ' else echo absent; fi'
+    "'"
+)
+
+
+def key_identity(public_key_content):
+    """公钥的身份部分（类型 + base64），忽略注释"""
+    return ' '.join(public_key_content.split()[:2])
+
+
+def connect_ssh(host, port, username, password=None, key_filename=None, timeout=10):
+    """
+    建立新的 SSH 连接（按 KNOWN_HOSTS_FILE 严格校验主机密钥），见 ssh_pool.open_client
+    
+    Returns:
+        paramiko.SSHClient
+    """
+    return open_client(host, port, username, password=password, key_filename=key_filename,
+                       timeout=timeout, known_hosts_file=KNOWN_HOSTS_FILE)
+
+
+# 进程内共享的连接池：同一主机、用户和凭据的后续操作复用已认证的连接
+POOL = SSHPool(connect_ssh)
+
+
+def install_public_key(ssh, public_key_content, timeout=None):
+    """在已有连接上幂等地写入公钥，返回 'added' 或 'present'"""
+    code, out, err = run_remote(ssh, INSTALL_KEY_COMMAND, public_key_content.strip() + '\n', timeout)
+    status = out.strip().splitlines()[-1] if out.strip() else ''
+    if code != 0 or status not in ('added', 'present'):
+        raise paramiko.SSHException(f"写入 authorized_keys 失败 (exit {code}): {err.strip() or out.strip()}")
+    return status
+
+
+def remove_public_key(ssh, old_public_key, new_public_key, timeout=None):
+    """在已有连接上删除旧公钥（要求新公钥已存在），返回 'removed' 或 'absent'"""
+    stdin_data = f"{key_identity(old_public_key)}\n{key_identity(new_public_key)}\n"
+    code, out, err = run_remote(ssh, REMOVE_KEY_COMMAND, stdin_data, timeout)
+    status = out.strip().splitlines()[-1] if out.strip() else ''
+    if code != 0 or status not in ('removed', 'absent'):
+        raise paramiko.SSHException(f"删除旧公钥失败 (exit {code}): {err.strip() or out.strip()}")
+    return status
+
+
+def install_key_paramiko(host, port, username, password, public_key_content, timeout=10):
+    """
+    使用 Paramiko 部署公钥（不输出）：从连接池借用连接（首次为一次 SSH 握手）+ 一条幂等命令，
+    不启动本地子进程，也不另开 SFTP 会话读取整个 authorized_keys
+    
+    Returns:
+        str: 'added' 新增公钥，'present' 公钥已存在
+        
+    Raises:
+        paramiko.AuthenticationException / paramiko.SSHException / OSError
+    """
+    with POOL.connection(host, port, username, password=password, timeout=timeout) as ssh:
+        return install_public_key(ssh, public_key_content, timeout)
+
+
 def deploy_key_paramiko(host, port, username, password, public_key_content):
     """
     使用 Paramiko 部署公钥（备用方式）
@@ -188,67 +342,14 @@ def deploy_key_paramiko(host, port, username, password, public_key_content):
     Returns:
         bool: 是否成功
     """
-    ssh = None
     try:
-        print(f"{Colors.OKBLUE}📡 正在连接到 {host}...{Colors.ENDC}")
-        
-        # 创建 SSH 客户端
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.WarningPolicy())
-        
-        # IPv6 地址需要去掉方括号（如果有）
-        connect_host = host.strip('[]')
+        print(f"{Colors.OKBLUE}📡 正在连接到 {host} 并写入公钥...{Colors.ENDC}")
+        status = install_key_paramiko(host, port, username, password, public_key_content)
         
-        # 连接
-        ssh.connect(
-            hostname=connect_host,
-            port=port,
-            username=username,
-            password=password,
-            timeout=10,
-            look_for_keys=False,
-            allow_agent=False
-        )
-        
-        print(f"{Colors.OKGREEN}✓ SSH 连接成功{Colors.ENDC}")
-        
-        # 确保 .ssh 目录存在
-        commands = [
-            'mkdir -p ~/.ssh',
-            'chmod 700 ~/.ssh',
-            'touch ~/.ssh/authorized_keys',
-            'chmod 600 ~/.ssh/authorized_keys'
-        ]
-        
-        for cmd in commands:
-            stdin, stdout, stderr = ssh.exec_command(cmd)
-            stdout.channel.recv_exit_status()  # 等待命令执行完成
-        
-        print(f"{Colors.OKBLUE}📝 正在写入公钥...{Colors.ENDC}")
-
-        # Use SFTP to safely write the public key without shell injection risk
-        sftp = ssh.open_sftp()
-
-        # Read existing authorized_keys if present
-        try:
-            with sftp.open('/root/.ssh/authorized_keys', 'r') as f:
-                existing_keys = f.read()
-        except IOError:
-            existing_keys = b''
-
-        # Check if key already exists
-        if public_key_content.encode() in existing_keys:
+        if status == 'present':
             print(f"{Colors.WARNING}⚠️  公钥已存在，跳过添加{Colors.ENDC}")
-            sftp.close()
-            return True
-
-        # Append the new public key
-        with sftp.open('/root/.ssh/authorized_keys', 'a') as f:
-            f.write(public_key_content + '\n')
-
-        sftp.close()
-
-        print(f"{Colors.OKGREEN}✓ 公钥部署成功{Colors.ENDC}")
+        else:
+            print(f"{Colors.OKGREEN}✓ 公钥部署成功{Colors.ENDC}")
         return True
         
     except paramiko.AuthenticationException:
@@ -260,9 +361,314 @@ def deploy_key_paramiko(host, port, username, password, public_key_content):
     except Exception as e:
         print(f"{Colors.FAIL}❌ 部署失败: {e}{Colors.ENDC}")
         return False
-    finally:
-        if ssh:
-            ssh.close()
+
+
+def deploy_key_to_host(target, username, password, public_key, key_file=None,
+                       timeout=DEFAULT_HOST_TIMEOUT, use_ssh_copy_id=False):
+    """
+    部署公钥到一台主机（不输出），总耗时受 timeout 限制
+    
+    默认只走单连接的 Paramiko 路径；use_ssh_copy_id=True 时先尝试 ssh-copy-id，
+    失败再回退到 Paramiko。
+    
+    Returns:
+        dict: {'name', 'host', 'port', 'ok', 'method', 'status', 'error', 'seconds'}
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    result = {'name': target.get('name') or target['host'], 'host': target['host'], 'port': target['port'],
+              'ok': False, 'method': None, 'status': None, 'error': None, 'seconds': 0.0}
+    
+    error = None
+    if use_ssh_copy_id and key_file and shutil.which('sshpass'):
+        error = install_key_ssh_copy_id(target['host'], target['port'], username, password, key_file,
+                                        timeout=timeout)
+        if error is None:
+            result.update(ok=True, method='ssh-copy-id', status='added')
+    
+    remaining = deadline - time.monotonic()
+    if not result['ok'] and remaining < 1:
+        result['error'] = error or f"超时（{timeout}s）"
+    elif not result['ok']:
+        try:
+            status = install_key_paramiko(target['host'], target['port'], username, password,
+                                          public_key, timeout=remaining)
+            result.update(ok=True, method='paramiko', status=status)
+        except paramiko.AuthenticationException:
+            result['error'] = "认证失败：用户名或密码错误"
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+    
+    result['seconds'] = time.monotonic() - start
+    return result
+
+
+def rollout_keys(targets, username, password, public_key, key_file=None,
+                 parallelism=DEFAULT_PARALLELISM, timeout=DEFAULT_HOST_TIMEOUT,
+                 on_result: Optional[Callable[[Dict], None]] = None,
+                 use_ssh_copy_id=False) -> List[Dict]:
+    """
+    并发部署公钥到多台主机
+    
+    Args:
+        targets: [{'name', 'host', 'port'}, ...]
+        parallelism: 同时进行的主机数上限
+        timeout: 单台主机的超时（秒）
+        on_result: 每完成一台主机时回调（按完成顺序，用于实时输出）
+        use_ssh_copy_id: 先尝试 ssh-copy-id（旧行为，每台主机多一个子进程和握手）
+        
+    Returns:
+        按 targets 顺序排列的结果列表
+    """
+    return run_parallel(targets, lambda target: deploy_key_to_host(
+        target, username, password, public_key, key_file, timeout, use_ssh_copy_id), parallelism, on_result)
+
+
+def run_parallel(targets, worker, parallelism=DEFAULT_PARALLELISM,
+                 on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """用线程池对每个目标执行 worker，完成即回调 on_result，返回按 targets 顺序排列的结果"""
+    if not targets:
+        return []
+    results = [None] * len(targets)
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(targets)))) as executor:
+        futures = {executor.submit(worker, target): idx for idx, target in enumerate(targets)}
+        for future in as_completed(futures):
+            result = results[futures[future]] = future.result()
+            if on_result:
+                on_result(result)
+    return results
+
+
+def progress_reporter(total, describe: Callable[[Dict], str]):
+    """返回实时输出 [k/n] ✓/✗ 行的回调；describe 给出成功时的说明"""
+    done = []
+    
+    def report(result):
+        done.append(result)
+        label = f"{result['name']} ({result['host']}:{result['port']})"
+        if result['ok']:
+            print(f"[{len(done)}/{total}] {Colors.OKGREEN}✓{Colors.ENDC} {label} "
+                  f"{describe(result)} {result['seconds']:.1f}s", flush=True)
+        else:
+            print(f"[{len(done)}/{total}] {Colors.FAIL}✗{Colors.ENDC} {label} "
+                  f"{result['error']} {result['seconds']:.1f}s", flush=True)
+    return report
+
+
+def run_rollout(targets, username, password, public_key, key_file=None,
+                parallelism=DEFAULT_PARALLELISM, timeout=DEFAULT_HOST_TIMEOUT, use_ssh_copy_id=False):
+    """并发部署并实时输出每台主机的结果与汇总，返回结果列表"""
+    print(f"\n{Colors.OKBLUE}🚀 开始批量部署 {len(targets)} 台服务器"
+          f"（并发 {parallelism}，单机超时 {timeout}s）...{Colors.ENDC}")
+    print_separator()
+    
+    report = progress_reporter(len(targets),
+                               lambda r: '已存在' if r['status'] == 'present' else r['method'])
+    results = rollout_keys(targets, username, password, public_key, key_file,
+                           parallelism=parallelism, timeout=timeout, on_result=report,
+                           use_ssh_copy_id=use_ssh_copy_id)
+    print_rollout_summary(results)
+    return results
+
+
+def print_rollout_summary(results):
+    """打印批量部署汇总"""
+    print(f"\n{Colors.OKBLUE}{Colors.BOLD}📊 部署结果汇总{Colors.ENDC}")
+    print_separator()
+    
+    success_count = sum(1 for r in results if r['ok'])
+    fail_count = len(results) - success_count
+    
+    for r in results:
+        status = f"{Colors.OKGREEN}✓{Colors.ENDC}" if r['ok'] else f"{Colors.FAIL}✗{Colors.ENDC}"
+        print(f"{status} {r['host']}:{r['port']}")
+    
+    print_separator()
+    print(f"成功: {Colors.OKGREEN}{success_count}{Colors.ENDC} | "
+          f"失败: {Colors.FAIL}{fail_count}{Colors.ENDC}")
+
+
+def ensure_host_keys(targets, assume_yes=False, parallelism=DEFAULT_PARALLELISM, timeout=DEFAULT_HOST_TIMEOUT):
+    """
+    为受管 known_hosts 中没有记录的主机采集主机密钥：显示指纹后一次性确认整批主机
+    （assume_yes=True 时直接信任，相当于 OpenSSH 的 accept-new）。
+    已记录但密钥变化的主机不会在这里被覆盖，需运行 tools/known_hosts.py --update。
+    
+    Returns:
+        int: 新记录的主机数
+    """
+    known = KnownHosts(KNOWN_HOSTS_FILE)
+    unknown = [t for t in targets if not known.lookup(t['host'], t['port'])]
+    if not unknown:
+        return 0
+    
+    print(f"\n{Colors.OKBLUE}🔑 {len(unknown)} 台主机不在 {KNOWN_HOSTS_FILE} 中，正在采集主机密钥...{Colors.ENDC}")
+    results = scan_hosts(unknown, known, parallelism=parallelism, timeout=timeout)
+    for result in results:
+        print(f"  {describe_result(result)}")
+    scanned = [r for r in results if r['ok']]
+    if not scanned:
+        return 0
+    
+    if not assume_yes:
+        confirm = input(f"\n信任以上 {len(scanned)} 台主机的密钥并写入 known_hosts？[y/N]: ").strip().lower()
+        if confirm not in ('y', 'yes'):
+            return 0
+    recorded = record_scan(known, scanned)
+    known.save()
+    print(f"{Colors.OKGREEN}✓ 已记录 {recorded} 台主机的主机密钥{Colors.ENDC}")
+    return recorded
+
+
+def rotate_state_path(new_public_key):
+    """按新公钥生成默认的轮换进度文件路径"""
+    digest = hashlib.sha256(key_identity(new_public_key).encode('utf-8')).hexdigest()[:16]
+    return ROTATE_STATE_DIR / f"{digest}.json"
+
+
+class RotationState:
+    """
+    密钥轮换进度（线程安全，每台主机每完成一步就原子写入一次）
+    
+    每台主机的步骤：pending -> pushed（新公钥已写入）-> verified（新密钥可登录）
+    -> done（旧公钥已删除）。中断后重新运行会从记录的步骤继续，done 的主机直接跳过。
+    """
+    
+    STEPS = ('pending', 'pushed', 'verified', 'done')
+    
+    def __init__(self, path, old_public_key, new_public_key):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.old_key = key_identity(old_public_key)
+        self.new_key = key_identity(new_public_key)
+        if self.old_key == self.new_key:
+            raise Exception("新旧公钥相同，无需轮换")
+        self.hosts: Dict[str, Dict] = {}
+        self.load()
+    
+    def load(self):
+        """读取已有进度；文件属于另一组密钥时拒绝继续"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != ROTATE_STATE_VERSION:
+            return
+        if (data.get('old_key'), data.get('new_key')) != (self.old_key, self.new_key):
+            raise Exception(f"进度文件 {self.path} 属于另一次密钥轮换，请指定其他 --state 路径")
+        self.hosts = data.get('hosts', {})
+    
+    def save(self):
+        """原子写入进度文件（调用方持有锁）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_output(str(self.path)) as f:
+            json.dump({'version': ROTATE_STATE_VERSION, 'old_key': self.old_key, 'new_key': self.new_key,
+                       'hosts': self.hosts}, f, indent=1, sort_keys=True)
+    
+    def step(self, name):
+        with self.lock:
+            return self.hosts.get(name, {}).get('step', 'pending')
+    
+    def update(self, target, step, error=None):
+        with self.lock:
+            self.hosts[target['name']] = {'host': target['host'], 'port': target['port'],
+                                          'step': step, 'error': error}
+            self.save()
+
+
+def rotate_key_on_host(target, username, state, old_public_key, new_public_key, new_key_file,
+                       password=None, old_key_file=None, timeout=DEFAULT_HOST_TIMEOUT):
+    """
+    在一台主机上轮换公钥（不输出）
+    
+    1. 用现有凭据（旧私钥或密码）写入新公钥
+    2. 只用新私钥重新登录验证
+    3. 在验证用的同一连接上删除旧公钥
+    
+    连接从 POOL 借用：写入新公钥的连接（旧凭据）与验证/删除用的连接（新私钥）按凭据区分，互不复用。
+    
+    Returns:
+        dict: {'name', 'host', 'port', 'ok', 'step', 'skipped', 'error', 'seconds'}
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    step = state.step(target['name'])
+    result = {'name': target['name'], 'host': target['host'], 'port': target['port'],
+              'ok': step == 'done', 'step': step, 'skipped': step == 'done', 'error': None, 'seconds': 0.0}
+    if step == 'done':
+        return result
+    
+    def remaining():
+        return max(1.0, deadline - time.monotonic())
+    
+    try:
+        if step == 'pending':
+            with POOL.connection(target['host'], target['port'], username, password=password,
+                                 key_filename=old_key_file, timeout=remaining()) as ssh:
+                install_public_key(ssh, new_public_key, remaining())
+            step = 'pushed'
+            state.update(target, step)
+        
+        # 验证必须是一次真正的新密钥登录，因此 pushed 状态下不复用池中的连接
+        with POOL.connection(target['host'], target['port'], username, key_filename=new_key_file,
+                             timeout=remaining(), fresh=step == 'pushed') as ssh:
+            if step == 'pushed':
+                code, _, err = run_remote(ssh, 'true', timeout=remaining())
+                if code != 0:
+                    raise paramiko.SSHException(f"新密钥登录验证失败: {err.strip()}")
+                step = 'verified'
+                state.update(target, step)
+            remove_public_key(ssh, old_public_key, new_public_key, remaining())
+            step = 'done'
+            state.update(target, step)
+        # 旧凭据已失效，池中用它认证的连接不能再被借出
+        POOL.discard(target['host'], target['port'], username, password=password, key_filename=old_key_file)
+        result['ok'] = True
+    except paramiko.AuthenticationException:
+        result['error'] = f"{step}: 认证失败" + ("（新密钥无法登录）" if step != 'pending' else "")
+    except Exception as e:
+        result['error'] = f"{step}: {type(e).__name__}: {e}" if str(e) else f"{step}: {type(e).__name__}"
+    if result['error']:
+        state.update(target, step, result['error'])
+    
+    result['step'] = step
+    result['seconds'] = time.monotonic() - start
+    return result
+
+
+def rotate_keys(targets, username, old_public_key, new_public_key, new_key_file, state,
+                password=None, old_key_file=None, parallelism=DEFAULT_PARALLELISM,
+                timeout=DEFAULT_HOST_TIMEOUT, on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """
+    并发轮换多台主机的公钥；进度写入 state，失败的主机可在下次运行时从断点继续
+    
+    Returns:
+        按 targets 顺序排列的结果列表
+    """
+    return run_parallel(targets, lambda target: rotate_key_on_host(
+        target, username, state, old_public_key, new_public_key, new_key_file,
+        password=password, old_key_file=old_key_file, timeout=timeout), parallelism, on_result)
+
+
+def run_rotation(targets, username, old_public_key, new_public_key, new_key_file, state,
+                 password=None, old_key_file=None, parallelism=DEFAULT_PARALLELISM,
+                 timeout=DEFAULT_HOST_TIMEOUT):
+    """并发轮换并实时输出结果与汇总，返回结果列表"""
+    print(f"\n{Colors.OKBLUE}🔄 开始轮换 {len(targets)} 台服务器的公钥"
+          f"（并发 {parallelism}，单机超时 {timeout}s）...{Colors.ENDC}")
+    print(f"{Colors.OKCYAN}进度文件: {state.path}{Colors.ENDC}")
+    print_separator()
+    
+    report = progress_reporter(len(targets), lambda r: '已完成（跳过）' if r['skipped'] else '已轮换')
+    results = rotate_keys(targets, username, old_public_key, new_public_key, new_key_file, state,
+                          password=password, old_key_file=old_key_file, parallelism=parallelism,
+                          timeout=timeout, on_result=report)
+    print_rollout_summary(results)
+    failed = [r for r in results if not r['ok']]
+    if failed:
+        print(f"{Colors.WARNING}⚠️  重新运行同一命令即可从断点继续（已完成的主机会被跳过）{Colors.ENDC}")
+    return results
 
 
 def deploy_to_single_host():
@@ -315,17 +721,14 @@ def deploy_to_single_host():
         print(f"{Colors.FAIL}❌ 密码不能为空{Colors.ENDC}")
         return False
     
-    # 3. 部署公钥
+    # 3. 确认主机密钥
+    ensure_host_keys([{'name': host, 'host': host, 'port': port}])
+    
+    # 4. 部署公钥
     print(f"\n{Colors.OKBLUE}🚀 开始部署公钥...{Colors.ENDC}")
     print_separator()
     
-    # 尝试 ssh-copy-id 方式
-    success = deploy_key_ssh_copy_id(host, username, password, key_file)
-    
-    # 如果失败，使用 Paramiko 方式
-    if not success:
-        print(f"{Colors.OKBLUE}🔄 使用备用方案（Paramiko）...{Colors.ENDC}")
-        success = deploy_key_paramiko(host, port, username, password, public_key)
+    success = deploy_key_paramiko(host, port, username, password, public_key)
     
     if success:
         print(f"\n{Colors.OKGREEN}{Colors.BOLD}✓ 成功！公钥已部署到服务器{Colors.ENDC}")
@@ -376,49 +779,15 @@ def deploy_to_multiple_hosts():
         print(f"{Colors.FAIL}❌ 密码不能为空{Colors.ENDC}")
         return False
     
-    # 4. 批量部署
-    print(f"\n{Colors.OKBLUE}🚀 开始批量部署...{Colors.ENDC}")
-    print_separator()
-    
-    results = []
-    for idx, host_str in enumerate(hosts, 1):
-        # 解析 host:port
-        if ':' in host_str and not '[' in host_str:  # 不是 IPv6
-            host, port_str = host_str.rsplit(':', 1)
-            try:
-                port = int(port_str)
-            except ValueError:
-                port = 22
-        else:
-            host = host_str
-            port = 22
-        
-        print(f"\n{Colors.OKBLUE}[{idx}/{len(hosts)}] 部署到 {host}:{port}{Colors.ENDC}")
-        
-        # 先尝试 ssh-copy-id
-        success = deploy_key_ssh_copy_id(host, username, password, key_file)
-        
-        # 失败则使用 Paramiko
-        if not success:
-            success = deploy_key_paramiko(host, port, username, password, public_key)
-        
-        results.append((host, port, success))
-    
-    # 5. 汇总结果
-    print(f"\n{Colors.OKBLUE}{Colors.BOLD}📊 部署结果汇总{Colors.ENDC}")
-    print_separator()
-    
-    success_count = sum(1 for _, _, s in results if s)
-    fail_count = len(results) - success_count
-    
-    for host, port, success in results:
-        status = f"{Colors.OKGREEN}✓{Colors.ENDC}" if success else f"{Colors.FAIL}✗{Colors.ENDC}"
-        print(f"{status} {host}:{port}")
-    
-    print_separator()
-    print(f"成功: {Colors.OKGREEN}{success_count}{Colors.ENDC} | "
-          f"失败: {Colors.FAIL}{fail_count}{Colors.ENDC}")
+    # 4. 并发批量部署
+    targets = []
+    for host_str in hosts:
+        host, port = parse_host_port(host_str)
+        targets.append({'name': host, 'host': host, 'port': port})
+    ensure_host_keys(targets)
+    results = run_rollout(targets, username, password, public_key, key_file)
     
+    success_count = sum(1 for r in results if r['ok'])
     return success_count > 0
 
 
@@ -430,19 +799,15 @@ def read_hosts_from_env():
         return []
     
     hosts = []
-    with open(env_file, 'r') as f:
-        for line in f:
-            line = line.strip()
-            # 查找 IP 变量
-            if '=' in line and not line.startswith('#'):
-                key, value = line.split('=', 1)
-                if '_V4' in key or '_V6' in key:
-                    # 去除 CIDR 后缀
-                    ip = value.split('/')[0]
-                    if ip:
-                        hosts.append(ip)
+    for key, value in load_env_file(env_file).items():
+        # 查找 IP 变量
+        if '_V4' in key or '_V6' in key:
+            # 去除 CIDR 后缀
+            ip = value.split('/')[0]
+            if ip:
+                hosts.append(ip)
     
-    return list(set(hosts))  # 去重
+    return list(dict.fromkeys(hosts))  # 去重并保持 .env 中的顺序
 
 
 def interactive_mode():
@@ -494,39 +859,64 @@ def interactive_mode():
                     print(f"{Colors.FAIL}❌ 密码不能为空{Colors.ENDC}")
                     continue
 
-                print(f"\n{Colors.OKBLUE}🚀 开始批量部署...{Colors.ENDC}")
-                print_separator()
-
-                results = []
-                for idx, host in enumerate(hosts, 1):
-                    port = 22
-                    print(f"\n{Colors.OKBLUE}[{idx}/{len(hosts)}] 部署到 {host}:{port}{Colors.ENDC}")
-
-                    success = deploy_key_ssh_copy_id(host, username, password, key_file)
-
-                    if not success:
-                        success = deploy_key_paramiko(host, port, username, password, public_key)
-
-                    results.append((host, port, success))
-
-                # 汇总结果
-                print(f"\n{Colors.OKBLUE}{Colors.BOLD}📊 部署结果汇总{Colors.ENDC}")
-                print_separator()
-
-                success_count = sum(1 for _, _, s in results if s)
-                fail_count = len(results) - success_count
-
-                for host, port, success in results:
-                    status = f"{Colors.OKGREEN}✓{Colors.ENDC}" if success else f"{Colors.FAIL}✗{Colors.ENDC}"
-                    print(f"{status} {host}:{port}")
-
-                print_separator()
-                print(f"成功: {Colors.OKGREEN}{success_count}{Colors.ENDC} | "
-                      f"失败: {Colors.FAIL}{fail_count}{Colors.ENDC}")
+                targets = [{'name': host, 'host': host, 'port': 22} for host in hosts]
+                ensure_host_keys(targets)
+                run_rollout(targets, username, password, public_key, key_file)
         else:
             print(f"{Colors.FAIL}❌ 无效的选择{Colors.ENDC}")
 
 
+def private_key_path(public_key_file):
+    """公钥文件对应的私钥路径"""
+    return public_key_file[:-4] if public_key_file.endswith('.pub') else public_key_file
+
+
+def run_rotate_command(args):
+    """--rotate 命令行入口，返回退出码"""
+    if not args.old_key or not args.new_key or not (args.from_config or args.host):
+        print(f"{Colors.FAIL}❌ --rotate 需要 --old-key、--new-key 以及 --from-config 或 --host{Colors.ENDC}")
+        return 1
+    old_public_key = read_public_key(args.old_key)
+    new_public_key = read_public_key(args.new_key)
+    if not old_public_key or not new_public_key:
+        return 1
+    new_key_file = private_key_path(args.new_key)
+    if not Path(new_key_file).exists():
+        print(f"{Colors.FAIL}❌ 新私钥不存在: {new_key_file}{Colors.ENDC}")
+        return 1
+    
+    if args.from_config:
+        targets, missing = hosts_from_config(args.from_config, server_environments=args.environment,
+                                             groups=args.group)
+        for name in missing:
+            print(f"{Colors.WARNING}⚠️  {name}: 未设置 IP 环境变量，跳过{Colors.ENDC}")
+    else:
+        targets = [{'name': args.host, 'host': args.host, 'port': args.port}]
+    if not targets:
+        print(f"{Colors.FAIL}❌ 没有可轮换的主机{Colors.ENDC}")
+        return 1
+    if args.accept_new_host_keys:
+        ensure_host_keys(targets, assume_yes=True, parallelism=args.parallel, timeout=args.timeout)
+    
+    try:
+        state = RotationState(args.state or rotate_state_path(new_public_key), old_public_key, new_public_key)
+    except Exception as e:
+        print(f"{Colors.FAIL}❌ {e}{Colors.ENDC}")
+        return 1
+    
+    password = None
+    old_key_file = None
+    if args.password:
+        password = getpass.getpass(f"SSH 密码（{args.user}，所有服务器）: ")
+    else:
+        old_key_file = private_key_path(args.old_key)
+    
+    results = run_rotation(targets, args.user, old_public_key, new_public_key, new_key_file, state,
+                           password=password, old_key_file=old_key_file,
+                           parallelism=args.parallel, timeout=args.timeout)
+    return 0 if all(r['ok'] for r in results) else 1
+
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(
@@ -536,11 +926,63 @@ def main():
     parser.add_argument('--host', help='服务器地址')
     parser.add_argument('--user', default='root', help='SSH 用户名')
     parser.add_argument('--port', type=int, default=22, help='SSH 端口')
+    parser.add_argument('--from-config', nargs='?', const=DEFAULT_CONFIG_FILE, metavar='PATH',
+                        help=f'从 servers-config.yml 读取目标主机（默认: {DEFAULT_CONFIG_FILE}）')
+    parser.add_argument('--group', action='append', help='只部署到这些组的主机，可重复')
+    parser.add_argument('--environment', action='append',
+                        help='只部署到这些 server_environment 的主机，可重复')
+    parser.add_argument('--parallel', type=int, default=DEFAULT_PARALLELISM,
+                        help=f'并发主机数（默认: {DEFAULT_PARALLELISM}）')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_HOST_TIMEOUT,
+                        help=f'单台主机超时秒数（默认: {DEFAULT_HOST_TIMEOUT}）')
+    parser.add_argument('--rotate', action='store_true',
+                        help='密钥轮换：写入 --new-key，用新密钥验证登录后删除 --old-key')
+    parser.add_argument('--old-key', help='轮换前的公钥文件（私钥为去掉 .pub 的同名文件）')
+    parser.add_argument('--new-key', help='轮换后的公钥文件（私钥为去掉 .pub 的同名文件）')
+    parser.add_argument('--state', help='轮换进度文件（默认: .cache/ssh-rotate/<新公钥指纹>.json）')
+    parser.add_argument('--password', action='store_true',
+                        help='轮换时用密码（而非旧私钥）登录写入新公钥')
+    parser.add_argument('--ssh-copy-id', action='store_true',
+                        help='先尝试 sshpass + ssh-copy-id，失败再用 Paramiko（默认只用单连接 Paramiko）')
+    parser.add_argument('--known-hosts', default=DEFAULT_KNOWN_HOSTS, metavar='PATH',
+                        help=f'受管 known_hosts 文件，主机密钥按此严格校验（默认: {DEFAULT_KNOWN_HOSTS}）')
+    parser.add_argument('--accept-new-host-keys', action='store_true',
+                        help='采集并信任 known_hosts 中尚未记录的主机（已变化的密钥仍会被拒绝）')
     
     args = parser.parse_args()
     
+    global KNOWN_HOSTS_FILE
+    KNOWN_HOSTS_FILE = args.known_hosts
+    atexit.register(POOL.close)
+    
     print_banner()
     
+    # 密钥轮换
+    if args.rotate:
+        sys.exit(run_rotate_command(args))
+    
+    # 从 servers-config.yml 并发批量部署
+    if args.key_file and args.from_config:
+        public_key = read_public_key(args.key_file)
+        if not public_key:
+            sys.exit(1)
+        
+        targets, missing = hosts_from_config(args.from_config, server_environments=args.environment,
+                                             groups=args.group)
+        for name in missing:
+            print(f"{Colors.WARNING}⚠️  {name}: 未设置 IP 环境变量，跳过{Colors.ENDC}")
+        if not targets:
+            print(f"{Colors.FAIL}❌ servers-config.yml 中没有可部署的主机{Colors.ENDC}")
+            sys.exit(1)
+        if args.accept_new_host_keys:
+            ensure_host_keys(targets, assume_yes=True, parallelism=args.parallel, timeout=args.timeout)
+        
+        password = getpass.getpass(f"SSH 密码（{args.user}，所有服务器）: ")
+        results = run_rollout(targets, args.user, password, public_key, args.key_file,
+                              parallelism=args.parallel, timeout=args.timeout,
+                              use_ssh_copy_id=args.ssh_copy_id)
+        sys.exit(0 if all(r['ok'] for r in results) else 1)
+    
     # 非交互模式
     if args.key_file and args.host:
         key_file = args.key_file
@@ -553,9 +995,13 @@ def main():
         if not public_key:
             sys.exit(1)
         
+        if args.accept_new_host_keys:
+            ensure_host_keys([{'name': args.host, 'host': args.host, 'port': args.port}], assume_yes=True)
+        
         password = getpass.getpass(f"SSH 密码 ({args.user}@{args.host}): ")
         
-        success = deploy_key_ssh_copy_id(args.host, args.user, password, key_file)
+        success = args.ssh_copy_id and deploy_key_ssh_copy_id(args.host, args.user, password, key_file,
+                                                              port=args.port)
         
         if not success:
             success = deploy_key_paramiko(args.host, args.port, args.user, password, public_key)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+SSH Pool - 可复用的 SSH 连接池
+Reusable pool of authenticated paramiko connections shared by the fleet tools
+
+连接按 (主机, 端口, 用户, 凭据) 复用：同一主机上的多步操作借用同一个已认证的
+transport，不再每一步都重新握手和认证。凭据（私钥路径或密码摘要）也是键的一部分，
+因此用不同凭据登录（如密钥轮换中的新旧密钥）永远不会拿到对方的连接。
+
+- 空闲连接启用 SSH keepalive，超过 idle_timeout 未使用的连接在下次借用/归还时关闭
+  （不启动后台线程）；每个键最多保留 max_idle 个空闲连接
+- 借用期间抛出异常的连接直接关闭，不放回池中；失效的 transport 借用时自动丢弃
+- 所有新连接都按受管 known_hosts 严格校验主机密钥（见 known_hosts.py）
+
+使用方法 | Usage:
+    from ssh_pool import SSHPool
+
+    with SSHPool() as pool:
+        with pool.connection('203.0.113.10', 22, 'root', key_filename='~/.ssh/id_ed25519') as ssh:
+            ssh.exec_command('uptime')
+"""
+
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import paramiko
+
+from known_hosts import DEFAULT_KNOWN_HOSTS, pin_host_key
+
+
+DEFAULT_IDLE_TIMEOUT = 60   # 与 ansible.cfg 的 ControlPersist=60s 一致
+DEFAULT_KEEPALIVE = 15
+DEFAULT_MAX_IDLE = 2
+
+PoolKey = Tuple[str, int, str, Optional[str], Optional[str]]
+
+
+def open_client(host, port, username, password=None, key_filename=None, timeout=10,
+                known_hosts_file=DEFAULT_KNOWN_HOSTS) -> paramiko.SSHClient:
+    """
+    建立 SSH 连接：只使用给定的密码或私钥，不尝试 agent 与默认密钥；
+    主机密钥必须与受管 known_hosts 中的记录一致（RejectPolicy）
+
+    Raises:
+        paramiko.SSHException: 主机未记录在 known_hosts 中
+        paramiko.BadHostKeyException: 主机密钥与记录不符
+    """
+    ssh = paramiko.SSHClient()
+    pin_host_key(ssh, host, port, known_hosts_file)
+    try:
+        # IPv6 地址需要去掉方括号（如果有）
+        ssh.connect(
+            hostname=host.strip('[]'),
+            port=port,
+            username=username,
+            password=password,
+            key_filename=key_filename,
+            timeout=timeout,
+            banner_timeout=timeout,
+            auth_timeout=timeout,
+            look_for_keys=False,
+            allow_agent=False
+        )
+    except Exception:
+        ssh.close()
+        raise
+    return ssh
+
+
+def is_alive(ssh: paramiko.SSHClient) -> bool:
+    transport = ssh.get_transport()
+    return transport is not None and transport.is_active()
+
+
+class SSHPool:
+    """线程安全的 SSH 连接池；connect 默认为 open_client，签名相同的函数均可替换"""
+
+    def __init__(self, connect: Optional[Callable[..., paramiko.SSHClient]] = None,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, keepalive=DEFAULT_KEEPALIVE, max_idle=DEFAULT_MAX_IDLE):
+        self.connect = connect or open_client
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.idle: Dict[PoolKey, List[Tuple[paramiko.SSHClient, float]]] = {}
+        self.borrowed: Dict[int, PoolKey] = {}
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def pool_key(host, port, username, password=None, key_filename=None) -> PoolKey:
+        """连接键；密码只以摘要形式出现在键中"""
+        secret = hashlib.sha256(password.encode('utf-8')).hexdigest() if password is not None else None
+        key_path = os.path.abspath(os.path.expanduser(key_filename)) if key_filename else None
+        return (host.strip('[]'), int(port), username, key_path, secret)
+
+    def _evict_locked(self, now) -> List[paramiko.SSHClient]:
+        """摘出超时的空闲连接（调用方持有锁，并在锁外关闭返回的连接）"""
+        expired = []
+        for key in list(self.idle):
+            keep = []
+            for ssh, last_used in self.idle[key]:
+                (expired if now - last_used > self.idle_timeout else keep).append((ssh, last_used))
+            if keep:
+                self.idle[key] = keep
+            else:
+                del self.idle[key]
+        return [ssh for ssh, _ in expired]
+
+    def acquire(self, host, port, username, password=None, key_filename=None, timeout=10,
+                fresh=False) -> paramiko.SSHClient:
+        """
+        借出一个连接：优先复用同键的空闲连接，否则新建
+
+        Args:
+            fresh: 跳过空闲连接，强制重新握手认证（用于验证凭据本身是否可用）
+        """
+        key = self.pool_key(host, port, username, password, key_filename)
+        ssh = None
+        with self.lock:
+            stale = self._evict_locked(time.monotonic())
+            idle = self.idle.get(key, [])
+            while idle and not fresh:
+                candidate, _ = idle.pop()
+                if is_alive(candidate):
+                    ssh = candidate
+                    self.reused += 1
+                    break
+                stale.append(candidate)
+        for client in stale:
+            client.close()
+
+        if ssh is None:
+            ssh = self.connect(host, port, username, password=password, key_filename=key_filename,
+                               timeout=timeout)
+            if self.keepalive:
+                ssh.get_transport().set_keepalive(self.keepalive)
+            with self.lock:
+                self.created += 1
+        with self.lock:
+            self.borrowed[id(ssh)] = key
+        return ssh
+
+    def release(self, ssh: paramiko.SSHClient, discard=False):
+        """归还连接；discard=True、连接已失效或该键空闲连接已满时直接关闭"""
+        with self.lock:
+            key = self.borrowed.pop(id(ssh), None)
+            stale = self._evict_locked(time.monotonic())
+            idle = self.idle.setdefault(key, []) if key is not None else None
+            if discard or idle is None or len(idle) >= self.max_idle or not is_alive(ssh):
+                stale.append(ssh)
+            else:
+                idle.append((ssh, time.monotonic()))
+        for client in stale:
+            client.close()
+
+    @contextmanager
+    def connection(self, host, port, username, password=None, key_filename=None, timeout=10, fresh=False):
+        """借用连接的上下文管理器；块内抛出异常时连接被关闭而不是放回池中"""
+        ssh = self.acquire(host, port, username, password=password, key_filename=key_filename,
+                           timeout=timeout, fresh=fresh)
+        try:
+            yield ssh
+        except BaseException:
+            self.release(ssh, discard=True)
+            raise
+        self.release(ssh)
+
+    def discard(self, host, port, username, password=None, key_filename=None):
+        """关闭某个键的全部空闲连接（凭据被吊销后调用，例如轮换删除旧公钥之后）"""
+        key = self.pool_key(host, port, username, password, key_filename)
+        with self.lock:
+            clients = [ssh for ssh, _ in self.idle.pop(key, [])]
+        for ssh in clients:
+            ssh.close()
+
+    def idle_count(self) -> int:
+        with self.lock:
+            return sum(len(idle) for idle in self.idle.values())
+
+    def close(self):
+        """关闭所有空闲连接（借出中的连接在归还时照常处理）"""
+        with self.lock:
+            clients = [ssh for idle in self.idle.values() for ssh, _ in idle]
+            self.idle.clear()
+        for ssh in clients:
+            ssh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()